@@ -6,9 +6,37 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 from datetime import datetime, timedelta
+import functools
 import os
-import pycountry
+
+import columnar_store
+import compact_schema
+import dataset_registry
+import downsample
+import export
+import extremes
+import filter_index
+import instrument
+import iso_lookup
+import quantile_sketch
+import rollups
+import shared_dataset
+import spatial_grid
+import query_backend
+import stats_service
+import time_series
+import timestamps
+import weather_schema
+
+# Frames derived from the shared, cached dataset (filters, df_f / df_plot) share memory until written to
+pd.set_option("mode.copy_on_write", True)
+
+# Stage timings for this rerun: one JSON line per rerun when $CLIMATESCOPE_TIMING_LOG is set, and a sidebar
+# panel with ?debug=1 (or $CLIMATESCOPE_DEBUG)
+instrument.configure_logging()
+timings = instrument.start("app")
 
 # ----------------------------------
 # 🌦️ Page Configuration
@@ -132,338 +160,812 @@ air quality, and extreme weather patterns with professional data storytelling.
 # ----------------------------------
 # 📂 Load Data
 # ----------------------------------
-@st.cache_data
-def load_data():
-    for f in ["processed/cleaned_weather.csv", "cleaned_weather.csv", "data/cleaned_weather.csv"]:
+CSV_PATHS = ["processed/cleaned_weather.csv", "cleaned_weather.csv", "data/cleaned_weather.csv"]
+# Replaced by data_preparation.py after all of its outputs are written: its modification time
+# identifies a dataset version, never a mix of two prep runs
+PREP_OUTPUTS = [dataset_registry.READY_PATH]
+
+
+def find_csv():
+    for f in CSV_PATHS:
         if os.path.exists(f):
-            return pd.read_csv(f)
+            return f
     return None
 
-df = load_data()
-if df is None:
-    uploaded = st.file_uploader("Upload cleaned_weather.csv", type=["csv"])
-    if uploaded:
-        df = pd.read_csv(uploaded)
+
+def load_data(columns=None, csv_path=None, store=columnar_store.STORE_PATH):
+    if csv_path is None:
+        return columnar_store.read_store(store, columns=columns)
+    # The store is already compact; CSV rows get the same float32 / int16 / categorical dtypes
+    return compact_schema.compact(pd.read_csv(csv_path), drop_derived=False)
+
+
+def load_dataset(fingerprint):
+    """One dataset version: its source, column list, key for the caches, rollup cube and ISO-3 table."""
+    # The partitioned Parquet store (written by data_preparation.py) is preferred over CSV; each prep run
+    # writes its own store directory and names it in the ready marker
+    store = (dataset_registry.read_ready() or {}).get("store") or columnar_store.STORE_PATH
+    manifest = columnar_store.read_manifest(store) if columnar_store.available() else None
+    csv_path = None if manifest is not None else find_csv()
+    if manifest is not None:
+        columns = manifest["columns"]
+        # The manifest is rewritten by every prep run, so its mtime tells two runs over the same range apart
+        version = (manifest["rows"], tuple(manifest["time_range"] or ()),
+                   os.path.getmtime(os.path.join(store, columnar_store.MANIFEST_NAME)))
+    elif csv_path:
+        columns = pd.read_csv(csv_path, nrows=0).columns.tolist()
+        version = (csv_path, os.path.getmtime(csv_path))
     else:
-        st.stop()
+        columns = version = None
+    return {"manifest": manifest, "store": store, "csv": csv_path, "columns": columns, "version": version,
+            "cube": rollups.load_cube(rollups.ROLLUP_DIR) if columnar_store.available() else None,
+            # Country -> ISO-3 table resolved by data_preparation.py (empty when prep has not run)
+            "iso": iso_lookup.load_lookup(iso_lookup.LOOKUP_PATH)}
 
-# ----------------------------------
-# 🧩 Data Preparation
-# ----------------------------------
-# Keep original parsing attempts, but handle safely
-if "last_updated" in df.columns:
-    df["last_updated"] = pd.to_datetime(df["last_updated"], errors="coerce")
-elif "date" in df.columns:
-    df["last_updated"] = pd.to_datetime(df["date"], errors="coerce")
-else:
-    df["last_updated"] = pd.to_datetime(datetime.now())
-
-def find_col(df, keywords):
-    for key in keywords:
-        for c in df.columns:
-            if key.lower() in c.lower():
-                return c
-    return None
 
-col_temp = find_col(df, ["temperature", "temp"])
-col_hum = find_col(df, ["humidity"])
-col_wind = find_col(df, ["wind"])
-col_precip = find_col(df, ["precip"])
-col_pressure = find_col(df, ["pressure"])
-col_country = find_col(df, ["country"])
-col_condition = find_col(df, ["condition"])
-col_aqi = find_col(df, ["air_quality", "aqi", "pm2.5", "us-epa"])
-col_uv = find_col(df, ["uv", "uv_index"])
-col_cloud = find_col(df, ["cloud", "cloudcover"])
+@st.cache_resource
+def get_stats_service():
+    # One LRU of describe/correlation moments shared by all sessions
+    return stats_service.StatsService()
 
-# ----------------------------------
-# 🎛️ Sidebar Filters
-# ----------------------------------
-st.sidebar.header("🌍 Filters")
-countries = sorted(df[col_country].dropna().unique()) if col_country else []
-selected_countries = st.sidebar.multiselect("Select Countries", countries, default=countries[:5] if countries else [])
-min_date = df["last_updated"].min().date()
-max_date = df["last_updated"].max().date()
-start_date, end_date = st.sidebar.slider("Date Range", min_value=min_date, max_value=max_date,
-                                         value=(min_date, max_date))
-start_ts, end_ts = pd.to_datetime(start_date), pd.to_datetime(end_date) + pd.Timedelta(days=1)
-mask = (df["last_updated"] >= start_ts) & (df["last_updated"] <= end_ts)
-if selected_countries and col_country:
-    mask &= df[col_country].isin(selected_countries)
-df_f = df[mask].copy()
-
-# =========================
-# Fix pyarrow / streamlit serialization:
-# - Streamlit's dataframe serialization to Arrow sometimes fails with datetime objects.
-# - Keep a string version of 'last_updated' for display (df_f_str) and a datetime column for plotting (df_plot).
-# =========================
-df_f = df_f.reset_index(drop=True)
-df_plot = df_f.copy()
-# ensure datetime for plotting
-df_plot["last_updated_dt"] = pd.to_datetime(df_plot["last_updated"], errors="coerce")
-# string version for Streamlit dataframes / download
-df_f["last_updated"] = df_f["last_updated"].dt.strftime("%Y-%m-%d %H:%M:%S")
-
-map_type = st.sidebar.radio("Map Type", ["🌎 Global Temperature View", "🌡 Localized Bubble Map"])
 
-# ----------------------------------
-# 🧭 Tabs Navigation
-# ----------------------------------
-tabs = st.tabs([
-    "🏠 Overview",
-    "🌍 Map Visualization",
-    "☁️ Air Quality Index",
-    "⚠️ Extreme Events",
-    "🌡️ Climate Parameter Analysis",
-    "📋 Summary"
-])
+@st.cache_resource
+def trend_engines():
+    # One engine per metric shared by all sessions; a new dataset version only feeds it the changed months
+    return {}
+
 
 # ----------------------------------
-# 🏠 Overview
+# 🧩 Data Preparation
 # ----------------------------------
-with tabs[0]:
-    st.markdown("<div class='feature-box'>🏠 Global Weather Overview</div>", unsafe_allow_html=True)
-    c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Records", f"{len(df_f):,}")
-    c2.metric("Avg Temp (°C)", f"{df_plot[col_temp].mean():.2f}" if col_temp else "N/A")
-    c3.metric("Avg Humidity (%)", f"{df_plot[col_hum].mean():.2f}" if col_hum else "N/A")
-    c4.metric("Avg Wind (kph)", f"{df_plot[col_wind].mean():.2f}" if col_wind else "N/A")
-
-    st.markdown("<h3>📆 Data Collected Over Time</h3>", unsafe_allow_html=True)
-    if "last_updated_dt" in df_plot.columns:
-        fig_timeline = px.histogram(df_plot.dropna(subset=["last_updated_dt"]), x="last_updated_dt", nbins=50,
-                                    color_discrete_sequence=["#283593"], template="plotly_white")
+def prepare_dates(df):
+    # The store already holds native timestamps; CSV text is parsed once per dataset, by format
+    times = timestamps.resolve(df)
+    df["last_updated"] = times if times is not None else pd.Timestamp(datetime.now())
+    return df
+
+
+@st.cache_resource(max_entries=2)
+def load_index(columns, country_col, version, csv_path=None, store=columnar_store.STORE_PATH):
+    # Sorted by (country, last_updated) for binary-search filtering, once per host: the sorted frame
+    # is memory-mapped from processed/_shared, so every session and server process reads the same pages
+    key = shared_dataset.dataset_key(version, columns, country_col)
+    with instrument.stage("shared.open"):
+        frame = shared_dataset.open_shared(key)
+    if frame is None:
+        with instrument.stage("load_data") as info:
+            df = load_data(columns, csv_path, store)
+            info["rows"] = len(df)
+        with instrument.stage("prepare_dates", rows=len(df)):
+            df = prepare_dates(df)
+        with instrument.stage("index.sort", rows=len(df)):
+            index = filter_index.SortedFrameIndex(df, "last_updated", country_col)
+        with instrument.stage("shared.write", rows=len(df)):
+            frame = shared_dataset.share(index.frame, key)
+    with instrument.stage("index.open", rows=len(frame)):
+        return filter_index.SortedFrameIndex(frame, "last_updated", country_col, presorted=True)
+
+
+@st.cache_resource(max_entries=2)
+def load_store_backend(name, columns, country_col, version, store=columnar_store.STORE_PATH):
+    # DuckDB / Polars over the Parquet store: nothing is loaded, queries run in the engine
+    with instrument.stage("backend.open"):
+        return query_backend.open_store_backend(name, store, list(columns), country_col)
+
+
+@st.cache_resource(max_entries=2)
+def index_upload(_df, file_id, country_col):
+    with instrument.stage("index.upload", rows=len(_df)):
+        df = compact_schema.compact(_df, drop_derived=False)
+        return filter_index.SortedFrameIndex(prepare_dates(df), "last_updated", country_col)
+
+
+def dashboard_columns_of(columns):
+    # Only the columns the dashboard reads are pulled from the columnar store
+    c = weather_schema.detect_columns(columns)
+    return tuple(dict.fromkeys(col for col in [
+        c["country"], "location_name", "latitude", "longitude", "last_updated", "date",
+        c["temp"], c["hum"], c["wind"], c["precip"], c["pressure"], c["condition"], c["aqi"], c["uv"], c["cloud"]
+    ] if col))
+
+
+def serve_dataset(dataset, columns, country_col):
+    """(index, backend) of a prepped dataset version."""
+    # Stores too large to load (or CLIMATESCOPE_QUERY_BACKEND=duckdb|polars) are queried in place;
+    # otherwise the store and the CSV are mapped from the shared copy (pages are only read as filters
+    # touch them).
+    manifest, version = dataset["manifest"], dataset["version"]
+    name = query_backend.choose(rows=manifest["rows"]) if manifest is not None else "pandas"
+    if name != "pandas":
+        return None, load_store_backend(name, columns, country_col, version, dataset["store"])
+    index = load_index(columns if manifest is not None else None, country_col, version, dataset["csv"],
+                       dataset["store"])
+    return index, query_backend.PandasBackend(index, get_stats_service(), version)
+
+
+def warm_dataset(dataset):
+    # On the refresh thread, before the swap: the first rerun on a new version finds its index (or store
+    # backend) and the trend engines ready
+    if dataset["columns"] is None:
+        return
+    with instrument.stage("dataset.warm"):
+        serve_dataset(dataset, dashboard_columns_of(dataset["columns"]),
+                      weather_schema.detect_columns(dataset["columns"])["country"])
+        if dataset["cube"] is not None:
+            for metric, engine in list(trend_engines().items()):
+                if metric in dataset["cube"]["metrics"]:
+                    engine.update(time_series.month_cells(dataset["cube"], metric), dataset["seq"])
+
+
+def retire_dataset(dataset):
+    # The last rerun on a replaced version has finished: its cached statistics and its store directory can go
+    get_stats_service().drop_version(dataset["version"])
+    columnar_store.drop_version(dataset["store"], current=(dataset_registry.read_ready() or {}).get("store"))
+
+
+@st.cache_resource
+def get_registry():
+    # One per server process: its thread loads and warms new prep outputs, then switches every session over
+    fingerprint = functools.partial(dataset_registry.file_fingerprint, PREP_OUTPUTS)
+    return dataset_registry.Registry(fingerprint, load_dataset, warm_dataset, retire_dataset).start()
+
+
+# Every rerun serves the version current when it started, even if a newer one is swapped in meanwhile
+registry = get_registry()
+# The lease is released however the rerun ends: finished, stopped (st.stop, a rerun request) or failed in a tab
+with registry.leased() as dataset:
+    manifest, store_path = dataset["manifest"], dataset["store"]
+    uploaded = None
+    if dataset["columns"] is not None:
+        all_columns = dataset["columns"]
     else:
-        fig_timeline = px.histogram(df_plot, x="last_updated", nbins=50,
-                                    color_discrete_sequence=["#283593"], template="plotly_white")
-    st.plotly_chart(fig_timeline, use_container_width=True)
-    st.markdown("""
-    <div class="plot-desc">
-    This plot shows how the dataset has grown across time for selected regions.  
-    Higher bars indicate days with more recorded observations.
-    </div>
-    """, unsafe_allow_html=True)
+        uploaded = st.file_uploader("Upload cleaned_weather.csv", type=["csv"])
+        if not uploaded:
+            st.stop()
+        df_upload = pd.read_csv(uploaded)
+        all_columns = df_upload.columns.tolist()
+    from_upload = uploaded is not None
+    # Identifies the loaded dataset in cache keys (stats service, exports)
+    dataset_version = uploaded.file_id if from_upload else dataset["version"]
+
+    cols = weather_schema.detect_columns(all_columns)
+    col_temp = cols["temp"]
+    col_hum = cols["hum"]
+    col_wind = cols["wind"]
+    col_precip = cols["precip"]
+    col_pressure = cols["pressure"]
+    col_country = cols["country"]
+    col_condition = cols["condition"]
+    col_aqi = cols["aqi"]
+    col_uv = cols["uv"]
+    col_cloud = cols["cloud"]
+
+    dashboard_columns = dashboard_columns_of(all_columns)
+
+    # Uploads belong to one session and are indexed in-process
+    if from_upload:
+        index = index_upload(df_upload, uploaded.file_id, col_country)
+        backend = query_backend.PandasBackend(index, get_stats_service(), dataset_version)
+    else:
+        index, backend = serve_dataset(dataset, dashboard_columns, col_country)
+
+
+    # ----------------------------------
+    # 🎛️ Sidebar Filters
+    # ----------------------------------
+    st.sidebar.header("🌍 Filters")
+    countries = backend.countries() if col_country else []
+    if manifest is not None and manifest["time_range"]:
+        # Slider bounds from the manifest, without a pass over the mapped timestamps on every rerun
+        min_date = pd.Timestamp(manifest["time_range"][0]).date()
+        max_date = pd.Timestamp(manifest["time_range"][1]).date()
+    else:
+        min_date, max_date = (t.date() for t in backend.time_range())
+    selected_countries = st.sidebar.multiselect("Select Countries", countries, default=countries[:5] if countries else [])
+    start_date, end_date = st.sidebar.slider("Date Range", min_value=min_date, max_value=max_date,
+                                             value=(min_date, max_date))
+    start_ts, end_ts = pd.to_datetime(start_date), pd.to_datetime(end_date) + pd.Timedelta(days=1)
 
-# ----------------------------------
-# 🌍 Map Visualization
-# ----------------------------------
+    # Everything below is built on first use: the filtered rows, the cube cells and each figure are only
+    # computed by the tab that is open, and figures are cached per (figure id, the inputs their builder reads).
+    filter_countries = selected_countries if col_country else None
+    # The selection (dates and countries): the key of every view built from the selected rows or cube cells
+    data_key = (dataset_version, start_date, end_date, tuple(selected_countries))
 
-with tabs[1]:
-    st.markdown("<div class='feature-box'>🌍 Global Weather Map</div>", unsafe_allow_html=True)
 
-    # Convert country names to ISO-3 codes safely (for robust choropleth)
-    def to_iso3(name):
-        try:
-            return pycountry.countries.lookup(name).alpha_3
-        except Exception:
-            return None
-
-    if col_country in df_f.columns:
-        df_plot["iso_code"] = df_plot[col_country].apply(lambda x: to_iso3(x) if pd.notna(x) else None)
-
-    if map_type == "🌡 Localized Bubble Map" and "latitude" in df_plot.columns and "longitude" in df_plot.columns and col_temp in df_plot.columns:
-        df_map = df_plot.dropna(subset=["latitude", "longitude", col_temp])
-        if not df_map.empty:
-            df_map["size_norm"] = (df_map[col_temp] - df_map[col_temp].min()) + 1
-            # ✅ New API: scatter_map replaces scatter_mapbox
-            fig_map = px.scatter_map(
-                df_map,
-                lat="latitude",
-                lon="longitude",
-                color=col_temp,
-                size="size_norm",
-                color_continuous_scale="Inferno",
-                hover_name=col_country,
-                zoom=1
-            )
-            fig_map.update_layout(map=dict(style="carto-darkmatter"), margin={"r":0, "t":0, "l":0, "b":0})
-            st.plotly_chart(fig_map, use_container_width=True)
-        else:
-            st.info("No geolocation data available for the selected filters to render the localized bubble map.")
-    else:
-        # For choropleth use ISO3 codes to avoid future location-name deprecation issues
-        if "iso_code" in df_plot.columns and col_temp in df_plot.columns:
-            df_avg = df_plot.dropna(subset=["iso_code", col_temp]).groupby(["iso_code", col_country], as_index=False)[col_temp].mean()
-            if not df_avg.empty:
-                fig_choro = px.choropleth(
-                    df_avg, locations="iso_code", color=col_temp, hover_name=col_country,
-                    color_continuous_scale="Inferno"
-                )
-                fig_choro.update_layout(geo_showframe=False, geo_showcoastlines=True, geo_projection_type="natural earth")
-                st.plotly_chart(fig_choro, use_container_width=True)
-            else:
-                st.info("No country-level temperature data available for the selected filters to render the choropleth.")
-        else:
-            st.info("Country / temperature columns not available for choropleth. Ensure your dataset has country and temperature columns.")
+    @functools.cache
+    def full_backend():
+        # The index and the engines hold only the dashboard's columns; the summary and the export read every
+        # column of the selection, with the time and country filter pushed into the store scan
+        if from_upload or manifest is None:
+            return backend
+        if backend.name != "pandas":
+            return load_store_backend(backend.name, tuple(all_columns), col_country, dataset_version, store_path)
+        with instrument.stage("store.read_selection") as info:
+            df = columnar_store.read_selection(store_path, start_ts, end_ts, filter_countries, col_country)
+            info["rows"] = len(df)
+        # Same version and stats service as the dashboard index: whole-month moments are cached per country
+        # and month, so other selections reuse them
+        index = filter_index.SortedFrameIndex(prepare_dates(df), "last_updated", col_country)
+        return query_backend.PandasBackend(index, get_stats_service(), dataset_version)
 
-    st.markdown("""
-    <div class="plot-desc">
-    The global map provides temperature intensity visualization using choropleth or localized bubbles.  
-    Each country is now highlighted and labeled properly for better interpretation.
-    </div>
-    """, unsafe_allow_html=True)
 
+    @functools.cache
+    def plot_rows():
+        # Binary search per selected country instead of full-length masks over every row (copy-on-write:
+        # a view of the shared frame), or a pushed-down scan of the store with an out-of-core backend
+        with instrument.stage("filter") as info:
+            df = backend.rows(start_ts, end_ts, filter_countries)
+            info["rows"] = len(df)
+            return df
+
+
+    # Streamlit's dataframe serialization to Arrow sometimes fails with datetime objects, so the rows
+    # shown as a table get 'last_updated' as text; only those rows are formatted.
+    def display_rows(n):
+        df = plot_rows().head(n)
+        with instrument.stage("format_display", rows=len(df)):
+            return timestamps.as_text(df)
+
+
+    def selected_count():
+        return backend.count(start_ts, end_ts, filter_countries)
+
+
+    map_type = st.sidebar.radio("Map Type", ["🌎 Global Temperature View", "🌡 Localized Bubble Map"])
+    # Wider selections are downsampled server-side so chart payloads stay bounded
+    point_budget = st.sidebar.number_input("Max points per chart trace", min_value=200, max_value=50_000,
+                                           value=downsample.DEFAULT_BUDGET, step=200)
+
+
+    @st.cache_resource(max_entries=64, show_spinner=False)
+    def _cached_view(view_id, key, _build):
+        # Timed only when built; a cache hit shows up in its tab's total
+        with instrument.stage(f"build.{view_id}"):
+            return _build()
+
+
+    def cached_view(view_id, key, build):
+        """Figure (or table) ``view_id`` for ``key`` — only the inputs ``build`` reads — built on first use.
+
+        Shared by all sessions: a filter change rebuilds only the views whose key it is part of.
+        """
+        return _cached_view(view_id, key, build)
+
+
+    # ----------------------------------
+    # 🧊 Rollup Cube
+    # ----------------------------------
+    # Overview metrics, choropleth, AQI pie and histograms sum a few country x day cells
+    # instead of scanning raw rows. Without a prebuilt cube, one is computed from the filtered rows
+    # in memory; an out-of-core backend answers those queries itself instead.
+    @st.cache_resource(max_entries=4, show_spinner=False)
+    def selection_cube(key, _rows):
+        return rollups.cube_from_frame(_rows().rename(columns={col_country: rollups.COUNTRY_COL}))
 
-# ----------------------------------
-# ☁️ Air Quality Index
-# ----------------------------------
-with tabs[2]:
-    st.markdown("<div class='feature-box'>☁️ Air Quality Index (AQI) by Country</div>", unsafe_allow_html=True)
-    st.markdown("<h3>📊 AQI Range and Health Categories</h3>", unsafe_allow_html=True)
-    st.markdown("""
-    <table>
-        <tr><th>AQI Range</th><th>Category</th><th>Color</th></tr>
-        <tr><td>0 - 50</td><td>Good</td><td style='background-color:#00E400;'></td></tr>
-        <tr><td>51 - 100</td><td>Moderate</td><td style='background-color:#FFFF00;'></td></tr>
-        <tr><td>101 - 150</td><td>Unhealthy for Sensitive Groups</td><td style='background-color:#FF7E00;'></td></tr>
-        <tr><td>151 - 200</td><td>Unhealthy</td><td style='background-color:#FF0000;'></td></tr>
-        <tr><td>201 - 300</td><td>Very Unhealthy</td><td style='background-color:#8F3F97;'></td></tr>
-        <tr><td>301 - 500</td><td>Hazardous</td><td style='background-color:#7E0023;'></td></tr>
-    </table>
-    """, unsafe_allow_html=True)
 
-    if col_aqi and col_country:
-        df_aqi = df_plot.dropna(subset=[col_aqi, col_country])
-        if not df_aqi.empty:
-            df_country_aqi = df_aqi.groupby(col_country, as_index=False)[col_aqi].mean()
-            st.markdown("<h3>🌍 Average AQI by Country</h3>", unsafe_allow_html=True)
-            fig_pie = px.pie(df_country_aqi, names=col_country, values=col_aqi,
-                             color_discrete_sequence=["#00E400", "#FFFF00", "#FF7E00", "#FF0000", "#8F3F97", "#7E0023"],
-                             hole=0.35)
-            st.plotly_chart(fig_pie, use_container_width=True)
+    # Shared, read-only rollup cube built by data_preparation.py
+    cube = None if from_upload else dataset["cube"]
+    shared_cube = cube is not None
+    if cube is None and col_country and index is not None:
+        cube = selection_cube(data_key, plot_rows)
+    cube_metrics = cube["metrics"] if cube and cube["day"] is not None else []
+
+
+    @functools.cache
+    @instrument.timed("cube.select")
+    def cells():
+        return rollups.select_cells(cube, start_date, end_date, selected_countries)
+
+
+    @functools.cache
+    @instrument.timed("cube.select_hist")
+    def hist_cells():
+        return rollups.select_hist(cube, start_date, end_date, selected_countries)
+
+
+    def cube_mean_text(metric):
+        if metric in cube_metrics:
+            return f"{rollups.overall_mean(cells(), metric):.2f}"
+        if metric and metric in backend.columns:
+            return f"{backend.means(start_ts, end_ts, filter_countries, [metric])[metric]:.2f}"
+        return "N/A"
+
+
+    def has_country_means(metric):
+        return metric in cube_metrics or bool(col_country and metric and metric in backend.columns)
+
+
+    def country_means(metric):
+        # From the cube cells when the metric is in the cube, else one grouped query on the backend
+        if metric in cube_metrics:
+            return rollups.country_means(cells(), metric)
+        df = backend.country_means(start_ts, end_ts, filter_countries, metric)
+        return df.rename(columns={col_country: rollups.COUNTRY_COL})
+
+
+    def metric_histogram(metric, nbins, **kwargs):
+        def build():
+            # Pre-binned counts drawn as stacked bars, one colour per country: from the cube, or binned by the backend
+            if cube_metrics and metric in cube["edges"]:
+                h = rollups.histogram(cube, hist_cells(), metric)
+            else:
+                h = backend.histogram(start_ts, end_ts, filter_countries, metric, nbins)
+                if h is None:
+                    h = pd.DataFrame({rollups.COUNTRY_COL: [], "bin": [], "count": [], metric: []})
+            fig = px.bar(h, x=metric, y="count", color=rollups.COUNTRY_COL, **kwargs)
+            fig.update_layout(bargap=0)
+            return fig
+        return cached_view(f"histogram:{metric}:{nbins}:{kwargs}", data_key, build)
+
+
+    def sketch_items(metric):
+        """Quantile sketch cells of the selection per country, with the exact per-country min / max (or None)."""
+        if cube_metrics and metric in cube.get("sketch_metrics", []) and cube.get("sketch_day") is not None:
+            items = rollups.select_sketch(cube, start_date, end_date, selected_countries)
+            items = items[items["metric"] == metric]
+            return (items, *rollups.country_extremes(cells(), metric)) if metric in cube_metrics else (items, None, None)
+        # No stored sketches: sketch the selected rows (one box per metric name without a country column)
+        rows = plot_rows()
+        key = rows[col_country].astype(str) if col_country else pd.Series(metric, index=rows.index)
+        key = key.rename(rollups.COUNTRY_COL)
+        values = rows[metric].groupby(key, observed=True)
+        return quantile_sketch.partial_sketch(rows, [metric], [key]), values.min(), values.max()
+
+
+    def sketch_box(metric):
+        # Quartiles, whiskers and a bounded outlier sample per country, drawn as precomputed boxes
+        items, lo, hi = sketch_items(metric)
+        fig = go.Figure()
+        if not items.empty:
+            boxes, outliers = quantile_sketch.box_stats(items, rollups.COUNTRY_COL, lo, hi)
+            palette = px.colors.qualitative.Plotly
+            for i, box in enumerate(boxes.itertuples(index=False)):
+                name, color = getattr(box, rollups.COUNTRY_COL), palette[i % len(palette)]
+                fig.add_trace(go.Box(x=[name], q1=[box.q1], median=[box.median], q3=[box.q3], lowerfence=[box.lowerfence],
+                                     upperfence=[box.upperfence], name=name, legendgroup=name, marker_color=color,
+                                     boxpoints=False))
+                points = outliers.loc[outliers[rollups.COUNTRY_COL] == name, "value"]
+                fig.add_trace(go.Scatter(x=[name] * len(points), y=points, mode="markers", name=name, legendgroup=name,
+                                         showlegend=False, marker_color=color))
+        fig.update_layout(xaxis_title=col_country, yaxis_title=metric, legend_title_text=col_country)
+        return fig
+
+
+    # What a trend engine is built from: the whole dataset (shared cube) or only the selection
+    engine_key = (dataset_version,) if shared_cube else data_key
+
+
+    def trend_engine(metric):
+        if shared_cube:
+            engine = trend_engines().setdefault(metric, time_series.TrendEngine(metric))
+            # Versions only move forward: a rerun still on a replaced version keeps the newer engine
+            if engine.version is None or engine.version < dataset["seq"]:
+                with instrument.stage("trends.update"):
+                    engine.update(time_series.month_cells(cube, metric), dataset["seq"])
+            return engine
+
+        # A cube built from the selected rows only covers the selection
+        def build():
+            engine = time_series.TrendEngine(metric)
+            engine.update(time_series.month_cells(cube, metric), engine_key)
+            return engine
+        return cached_view(f"trend_engine:{metric}", engine_key, build)
+
+
+    def lazy_tabs(labels):
+        # With on_change="rerun" only the selected tab's body needs to run; older Streamlit renders all tabs
+        try:
+            return st.tabs(labels, key="active_tab", on_change="rerun")
+        except TypeError:
+            return st.tabs(labels)
+
+
+    def is_open(tab):
+        # None when the Streamlit version does not track the selected tab
+        return getattr(tab, "open", None) is not False
+
+
+    # ----------------------------------
+    # 🧭 Tabs Navigation
+    # ----------------------------------
+    tabs = lazy_tabs([
+        "🏠 Overview",
+        "🌍 Map Visualization",
+        "☁️ Air Quality Index",
+        "⚠️ Extreme Events",
+        "🌡️ Climate Parameter Analysis",
+        "📈 Seasonality & Trends",
+        "📋 Summary"
+    ])
+
+    # ----------------------------------
+    # 🏠 Overview
+    # ----------------------------------
+    with tabs[0], instrument.stage("tab.overview"):
+        if is_open(tabs[0]):
+            st.markdown("<div class='feature-box'>🏠 Global Weather Overview</div>", unsafe_allow_html=True)
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("Records", f"{rollups.record_count(cells()) if cube_metrics else selected_count():,}")
+            c2.metric("Avg Temp (°C)", cube_mean_text(col_temp))
+            c3.metric("Avg Humidity (%)", cube_mean_text(col_hum))
+            c4.metric("Avg Wind (kph)", cube_mean_text(col_wind))
+
+            st.markdown("<h3>📆 Data Collected Over Time</h3>", unsafe_allow_html=True)
+
+            def build_timeline():
+                if cube_metrics:
+                    # Daily record counts from the cube, binned here so only 50 bars reach the browser
+                    df_timeline = rollups.timeline(cube, start_date, end_date, selected_countries)
+                    df_bins = downsample.binned_counts(df_timeline["period"], 50, weights=df_timeline["rows"])
+                else:
+                    df_bins = downsample.binned_counts(plot_rows()["last_updated"], 50)
+                fig = px.bar(df_bins, x="bin", y="count", labels={"bin": "last_updated"},
+                             color_discrete_sequence=["#283593"], template="plotly_white")
+                fig.update_traces(width=df_bins["width_ms"])
+                fig.update_layout(bargap=0)
+                return fig
+
+            st.plotly_chart(cached_view("timeline", data_key, build_timeline), use_container_width=True)
             st.markdown("""
             <div class="plot-desc">
-            The pie chart shows the distribution of AQI across countries, indicating air pollution intensity and its category.  
-            It visually identifies regions with the cleanest and most polluted air.
+            This plot shows how the dataset has grown across time for selected regions.  
+            Higher bars indicate days with more recorded observations.
             </div>
             """, unsafe_allow_html=True)
-        else:
-            st.info("AQI and/or country data not available for the selected filters.")
-    else:
-        st.info("AQI and/or country columns not detected in the dataset.")
 
-# ----------------------------------
-# ⚠️ Extreme Events
-# ----------------------------------
-with tabs[3]:
-    st.markdown("<div class='feature-box'>⚠️ Extreme Weather Events</div>", unsafe_allow_html=True)
-    st.markdown("<h3>🔥 Hottest & ❄️ Coldest Days</h3>", unsafe_allow_html=True)
-    if col_temp:
-        hot = df_plot.nlargest(10, col_temp)
-        cold = df_plot.nsmallest(10, col_temp)
-        if not hot.empty:
-            st.dataframe(hot[[col_country, "last_updated", col_temp, col_condition]].style.format({col_temp: "{:.2f}"}))
-        if not cold.empty:
-            st.dataframe(cold[[col_country, "last_updated", col_temp, col_condition]].style.format({col_temp: "{:.2f}"}))
-    else:
-        st.info("Temperature column not detected for extreme event tables.")
-
-    st.markdown("<h3>🌪️ Temperature Extremes Distribution</h3>", unsafe_allow_html=True)
-    if col_temp:
-        fig_extreme = px.histogram(df_plot.dropna(subset=[col_temp]), x=col_temp, nbins=50, color=col_country if col_country else None,
-                                   color_discrete_sequence=px.colors.sequential.Reds)
-        st.plotly_chart(fig_extreme, use_container_width=True)
-        st.markdown("""
-        <div class="plot-desc">
-        This histogram displays how temperature extremes vary across selected countries.  
-        It helps identify frequency patterns of extreme heat and cold conditions.
-        </div>
-        """, unsafe_allow_html=True)
-    else:
-        st.info("Temperature column not available for extremes histogram.")
+    # ----------------------------------
+    # 🌍 Map Visualization
+    # ----------------------------------
+
+    with tabs[1], instrument.stage("tab.map"):
+        if is_open(tabs[1]):
+            st.markdown("<div class='feature-box'>🌍 Global Weather Map</div>", unsafe_allow_html=True)
+
+            if map_type == "🌡 Localized Bubble Map" and {"latitude", "longitude", col_temp} <= set(backend.columns):
+                def build_bubble_map():
+                    # Grid cells instead of one bubble per row: whole months come from the prebuilt grid,
+                    # only the ragged edge days are binned here, and the level keeps the bubbles <= point_budget
+                    month_cells, edges = rollups.select_grid(cube, start_date, end_date, selected_countries)
+                    parts = [] if month_cells is None else [month_cells]
+                    for lo, hi in edges:
+                        edge_rows = backend.rows(lo, hi, filter_countries, ["latitude", "longitude", col_temp])
+                        parts.append(spatial_grid.partial_grid(edge_rows, col_temp))
+                    grid = pd.concat(parts, ignore_index=True)
+                    grid = grid[grid["temp_count"] > 0]
+                    if grid.empty:
+                        return None
+                    df_map, zoom, center, level = spatial_grid.map_points(grid, point_budget)
+                    df_map["cell_deg"] = spatial_grid.cell_size(level)
+                    # ✅ New API: scatter_map replaces scatter_mapbox
+                    fig = px.scatter_map(
+                        df_map,
+                        lat="latitude",
+                        lon="longitude",
+                        color="temp_mean",
+                        size="rows",
+                        color_continuous_scale="Inferno",
+                        hover_data={"rows": ":,", "temp_mean": ":.1f", "temp_min": ":.1f", "temp_max": ":.1f",
+                                    "cell_deg": True, "latitude": ":.2f", "longitude": ":.2f"},
+                        labels={"temp_mean": col_temp, "rows": "records"},
+                        zoom=zoom,
+                        center=center
+                    )
+                    fig.update_layout(map=dict(style="carto-darkmatter"), margin={"r":0, "t":0, "l":0, "b":0})
+                    return fig
+
+                fig_map = cached_view("bubble_map", data_key + (point_budget,), build_bubble_map)
+                if fig_map is not None:
+                    st.plotly_chart(fig_map, use_container_width=True)
+                else:
+                    st.info("No geolocation data available for the selected filters to render the localized bubble map.")
+            else:
+                # For choropleth use ISO3 codes to avoid future location-name deprecation issues
+                if has_country_means(col_temp):
+                    def build_choropleth():
+                        df_avg = country_means(col_temp)
+                        with instrument.stage("iso_codes", rows=len(df_avg)):
+                            df_avg["iso_code"] = iso_lookup.iso_codes(df_avg[rollups.COUNTRY_COL], dataset["iso"])
+                        df_avg = df_avg.dropna(subset=["iso_code", col_temp])
+                        if df_avg.empty:
+                            return None
+                        fig = px.choropleth(
+                            df_avg, locations="iso_code", color=col_temp, hover_name=rollups.COUNTRY_COL,
+                            color_continuous_scale="Inferno"
+                        )
+                        fig.update_layout(geo_showframe=False, geo_showcoastlines=True, geo_projection_type="natural earth")
+                        return fig
+
+                    fig_choro = cached_view("choropleth", data_key, build_choropleth)
+                    if fig_choro is not None:
+                        st.plotly_chart(fig_choro, use_container_width=True)
+                    else:
+                        st.info("No country-level temperature data available for the selected filters to render the choropleth.")
+                else:
+                    st.info("Country / temperature columns not available for choropleth. Ensure your dataset has country and temperature columns.")
 
-# ----------------------------------
-# 🌡️ Climate Parameter Analysis
-# ----------------------------------
-with tabs[4]:
-    st.markdown("<div class='feature-box'>🌡️ Climate Parameter Analysis</div>", unsafe_allow_html=True)
-
-    # 🌧️ Precipitation
-    if col_precip:
-        st.markdown("<h3>🌧️ Precipitation Analysis</h3>", unsafe_allow_html=True)
-        fig_precip = px.box(df_plot.dropna(subset=[col_precip, col_country]) if col_country else df_plot.dropna(subset=[col_precip]),
-                            x=col_country if col_country else None, y=col_precip, color=col_country if col_country else None)
-        st.plotly_chart(fig_precip, use_container_width=True)
-        st.markdown('<div class="plot-desc">Shows rainfall variation across countries and identifies high precipitation regions.</div>', unsafe_allow_html=True)
-    else:
-        st.info("Precipitation column not found in dataset.")
-
-    # 💧 Humidity
-    if col_hum:
-        st.markdown("<h3>💧 Humidity Analysis</h3>", unsafe_allow_html=True)
-        fig_hum = px.histogram(df_plot.dropna(subset=[col_hum]), x=col_hum, nbins=40, color=col_country if col_country else None)
-        st.plotly_chart(fig_hum, use_container_width=True)
-        st.markdown('<div class="plot-desc">Shows humidity distribution and its effect on air moisture balance.</div>', unsafe_allow_html=True)
-    else:
-        st.info("Humidity column not found.")
-
-    # 🌡️ Temperature Range
-    if col_temp:
-        st.markdown("<h3>🌡️ Temperature Range Analysis</h3>", unsafe_allow_html=True)
-        fig_temp_range = px.box(df_plot.dropna(subset=[col_temp]), x=col_country if col_country else None, y=col_temp, color=col_country if col_country else None)
-        st.plotly_chart(fig_temp_range, use_container_width=True)
-        st.markdown('<div class="plot-desc">Box plot showing range, median, and outliers of temperature by country.</div>', unsafe_allow_html=True)
-    else:
-        st.info("Temperature column not found.")
-
-    # 💨 Wind Speed
-    if col_wind:
-        st.markdown("<h3>💨 Wind Speed Analysis</h3>", unsafe_allow_html=True)
-        fig_wind = px.violin(df_plot.dropna(subset=[col_wind]), x=col_country if col_country else None, y=col_wind, color=col_country if col_country else None,
-                             box=True, points="all", template="plotly_white")
-        st.plotly_chart(fig_wind, use_container_width=True)
-        st.markdown('<div class="plot-desc">Analyzes distribution of wind speeds across regions, highlighting variability and extremes.</div>', unsafe_allow_html=True)
-    else:
-        st.info("Wind column not present in dataset.")
-
-    # ⚙️ Pressure
-    if col_pressure:
-        st.markdown("<h3>⚙️ Atmospheric Pressure Analysis</h3>", unsafe_allow_html=True)
-        if "last_updated_dt" in df_plot.columns:
-            fig_pressure = px.line(df_plot.dropna(subset=["last_updated_dt", col_pressure]), x="last_updated_dt", y=col_pressure, color=col_country if col_country else None)
-        else:
-            fig_pressure = px.line(df_plot.dropna(subset=[col_pressure]), x="last_updated", y=col_pressure, color=col_country if col_country else None)
-        st.plotly_chart(fig_pressure, use_container_width=True)
-        st.markdown('<div class="plot-desc">Line graph showing daily atmospheric pressure changes and stability trends.</div>', unsafe_allow_html=True)
-    else:
-        st.info("Pressure column not found.")
-
-    # 🌞 UV
-    if col_uv:
-        st.markdown("<h3>🌞 UV Index Analysis</h3>", unsafe_allow_html=True)
-        fig_uv = px.histogram(df_plot.dropna(subset=[col_uv]), x=col_uv, nbins=30, color=col_country if col_country else None)
-        st.plotly_chart(fig_uv, use_container_width=True)
-        st.markdown('<div class="plot-desc">Represents UV exposure intensity indicating potential skin risk levels.</div>', unsafe_allow_html=True)
-    else:
-        st.info("UV column not found.")
-
-    # 🔥 Heat Map
-    if col_temp and col_hum:
-        st.markdown("<h3>🔥 Heat Map Analysis</h3>", unsafe_allow_html=True)
-        df_plot["heat_index"] = df_plot[col_temp].astype(float) + 0.1 * df_plot[col_hum].astype(float)
-        fig_heatmap = px.density_heatmap(df_plot.dropna(subset=[col_temp, col_hum, "heat_index"]), x=col_temp, y=col_hum, z="heat_index",
-                                         color_continuous_scale="Inferno")
-        st.plotly_chart(fig_heatmap, use_container_width=True)
-        st.markdown('<div class="plot-desc">Shows the combined impact of temperature and humidity to visualize perceived heat intensity.</div>', unsafe_allow_html=True)
-    else:
-        st.info("Insufficient data for heat map (needs temperature and humidity).")
+            st.markdown("""
+            <div class="plot-desc">
+            The global map provides temperature intensity visualization using choropleth or localized bubbles.  
+            Each country is now highlighted and labeled properly for better interpretation.
+            </div>
+            """, unsafe_allow_html=True)
+
+
+    # ----------------------------------
+    # ☁️ Air Quality Index
+    # ----------------------------------
+    with tabs[2], instrument.stage("tab.aqi"):
+        if is_open(tabs[2]):
+            st.markdown("<div class='feature-box'>☁️ Air Quality Index (AQI) by Country</div>", unsafe_allow_html=True)
+            st.markdown("<h3>📊 AQI Range and Health Categories</h3>", unsafe_allow_html=True)
+            st.markdown("""
+            <table>
+                <tr><th>AQI Range</th><th>Category</th><th>Color</th></tr>
+                <tr><td>0 - 50</td><td>Good</td><td style='background-color:#00E400;'></td></tr>
+                <tr><td>51 - 100</td><td>Moderate</td><td style='background-color:#FFFF00;'></td></tr>
+                <tr><td>101 - 150</td><td>Unhealthy for Sensitive Groups</td><td style='background-color:#FF7E00;'></td></tr>
+                <tr><td>151 - 200</td><td>Unhealthy</td><td style='background-color:#FF0000;'></td></tr>
+                <tr><td>201 - 300</td><td>Very Unhealthy</td><td style='background-color:#8F3F97;'></td></tr>
+                <tr><td>301 - 500</td><td>Hazardous</td><td style='background-color:#7E0023;'></td></tr>
+            </table>
+            """, unsafe_allow_html=True)
+
+            if has_country_means(col_aqi):
+                def build_aqi_pie():
+                    df_country_aqi = country_means(col_aqi)
+                    if df_country_aqi.empty:
+                        return None
+                    return px.pie(df_country_aqi, names=rollups.COUNTRY_COL, values=col_aqi,
+                                  color_discrete_sequence=["#00E400", "#FFFF00", "#FF7E00", "#FF0000", "#8F3F97", "#7E0023"],
+                                  hole=0.35)
+
+                fig_pie = cached_view("aqi_pie", data_key, build_aqi_pie)
+                if fig_pie is not None:
+                    st.markdown("<h3>🌍 Average AQI by Country</h3>", unsafe_allow_html=True)
+                    st.plotly_chart(fig_pie, use_container_width=True)
+                    st.markdown("""
+                    <div class="plot-desc">
+                    The pie chart shows the distribution of AQI across countries, indicating air pollution intensity and its category.  
+                    It visually identifies regions with the cleanest and most polluted air.
+                    </div>
+                    """, unsafe_allow_html=True)
+                else:
+                    st.info("AQI and/or country data not available for the selected filters.")
+            else:
+                st.info("AQI and/or country columns not detected in the dataset.")
+
+    # ----------------------------------
+    # ⚠️ Extreme Events
+    # ----------------------------------
+    with tabs[3], instrument.stage("tab.extremes"):
+        if is_open(tabs[3]):
+            st.markdown("<div class='feature-box'>⚠️ Extreme Weather Events</div>", unsafe_allow_html=True)
+            st.markdown("<h3>🔥 Hottest & ❄️ Coldest Days</h3>", unsafe_allow_html=True)
+            if col_temp:
+                # Ranked by z-score against each country's own mean/std, so hot and cold are relative to local climate
+                z_col = f"z_{col_temp}"
+
+                def build_extremes():
+                    return backend.extremes(start_ts, end_ts, filter_countries, col_temp, 10)
+
+                hot, cold, n_extreme = cached_view("extremes", data_key, build_extremes)
+                show_cols = [c for c in [col_country, "last_updated", col_temp, z_col, col_condition] if c]
+                number_formats = {col_temp: "{:.2f}", z_col: "{:+.2f}"}
+                # Timestamps shown as text, like every other table
+                if not hot.empty:
+                    st.dataframe(timestamps.as_text(hot[show_cols]).style.format(number_formats))
+                if not cold.empty:
+                    st.dataframe(timestamps.as_text(cold[show_cols]).style.format(number_formats))
+                st.markdown(f'<div class="plot-desc">{n_extreme:,} readings are at least {extremes.Z_THRESHOLD:g} standard deviations '
+                            f'from their country\'s mean temperature in the selected period.</div>', unsafe_allow_html=True)
+            else:
+                st.info("Temperature column not detected for extreme event tables.")
+
+            st.markdown("<h3>🌪️ Temperature Extremes Distribution</h3>", unsafe_allow_html=True)
+            if col_temp:
+                fig_extreme = metric_histogram(col_temp, 50, color_discrete_sequence=px.colors.sequential.Reds)
+                st.plotly_chart(fig_extreme, use_container_width=True)
+                st.markdown("""
+                <div class="plot-desc">
+                This histogram displays how temperature extremes vary across selected countries.  
+                It helps identify frequency patterns of extreme heat and cold conditions.
+                </div>
+                """, unsafe_allow_html=True)
+            else:
+                st.info("Temperature column not available for extremes histogram.")
+
+    # ----------------------------------
+    # 🌡️ Climate Parameter Analysis
+    # ----------------------------------
+    with tabs[4], instrument.stage("tab.parameters"):
+        if is_open(tabs[4]):
+            st.markdown("<div class='feature-box'>🌡️ Climate Parameter Analysis</div>", unsafe_allow_html=True)
+
+            # 🌧️ Precipitation
+            if col_precip:
+                st.markdown("<h3>🌧️ Precipitation Analysis</h3>", unsafe_allow_html=True)
+
+                st.plotly_chart(cached_view("precip_box", data_key, lambda: sketch_box(col_precip)), use_container_width=True)
+                st.markdown('<div class="plot-desc">Shows rainfall variation across countries and identifies high precipitation regions.</div>', unsafe_allow_html=True)
+            else:
+                st.info("Precipitation column not found in dataset.")
+
+            # 💧 Humidity
+            if col_hum:
+                st.markdown("<h3>💧 Humidity Analysis</h3>", unsafe_allow_html=True)
+                fig_hum = metric_histogram(col_hum, 40)
+                st.plotly_chart(fig_hum, use_container_width=True)
+                st.markdown('<div class="plot-desc">Shows humidity distribution and its effect on air moisture balance.</div>', unsafe_allow_html=True)
+            else:
+                st.info("Humidity column not found.")
+
+            # 🌡️ Temperature Range
+            if col_temp:
+                st.markdown("<h3>🌡️ Temperature Range Analysis</h3>", unsafe_allow_html=True)
+
+                st.plotly_chart(cached_view("temp_box", data_key, lambda: sketch_box(col_temp)), use_container_width=True)
+                st.markdown('<div class="plot-desc">Box plot showing range, median, and outliers of temperature by country.</div>', unsafe_allow_html=True)
+            else:
+                st.info("Temperature column not found.")
+
+            # 💨 Wind Speed
+            if col_wind:
+                st.markdown("<h3>💨 Wind Speed Analysis</h3>", unsafe_allow_html=True)
+
+                def build_wind():
+                    # Evenly spaced quantiles per country from the sketches keep the violin shape and the extremes
+                    items, lo, hi = sketch_items(col_wind)
+                    df_wind = quantile_sketch.quantiles(items, np.linspace(0, 1, point_budget), rollups.COUNTRY_COL, lo, hi)
+                    df_wind = df_wind.rename(columns={rollups.COUNTRY_COL: col_country or "", "value": col_wind})
+                    return px.violin(df_wind, x=col_country or None, y=col_wind, color=col_country or None,
+                                     box=True, points="all", template="plotly_white")
+
+                st.plotly_chart(cached_view("wind_violin", data_key + (point_budget,), build_wind), use_container_width=True)
+                st.markdown('<div class="plot-desc">Analyzes distribution of wind speeds across regions, highlighting variability and extremes.</div>', unsafe_allow_html=True)
+            else:
+                st.info("Wind column not present in dataset.")
+
+            # ⚙️ Pressure
+            if col_pressure:
+                st.markdown("<h3>⚙️ Atmospheric Pressure Analysis</h3>", unsafe_allow_html=True)
+
+                def build_pressure():
+                    x_col = "last_updated"
+                    # LTTB per country: at most point_budget points per line, peaks preserved
+                    df_pressure = downsample.reduce_series(plot_rows(), x_col, col_pressure, col_country, point_budget)
+                    return px.line(df_pressure, x=x_col, y=col_pressure, color=col_country if col_country else None)
+
+                st.plotly_chart(cached_view("pressure_line", data_key + (point_budget,), build_pressure), use_container_width=True)
+                st.markdown('<div class="plot-desc">Line graph showing daily atmospheric pressure changes and stability trends.</div>', unsafe_allow_html=True)
+            else:
+                st.info("Pressure column not found.")
+
+            # 🌞 UV
+            if col_uv:
+                st.markdown("<h3>🌞 UV Index Analysis</h3>", unsafe_allow_html=True)
+                fig_uv = metric_histogram(col_uv, 30)
+                st.plotly_chart(fig_uv, use_container_width=True)
+                st.markdown('<div class="plot-desc">Represents UV exposure intensity indicating potential skin risk levels.</div>', unsafe_allow_html=True)
+            else:
+                st.info("UV column not found.")
+
+            # 🔥 Heat Map
+            if col_temp and col_hum:
+                st.markdown("<h3>🔥 Heat Map Analysis</h3>", unsafe_allow_html=True)
+
+                def build_heatmap():
+                    df_heat = plot_rows().assign(heat_index=lambda d: d[col_temp].astype(float) + 0.1 * d[col_hum].astype(float))
+                    return px.density_heatmap(df_heat.dropna(subset=[col_temp, col_hum, "heat_index"]), x=col_temp, y=col_hum, z="heat_index",
+                                              color_continuous_scale="Inferno")
+
+                st.plotly_chart(cached_view("heatmap", data_key, build_heatmap), use_container_width=True)
+                st.markdown('<div class="plot-desc">Shows the combined impact of temperature and humidity to visualize perceived heat intensity.</div>', unsafe_allow_html=True)
+            else:
+                st.info("Insufficient data for heat map (needs temperature and humidity).")
+
+    # ----------------------------------
+    # 📈 Seasonality & Trends
+    # ----------------------------------
+    with tabs[5], instrument.stage("tab.trends"):
+        if is_open(tabs[5]):
+            st.markdown("<div class='feature-box'>📈 Seasonality & Trends</div>", unsafe_allow_html=True)
+            trend_metrics = [c for c in dict.fromkeys([col_temp, col_hum, col_wind, col_precip, col_pressure])
+                             if c in cube_metrics]
+            if trend_metrics:
+                trend_metric = st.selectbox("Parameter", trend_metrics, key="trend_metric")
+                engine = trend_engine(trend_metric)
+                # Selected countries plus the all-country series; the climatology always spans the whole dataset
+                shown = list(selected_countries) + [time_series.GLOBAL]
+                # The climatology reads the engine and the shown countries; the series also the months in range
+                cycle_key = engine_key + (trend_metric, tuple(selected_countries))
+                series_key = cycle_key + (pd.Timestamp(start_date).to_period("M"), pd.Timestamp(end_date).to_period("M"))
+
+                def build_cycle():
+                    df_cycle = engine.seasonal_cycle()
+                    return px.line(df_cycle[df_cycle["country"].isin(shown)], x="month", y=trend_metric, color="country",
+                                   markers=True, template="plotly_white")
+
+                def selected_series():
+                    df_series = engine.series()
+                    in_range = df_series["period"].between(pd.Timestamp(start_date).to_period("M").start_time,
+                                                           pd.Timestamp(end_date))
+                    return df_series[df_series["country"].isin(shown) & in_range]
+
+                def build_anomaly():
+                    return px.bar(selected_series(), x="period", y="anomaly", color="country", barmode="group",
+                                  template="plotly_white")
+
+                def build_rolling():
+                    return px.line(selected_series(), x="period", y="rolling", color="country", template="plotly_white",
+                                   labels={"rolling": f"{engine.window}-month mean anomaly"})
+
+                st.markdown("<h3>🗓️ Seasonal Cycle</h3>", unsafe_allow_html=True)
+                st.plotly_chart(cached_view("trend_cycle", cycle_key, build_cycle), use_container_width=True)
+                st.markdown('<div class="plot-desc">Monthly climatology: the mean of every calendar month over all years in the dataset.</div>', unsafe_allow_html=True)
+                st.markdown("<h3>📉 Anomalies</h3>", unsafe_allow_html=True)
+                st.plotly_chart(cached_view("trend_anomaly", series_key, build_anomaly), use_container_width=True)
+                st.plotly_chart(cached_view("trend_rolling", series_key, build_rolling), use_container_width=True)
+                st.markdown('<div class="plot-desc">Departures of each month from its climatology, and their rolling mean.</div>', unsafe_allow_html=True)
+                latest = cached_view("trend_latest", series_key, lambda: selected_series().groupby("country").last()[
+                    ["period", "mean", "anomaly", "trend"]].rename(columns={"trend": "trend (per year)"}))
+                st.dataframe(latest)
+            else:
+                st.info("Monthly aggregates are not available for this dataset (run data_preparation.py).")
+
+    # ----------------------------------
+    # 📋 Summary
+    # ----------------------------------
+    with tabs[6], instrument.stage("tab.summary"):
+        if is_open(tabs[6]):
+            st.markdown("<div class='feature-box'>📋 Summary & Insights</div>", unsafe_allow_html=True)
+            # describe() and the correlation matrix cover every column: cached per-(country, month) moments
+            # of the selection read from the store, or one aggregate query with an out-of-core backend
+            if from_upload or manifest is None:
+                numeric_cols = backend.numeric_columns()
+            else:
+                # From the manifest, so a cached describe() reads nothing
+                numeric_cols = columnar_store.numeric_columns(manifest)
+            stats_args = (start_ts, end_ts, filter_countries, numeric_cols)
+            try:
+                with instrument.stage("stats.describe"):
+                    summary = cached_view("describe", data_key, lambda: full_backend().describe(*stats_args))
+                st.dataframe(summary.style.format("{:.2f}"))
+            except Exception:
+                # fallback: show a trimmed summary if describe() has serialization trouble
+                st.write(display_rows(100))
+            # Written only when the button is clicked, chunk by chunk, and cached on disk per selection
+            export_format = st.selectbox("Download format", export.available_formats())
+            export_key = export.filter_key(*data_key)
+
+            def export_data():
+                # An open file: Streamlit reads it when the button is clicked
+                with instrument.stage("export"):
+                    return export.open_export(full_backend().rows(start_ts, end_ts, filter_countries), export_format,
+                                              export_key)
+
+            suffix, mime = export.FORMATS[export_format]
+            st.download_button("📥 Download Filtered Data", export_data, f"filtered_weather_data{suffix}", mime)
+            if len(numeric_cols) > 1:
+                st.markdown("<h3>🔗 Correlation Heatmap</h3>", unsafe_allow_html=True)
+
+                def build_corr():
+                    return px.imshow(full_backend().corr(*stats_args), labels=dict(color="Correlation"), zmin=-1, zmax=1,
+                                     color_continuous_scale="RdBu_r", aspect="auto")
+
+                st.plotly_chart(cached_view("correlation", data_key, build_corr), use_container_width=True)
+            st.markdown("""
+            <div class="plot-desc">
+            Summary provides quick statistical measures — mean, min, max, std deviation for each parameter.  
+            Download the processed data to perform further offline analysis.
+            </div>
+            """, unsafe_allow_html=True)
 
 # ----------------------------------
-# 📋 Summary
+# ⏱️ Timings
 # ----------------------------------
-with tabs[5]:
-    st.markdown("<div class='feature-box'>📋 Summary & Insights</div>", unsafe_allow_html=True)
-    # Use df_f (string-typed last_updated) for safe display/download
-    try:
-        st.dataframe(df_f.describe().style.format("{:.2f}"))
-    except Exception:
-        # fallback: show a trimmed summary if describe() has serialization trouble
-        st.write(df_f.head(100))
-    st.download_button("📥 Download Filtered Data", df_f.to_csv(index=False).encode("utf-8"),
-                       "filtered_weather_data.csv", "text/csv")
-    st.markdown("""
-    <div class="plot-desc">
-    Summary provides quick statistical measures — mean, min, max, std deviation for each parameter.  
-    Download the processed data to perform further offline analysis.
-    </div>
-    """, unsafe_allow_html=True)
+timings.emit()
+if instrument.debug_enabled() or st.query_params.get("debug") == "1":
+    with st.sidebar.expander("⏱️ Stage timings", expanded=True):
+        st.caption(f"This rerun: {timings.elapsed():.3f}s, RSS {(instrument.rss() or 0) / 2**20:,.0f} MB")
+        st.dataframe(pd.DataFrame(timings.records()), hide_index=True)
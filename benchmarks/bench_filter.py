@@ -0,0 +1,85 @@
+"""Filter latency vs. dataset size: boolean masks + copy vs. the sorted index.
+
+Both paths answer the same sidebar selection (date range + countries) on a
+synthetic frame; the index is built once up front, as in the dashboard.
+
+    python benchmarks/bench_filter.py --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import filter_index  # noqa: E402
+
+COUNTRIES = [f"Country {i:03d}" for i in range(190)]
+
+
+def synthetic_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2024-05-16").value
+    return pd.DataFrame({
+        "country": pd.Categorical(rng.choice(COUNTRIES, n), categories=COUNTRIES),
+        "last_updated": pd.to_datetime(np.sort(rng.integers(start, start + 365 * 86_400 * 10**9, n))),
+        "temperature_celsius": rng.normal(20, 10, n).astype("float32"),
+        "humidity": rng.integers(0, 100, n),
+    })
+
+
+def mask_filter(df, start, end, countries):
+    mask = (df["last_updated"] >= start) & (df["last_updated"] < end)
+    if countries:
+        mask &= df["country"].isin(countries)
+    return df[mask].copy()
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    selections = {
+        "5 countries, 1 month": (pd.Timestamp("2024-09-01"), pd.Timestamp("2024-10-01"), COUNTRIES[:5]),
+        "5 countries, full year": (pd.Timestamp("2024-05-16"), pd.Timestamp("2025-05-17"), COUNTRIES[:5]),
+        "all countries, 1 week": (pd.Timestamp("2024-09-01"), pd.Timestamp("2024-09-08"), []),
+    }
+    results = []
+    print(f"{'rows':>10}  {'selection':<24}{'matched':>9}{'mask ms':>10}{'index ms':>10}{'speedup':>9}")
+    for n in args.sizes:
+        df = synthetic_frame(n)
+        t0 = time.perf_counter()
+        index = filter_index.SortedFrameIndex(df, "last_updated", "country")
+        build = time.perf_counter() - t0
+        for label, (start, end, countries) in selections.items():
+            t_mask, a = best_of(lambda: mask_filter(df, start, end, countries), args.repeat)
+            t_index, b = best_of(lambda: index.slice(start, end, countries), args.repeat)
+            assert len(a) == len(b)
+            results.append({"rows": n, "selection": label, "matched": len(a), "mask_s": t_mask,
+                            "index_s": t_index, "index_build_s": build})
+            print(f"{n:>10,}  {label:<24}{len(a):>9,}{t_mask * 1e3:>10.2f}{t_index * 1e3:>10.2f}"
+                  f"{t_mask / t_index:>8.1f}x")
+        print(f"{'':>10}  index build: {build * 1e3:.1f} ms (once per dataset)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
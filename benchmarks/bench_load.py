@@ -0,0 +1,89 @@
+"""Cold-load benchmark: CSV + to_datetime vs. the partitioned Parquet store.
+
+Each load runs in a fresh interpreter, so every sample is a cold start (page
+cache aside) and peak RSS belongs to that load alone.
+
+    python benchmarks/bench_load.py --csv processed/cleaned_weather.csv \
+        --store processed/cleaned_weather.parquet --repeat 3
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Mirrors what app.py pulls for the default view
+DASHBOARD_COLUMNS = [
+    "country", "location_name", "latitude", "longitude", "last_updated", "temperature_celsius",
+    "humidity", "wind_mph", "precip_mm", "pressure_mb", "condition_text", "air_quality_Carbon_Monoxide",
+    "uv_index", "cloud",
+]
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def child(kind, path):
+    import pandas as pd
+    import columnar_store
+
+    base = rss_kb()
+    t0 = time.perf_counter()
+    if kind == "csv":
+        df = pd.read_csv(path)
+        df["last_updated"] = pd.to_datetime(df["last_updated"], errors="coerce")
+    else:
+        df = columnar_store.read_store(path, columns=DASHBOARD_COLUMNS)
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "kind": kind, "rows": len(df), "seconds": elapsed,
+        "peak_rss_mb": peak / 1024, "load_rss_mb": (rss_kb() - base) / 1024,
+        "frame_mb": df.memory_usage(deep=True).sum() / 2**20,
+    }))
+
+
+def run(kind, path, repeat):
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, __file__, "--child", kind, path],
+                             check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    best = min(samples, key=lambda s: s["seconds"])
+    return {**best, "samples": [s["seconds"] for s in samples]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", default="processed/cleaned_weather.csv")
+    parser.add_argument("--store", default="processed/cleaned_weather.parquet")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Write results to this file.")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    results = [run("csv", args.csv, args.repeat), run("parquet", args.store, args.repeat)]
+    print(f"{'format':<10}{'rows':>10}{'seconds':>10}{'peak RSS MB':>14}{'load RSS MB':>14}{'frame MB':>10}")
+    for r in results:
+        print(f"{r['kind']:<10}{r['rows']:>10,}{r['seconds']:>10.3f}{r['peak_rss_mb']:>14.1f}"
+              f"{r['load_rss_mb']:>14.1f}{r['frame_mb']:>10.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
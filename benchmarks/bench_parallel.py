@@ -0,0 +1,89 @@
+"""Scaling of the parallel prep mode across 1..N workers.
+
+Runs the serial streaming prep once and the parallel prep for each worker
+count on the same raw CSV, checks that every run wrote the same bytes, and
+reports wall time and speedup over the serial run.
+
+    python benchmarks/bench_parallel.py --input data/global-weather-repository.csv --workers 1 2 4 8
+    python benchmarks/bench_parallel.py --rows 1000000     # synthetic input
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import data_preparation  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn(*args)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", help="Raw CSV (default: a synthetic one of --rows rows).")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--chunksize", type=int, default=data_preparation.DEFAULT_CHUNKSIZE)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument("--format", choices=data_preparation.OUTPUT_FORMATS, default="csv")
+    parser.add_argument("--json", help="Write results to this file.")
+    args = parser.parse_args()
+
+    src = os.path.abspath(args.input) if args.input else None
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Side outputs with fixed relative paths (ISO lookup) stay out of the working tree
+        os.chdir(tmp)
+        try:
+            if src is None:
+                src = os.path.join(tmp, "raw.csv")
+                synthetic.write_csv(src, args.rows)
+
+            def outputs(name):
+                return (os.path.join(tmp, name, "cleaned.csv"), os.path.join(tmp, name, "store"),
+                        os.path.join(tmp, name, "rollups"))
+
+            out, store, cube = outputs("serial")
+            serial = timed(data_preparation.run_streaming, src, out, args.chunksize, store, args.format, None, cube)
+            expected = digest(out) if os.path.exists(out) else None
+            results = [{"mode": "serial", "workers": 1, "seconds": serial, "speedup": 1.0, "identical": True}]
+            print(f"{'mode':<10}{'workers':>8}{'seconds':>10}{'speedup':>9}  identical")
+            print(f"{'serial':<10}{1:>8}{serial:>10.2f}{1.0:>8.2f}x  -")
+            for w in sorted(set(args.workers)):
+                out, store, cube = outputs(f"w{w}")
+                t = timed(data_preparation.run_parallel, src, out, args.chunksize, store, args.format, w, cube)
+                same = expected is None or digest(out) == expected
+                results.append({"mode": "parallel", "workers": w, "seconds": t, "speedup": serial / t,
+                                "identical": same})
+                print(f"{'parallel':<10}{w:>8}{t:>10.2f}{serial / t:>8.2f}x  {'yes' if same else 'NO'}")
+        finally:
+            os.chdir(cwd)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if not all(r["identical"] for r in results):
+        sys.exit("parallel output differs from the serial run")
+
+
+if __name__ == "__main__":
+    main()
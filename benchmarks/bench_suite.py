@@ -0,0 +1,329 @@
+"""Headless benchmark suite: prep stages and dashboard computations on synthetic data.
+
+The raw CSV comes from ``synthetic.py`` (generated once per size and seed
+under ``--data-dir`` and reused). The prep pipeline runs in streaming mode
+with stage timers on (``instrument``); the dashboard part loads its output the
+way app.py does and times, for a few sidebar selections, the filter, the
+per-tab aggregations, the extremes ranking and describe/correlation, without
+Streamlit or a browser. It also checks the quantile sketches behind the box
+and violin plots against exact pandas quantiles of the same rows: the largest
+rank error per selection and metric is reported, and a run fails when one
+exceeds ``quantile_sketch.RANK_ERROR``.
+
+Each run writes ``<results>/<commit>-<rows>.json``; ``--compare`` prints the
+ratio against an earlier result and exits non-zero on a slowdown beyond
+``--max-slowdown``.
+
+    python benchmarks/bench_suite.py --rows 10k
+    python benchmarks/bench_suite.py --rows 1m --compare benchmarks/results/abc1234-1000000.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import columnar_store  # noqa: E402
+import compact_schema  # noqa: E402
+import data_preparation  # noqa: E402
+import downsample  # noqa: E402
+import extremes  # noqa: E402
+import filter_index  # noqa: E402
+import instrument  # noqa: E402
+import quantile_sketch  # noqa: E402
+import query_backend  # noqa: E402
+import rollups  # noqa: E402
+import shared_dataset  # noqa: E402
+import spatial_grid  # noqa: E402
+import stats_service  # noqa: E402
+import synthetic  # noqa: E402
+import time_series  # noqa: E402
+import weather_schema  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DATA_DIR = os.path.join(ROOT, "data", "synthetic")
+# Timings below this are reported but not compared: too noisy to call a regression
+MIN_COMPARED_SECONDS = 0.01
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def raw_csv(rows, seed, data_dir):
+    path = os.path.join(data_dir, f"weather-{rows}-{seed}.csv")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        synthetic.write_csv(tmp, rows, seed)
+        os.replace(tmp, path)
+    return path
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), out
+
+
+def bench_prep(src, chunksize, fmt):
+    """Streaming prep with stage timers; returns the per-stage totals and the output paths."""
+    out, store, cube_dir = "cleaned.csv", "store", "rollups"
+    timings = instrument.start("prep")
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_preparation.run_streaming(src, out, chunksize, store, fmt, None, cube_dir)
+    stages = {s["stage"]: s for s in timings.records()}
+    stages["total"] = {"stage": "total", "calls": 1, "seconds": timings.elapsed(), "rows": None}
+    return stages, out, store, cube_dir
+
+
+def load_dashboard_frame(out, store, fmt, columns):
+    if fmt in ("parquet", "both"):
+        df = columnar_store.read_store(store, columns=columns)
+    else:
+        df = compact_schema.compact(pd.read_csv(out, usecols=lambda c: c in columns), drop_derived=False)
+    df["last_updated"] = pd.to_datetime(df["last_updated"], errors="coerce")
+    return df
+
+
+def selections(index, countries):
+    t_min = pd.Timestamp(np.nanmin(index.times)).normalize()
+    t_max = pd.Timestamp(np.nanmax(index.times)).normalize() + pd.Timedelta(days=1)
+    month = t_min + pd.offsets.MonthBegin(2)
+    return {
+        "5 countries, 1 month": (month, month + pd.offsets.MonthBegin(1), countries[:5]),
+        "5 countries, full range": (t_min, t_max, countries[:5]),
+        "all countries, 1 week": (month, month + pd.Timedelta(days=7), None),
+    }
+
+
+def rank_error(items, rows, metric, country):
+    """Largest distance between an asked quantile and the exact rank range of the sketch's answer."""
+    probs = np.linspace(0.01, 0.99, 99)
+    worst = 0.0
+    for name, q in quantile_sketch.quantiles(items, probs, rollups.COUNTRY_COL).groupby(rollups.COUNTRY_COL):
+        # Compared at float32, the precision the store keeps
+        exact = np.sort(rows.loc[rows[country].astype(str) == name, metric].dropna().to_numpy(dtype=np.float32))
+        value = q["value"].to_numpy(dtype=np.float32)
+        below = np.searchsorted(exact, value, side="left") / len(exact)
+        upto = np.searchsorted(exact, value, side="right") / len(exact)
+        worst = max(worst, float(np.maximum(below - probs, probs - upto).max()))
+    return worst
+
+
+def bubble_points(cube, index, start, end, countries, metric, budget):
+    # As the bubble map: stored months plus the edge days binned from rows, regrouped to the budget
+    # Cube days are inclusive; the selection ends before ``end``
+    month_cells, edges = rollups.select_grid(cube, start.date(), (end - pd.Timedelta(days=1)).date(), countries)
+    parts = [] if month_cells is None else [month_cells]
+    parts += [spatial_grid.partial_grid(index.slice(lo, hi, countries), metric) for lo, hi in edges]
+    return spatial_grid.map_points(pd.concat(parts, ignore_index=True), budget)[0]
+
+
+def bench_dashboard(out, store, cube_dir, fmt, repeat, budget):
+    results, accuracy = {}, {}
+
+    def record(name, seconds, rows=None):
+        results[name] = {"seconds": seconds, "rows": rows}
+
+    columns = pd.read_csv(out, nrows=0).columns.tolist() if fmt == "csv" else columnar_store.read_manifest(store)["columns"]
+    cols = weather_schema.detect_columns(columns)
+    dashboard_columns = [c for c in dict.fromkeys([
+        cols["country"], "location_name", "latitude", "longitude", "last_updated", cols["temp"], cols["hum"],
+        cols["wind"], cols["precip"], cols["pressure"], cols["condition"], cols["aqi"], cols["uv"], cols["cloud"],
+    ]) if c and c in columns]
+    country = cols["country"]
+
+    t0 = time.perf_counter()
+    df = load_dashboard_frame(out, store, fmt, dashboard_columns)
+    record("load", time.perf_counter() - t0, len(df))
+    t0 = time.perf_counter()
+    index = filter_index.SortedFrameIndex(df, "last_updated", country)
+    record("index.build", time.perf_counter() - t0, len(df))
+    del df
+    t0 = time.perf_counter()
+    shared = shared_dataset.share(index.frame, "bench", root="shared")
+    record("shared.write", time.perf_counter() - t0, len(index))
+    t_open, shared = best_of(lambda: shared_dataset.open_shared("bench", root="shared"), repeat)
+    record("shared.open", t_open, len(shared))
+    index = filter_index.SortedFrameIndex(shared, "last_updated", country, presorted=True)
+
+    cube = rollups.load_cube(cube_dir) if columnar_store.available() else None
+    countries = sorted(k for k in index.offsets if k is not None)
+    numeric = stats_service.numeric_columns(index.frame)
+    if cube is not None and cube["day"] is not None:
+        month = time_series.month_cells(cube, cols["temp"])
+        trends = time_series.TrendEngine(cols["temp"])
+        t0 = time.perf_counter()
+        trends.update(month[month["period"] < month["period"].max()])
+        record("trends.build", time.perf_counter() - t0, len(month))
+        # A prep run appending the latest month
+        t0 = time.perf_counter()
+        trends.update(month[month["period"] == month["period"].max()])
+        record("trends.update", time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        trends.series()
+        record("trends.series", time.perf_counter() - t0, len(trends.series()))
+    engines = [query_backend.open_store_backend(name, store, dashboard_columns, country)
+               for name in query_backend.available() if name != "pandas"] if fmt in ("parquet", "both") else []
+    for label, (start, end, chosen) in selections(index, countries).items():
+        def timed(name, fn):
+            seconds, value = best_of(fn, repeat)
+            record(f"{label}.{name}", seconds, len(value) if hasattr(value, "__len__") else None)
+            return value
+
+        # Cube days are inclusive; the selection ends before ``end``, so every backend answers the same query
+        last = (end - pd.Timedelta(days=1)).date()
+        rows = timed("filter", lambda: index.slice(start, end, chosen))
+        timed("timeline", lambda: downsample.binned_counts(rows["last_updated"], 50))
+        if cube is not None and cube["day"] is not None:
+            cells = timed("cube.select", lambda: rollups.select_cells(cube, start.date(), last, chosen))
+            timed("cube.country_means", lambda: rollups.country_means(cells, cols["temp"]))
+            hist = rollups.select_hist(cube, start.date(), last, chosen)
+            if cols["hum"] in cube["edges"]:
+                timed("cube.histogram", lambda: rollups.histogram(cube, hist, cols["hum"]))
+        if cube is not None and cube.get("sketch_day") is not None:
+            items = timed("sketch.select", lambda: rollups.select_sketch(cube, start.date(), last, chosen))
+            for m in cube["sketch_metrics"]:
+                part = items[items["metric"] == m]
+                timed(f"sketch.box.{m}", lambda: quantile_sketch.box_stats(part, rollups.COUNTRY_COL))
+                accuracy[f"{label}.{m}"] = rank_error(part, rows, m, country)
+        if {"latitude", "longitude"} <= set(index.frame.columns):
+            timed("map.grid", lambda: bubble_points(cube, index, start, end, chosen, cols["temp"], budget))
+        timed("downsample.lttb", lambda: downsample.reduce_series(rows, "last_updated", cols["pressure"], country,
+                                                                  budget))
+        timed("downsample.quantile", lambda: downsample.reduce_series(rows, None, cols["wind"], country, budget,
+                                                                      method="quantile"))
+        timed("extremes", lambda: extremes.flag(rows.dropna(subset=[cols["temp"]]), [cols["temp"]], country))
+        service = stats_service.StatsService()
+        args = (index, numeric, start, end, chosen, "bench")
+        t0 = time.perf_counter()
+        service.describe(*args)
+        record(f"{label}.describe.cold", time.perf_counter() - t0)
+        timed("describe.warm", lambda: service.describe(*args))
+        # The first corr() reuses the month moments describe() cached and recomputes the ragged edges
+        t0 = time.perf_counter()
+        service.corr(*args)
+        record(f"{label}.corr.cold", time.perf_counter() - t0)
+        timed("corr.warm", lambda: service.corr(*args))
+        # The same queries answered in place by each installed out-of-core engine
+        for engine in engines:
+            sel = (start, end, chosen)
+            timed(f"{engine.name}.filter", lambda: engine.rows(*sel))
+            timed(f"{engine.name}.country_means", lambda: engine.country_means(*sel, cols["temp"]))
+            timed(f"{engine.name}.histogram", lambda: engine.histogram(*sel, cols["hum"], 40))
+            timed(f"{engine.name}.extremes", lambda: engine.extremes(*sel, cols["temp"]))
+            timed(f"{engine.name}.describe", lambda: engine.describe(*sel, numeric))
+    return results, accuracy
+
+
+def flatten(result):
+    out = {f"prep.{k}": v["seconds"] for k, v in result["prep"].items()}
+    out.update({f"dashboard.{k}": v["seconds"] for k, v in result["dashboard"].items()})
+    return out
+
+
+def compare(current, baseline, max_slowdown):
+    """Print current/baseline ratios; returns the names slower than ``max_slowdown``."""
+    now, before = flatten(current), flatten(baseline)
+    slower = []
+    print(f"\n{'timing':<52}{'baseline':>11}{'current':>11}{'ratio':>8}")
+    for name in sorted(set(now) & set(before)):
+        ratio = now[name] / before[name] if before[name] else float("inf")
+        flag = ""
+        if max(now[name], before[name]) >= MIN_COMPARED_SECONDS and ratio > max_slowdown:
+            slower.append(name)
+            flag = "  ← slower"
+        print(f"{name:<52}{before[name] * 1e3:>9.2f}ms{now[name] * 1e3:>9.2f}ms{ratio:>7.2f}x{flag}")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="10k", help=f"Row count or one of {', '.join(synthetic.SIZES)}.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunksize", type=int, default=data_preparation.DEFAULT_CHUNKSIZE)
+    parser.add_argument("--format", choices=data_preparation.OUTPUT_FORMATS, default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=downsample.DEFAULT_BUDGET, help="Points per chart trace.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Where generated raw CSVs are kept for reuse.")
+    parser.add_argument("--results", default=RESULTS_DIR, help="Directory for the result JSON.")
+    parser.add_argument("--json", help="Write the result to this file instead.")
+    parser.add_argument("--compare", help="Earlier result JSON to compare against.")
+    parser.add_argument("--max-slowdown", type=float, default=1.25)
+    args = parser.parse_args()
+    rows = synthetic.parse_rows(args.rows)
+    fmt = args.format or data_preparation.default_format()
+
+    src = os.path.abspath(raw_csv(rows, args.seed, args.data_dir))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Prep side outputs with fixed relative paths (ISO lookup) stay out of the working tree
+        os.chdir(tmp)
+        try:
+            prep, out, store, cube_dir = bench_prep(src, args.chunksize, fmt)
+            dashboard, accuracy = bench_dashboard(out, store, cube_dir, fmt, args.repeat, args.budget)
+        finally:
+            os.chdir(cwd)
+
+    result = {
+        "meta": {
+            "commit": git_commit(), "rows": rows, "seed": args.seed, "format": fmt, "chunksize": args.chunksize,
+            "repeat": args.repeat, "time": pd.Timestamp.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+        "prep": prep,
+        "dashboard": dashboard,
+        "sketch_rank_error": accuracy,
+    }
+    print(f"{'prep stage':<52}{'seconds':>10}{'rows':>14}")
+    for name, s in prep.items():
+        print(f"{name:<52}{s['seconds']:>10.3f}{'' if s.get('rows') is None else format(s['rows'], ','):>14}")
+    print(f"\n{'dashboard':<52}{'ms':>10}{'rows':>14}")
+    for name, s in dashboard.items():
+        print(f"{name:<52}{s['seconds'] * 1e3:>10.2f}{'' if s['rows'] is None else format(s['rows'], ','):>14}")
+
+    print(f"\n{'sketch rank error':<52}{'max':>10}{'bound':>14}")
+    for name, err in accuracy.items():
+        print(f"{name:<52}{err:>10.4f}{quantile_sketch.RANK_ERROR:>14.4f}")
+
+    path = args.json or os.path.join(args.results, f"{result['meta']['commit']}-{rows}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2, default=str)
+    print(f"\nResults → {path}")
+
+    inaccurate = [name for name, err in accuracy.items() if err > quantile_sketch.RANK_ERROR]
+    if inaccurate:
+        sys.exit(f"Quantile sketches beyond the {quantile_sketch.RANK_ERROR:.1%} rank error bound: {', '.join(inaccurate)}")
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(result, json.load(f), args.max_slowdown)
+        if slower:
+            sys.exit(f"{len(slower)} timings slower than {args.max_slowdown:g}x the baseline")
+
+
+if __name__ == "__main__":
+    main()
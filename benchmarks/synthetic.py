@@ -0,0 +1,154 @@
+"""Synthetic raw data in the ``global-weather-repository.csv`` schema.
+
+Every column of the raw feed is generated, with fixed locations (one
+country, timezone and lat/lon each), epochs spread over a year, imperial
+columns converted from the metric ones, and the quirks the prep pipeline
+handles: a few missing readings and a small share of re-sent (exactly
+duplicated) rows. Output is deterministic for a given ``seed`` and written in
+chunks, so 50M-row files need no more memory than one chunk.
+
+    python benchmarks/synthetic.py --rows 1000000 --output data/synthetic.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+SIZES = {"10k": 10_000, "1m": 1_000_000, "50m": 50_000_000}
+START = pd.Timestamp("2024-05-16")
+DAYS = 365
+CONDITIONS = ["Sunny", "Partly cloudy", "Clear", "Mist", "Overcast", "Light rain", "Patchy rain nearby",
+              "Moderate rain", "Cloudy", "Fog", "Light drizzle", "Thundery outbreaks in nearby", "Light snow"]
+DIRECTIONS = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
+MOON_PHASES = ["New Moon", "Waxing Crescent", "First Quarter", "Waxing Gibbous", "Full Moon", "Waning Gibbous",
+               "Last Quarter", "Waning Crescent"]
+TIMEZONES = ["Europe/London", "America/New_York", "Asia/Kolkata", "Africa/Nairobi", "Asia/Tokyo",
+             "America/Sao_Paulo", "Australia/Sydney", "Europe/Moscow", "Asia/Dubai", "America/Mexico_City"]
+DUPLICATE_SHARE = 0.005
+MISSING_SHARE = 0.01
+# "07:42 AM" style label for every minute of the day (sunrise, moonset, ...)
+CLOCK = np.array([f"{(m // 60) % 12 or 12:02d}:{m % 60:02d} {'AM' if m < 720 else 'PM'}" for m in range(1440)],
+                 dtype=object)
+
+
+def _clock_times(rng, n, lo_hour, hi_hour):
+    return CLOCK[rng.integers(lo_hour * 60, hi_hour * 60, n)]
+
+
+class Locations:
+    """Fixed location table: about one location per 2,000 rows, at least one per country."""
+
+    def __init__(self, rows, seed=0, countries=195):
+        rng = np.random.default_rng(seed)
+        n = int(np.clip(rows // 2_000, countries, 100_000))
+        self.countries = np.array([f"Country {i:03d}" for i in range(countries)], dtype=object)
+        self.country = np.concatenate([np.arange(countries), rng.integers(0, countries, n - countries)])
+        self.name = np.array([f"Location {i:05d}" for i in range(n)], dtype=object)
+        self.lat = rng.uniform(-55, 70, countries)[self.country] + rng.normal(0, 2, n)
+        self.lon = rng.uniform(-170, 175, countries)[self.country] + rng.normal(0, 2, n)
+        self.timezone = np.array(TIMEZONES, dtype=object)[self.country % len(TIMEZONES)]
+        # Climate per location: warmer near the equator, with some local spread
+        self.base_temp = 28 - 0.45 * np.abs(self.lat) + rng.normal(0, 3, n)
+
+    def __len__(self):
+        return len(self.name)
+
+
+def chunk_frame(rng, loc, n):
+    """``n`` raw rows for random locations and times."""
+    i = rng.integers(0, len(loc), n)
+    epoch = START.value // 10**9 + rng.integers(0, DAYS * 86_400, n)
+    day_of_year = (epoch // 86_400) % 365
+    temp = (loc.base_temp[i] + 6 * np.sin(2 * np.pi * day_of_year / 365) + rng.normal(0, 4, n)).round(1)
+    feels = (temp + rng.normal(0, 2, n)).round(1)
+    wind_kph = rng.gamma(2, 6, n).round(1)
+    gust_kph = (wind_kph * rng.uniform(1.1, 1.8, n)).round(1)
+    pressure = rng.normal(1013, 7, n).round(0)
+    precip = np.where(rng.random(n) < 0.7, 0.0, rng.exponential(1.5, n)).round(2)
+    visibility = np.where(rng.random(n) < 0.85, 10.0, rng.uniform(1, 9, n).round(0))
+    humidity = rng.integers(5, 101, n).astype(float)
+    co = rng.gamma(2, 250, n).round(1)
+    pm25 = rng.gamma(1.5, 12, n).round(1)
+    df = pd.DataFrame({
+        "country": loc.countries[loc.country[i]],
+        "location_name": loc.name[i],
+        "latitude": loc.lat[i].round(2),
+        "longitude": loc.lon[i].round(2),
+        "timezone": loc.timezone[i],
+        "last_updated_epoch": epoch,
+        "last_updated": pd.to_datetime(epoch, unit="s").strftime("%Y-%m-%d %H:%M"),
+        "temperature_celsius": temp,
+        "temperature_fahrenheit": (temp * 9 / 5 + 32).round(1),
+        "condition_text": rng.choice(CONDITIONS, n),
+        "wind_mph": (wind_kph / 1.609344).round(1),
+        "wind_kph": wind_kph,
+        "wind_degree": rng.integers(0, 361, n),
+        "wind_direction": rng.choice(DIRECTIONS, n),
+        "pressure_mb": pressure,
+        "pressure_in": (pressure * 0.0295299830714).round(2),
+        "precip_mm": precip,
+        "precip_in": (precip / 25.4).round(2),
+        "humidity": humidity,
+        "cloud": rng.integers(0, 101, n),
+        "feels_like_celsius": feels,
+        "feels_like_fahrenheit": (feels * 9 / 5 + 32).round(1),
+        "visibility_km": visibility,
+        "visibility_miles": (visibility / 1.609344).round(0),
+        "uv_index": rng.uniform(0, 11, n).round(1),
+        "gust_mph": (gust_kph / 1.609344).round(1),
+        "gust_kph": gust_kph,
+        "air_quality_Carbon_Monoxide": co,
+        "air_quality_Ozone": rng.gamma(3, 20, n).round(1),
+        "air_quality_Nitrogen_dioxide": rng.gamma(1.5, 10, n).round(1),
+        "air_quality_Sulphur_dioxide": rng.gamma(1.2, 5, n).round(1),
+        "air_quality_PM2.5": pm25,
+        "air_quality_PM10": (pm25 * rng.uniform(1, 2.5, n)).round(1),
+        "air_quality_us-epa-index": np.clip((pm25 // 12).astype(int) + 1, 1, 6),
+        "air_quality_gb-defra-index": np.clip((pm25 // 6).astype(int) + 1, 1, 10),
+        "sunrise": _clock_times(rng, n, 4, 8),
+        "sunset": _clock_times(rng, n, 16, 21),
+        "moonrise": _clock_times(rng, n, 0, 24),
+        "moonset": _clock_times(rng, n, 0, 24),
+        "moon_phase": rng.choice(MOON_PHASES, n),
+        "moon_illumination": rng.integers(0, 101, n),
+    })
+    for col in ("humidity", "visibility_km"):
+        df.loc[rng.random(n) < MISSING_SHARE, col] = np.nan
+    # Re-sent observations: exact copies of earlier rows in the chunk
+    rows = np.arange(n)
+    dup = np.flatnonzero(rng.random(n) < DUPLICATE_SHARE)
+    dup = dup[dup > 0]
+    rows[dup] = rng.integers(0, dup)
+    return df.iloc[rows].reset_index(drop=True) if len(dup) else df
+
+
+def frames(rows, seed=0, chunk=500_000):
+    """Raw rows in consecutive chunks; the rows depend on ``seed`` and ``chunk``."""
+    rng = np.random.default_rng(seed)
+    loc = Locations(rows, seed)
+    for start in range(0, rows, chunk):
+        yield chunk_frame(rng, loc, min(chunk, rows - start))
+
+
+def write_csv(path, rows, seed=0, chunk=500_000):
+    for k, df in enumerate(frames(rows, seed, chunk)):
+        df.to_csv(path, index=False, mode="w" if k == 0 else "a", header=k == 0)
+    return path
+
+
+def parse_rows(value):
+    return SIZES.get(str(value).lower()) or int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="10k", help=f"Row count or one of {', '.join(SIZES)}.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="data/synthetic-weather.csv")
+    args = parser.parse_args()
+    write_csv(args.output, parse_rows(args.rows), args.seed)
+    print(f"✅ {parse_rows(args.rows):,} rows → {args.output}")
+
+
+if __name__ == "__main__":
+    main()
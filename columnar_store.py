@@ -0,0 +1,278 @@
+"""Columnar (Parquet) store for the cleaned weather dataset.
+
+The store is a directory of Parquet files partitioned by ``year_month``
+(hive style, ``year_month=2024-05/part-00000-0.parquet``) plus a small
+``_manifest.json`` so readers can pick columns, months and slider bounds
+without opening any data file. Rows are stored compacted (see
+``compact_schema``): imperial unit columns are listed in the manifest but
+derived from their metric source when read.
+
+Each prep run writes a new version directory (``processed/store-000042``)
+and never touches an older one, so a reader still on the previous version
+keeps a complete store; old versions are removed once no reader uses them.
+"""
+import json
+import os
+import shutil
+
+import pandas as pd
+
+import compact_schema
+import timestamps
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:  # pyarrow is optional; the CSV path keeps working without it
+    pa = None
+    ds = None
+
+STORE_PATH = "processed/cleaned_weather.parquet"
+VERSIONS_DIR = "processed"
+VERSION_PREFIX = "store-"
+# Store versions kept on disk by a prep run: the one it wrote and the one being served
+MAX_VERSIONS = 2
+MANIFEST_NAME = "_manifest.json"  # leading underscore keeps pyarrow from scanning it
+PARTITION_COL = "year_month"
+CATEGORY_COLS = compact_schema.CATEGORY_COLS
+TIMESTAMP_COLS = ["last_updated"]
+
+
+def available():
+    return pa is not None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for the columnar store (pip install pyarrow)")
+
+
+def to_store_schema(df, dtypes=None, derived=None):
+    """Typed, compacted copy of ``df``: native timestamps, categories, float32/int16 metrics.
+
+    ``dtypes`` and ``derived`` pin the layout chosen for the first chunk so
+    every file in the store has the same schema.
+    """
+    df = df.drop(columns=[c for c in (derived if derived is not None else compact_schema.derivable(df.columns))
+                          if c in df.columns])
+    for c in TIMESTAMP_COLS:
+        if c in df.columns and not pd.api.types.is_datetime64_any_dtype(df[c]):
+            epoch = df[timestamps.EPOCH_COL] if timestamps.EPOCH_COL in df.columns else None
+            df = df.assign(**{c: timestamps.parse(df[c], epoch=epoch)})
+    df = compact_schema.cast(df, dtypes if dtypes is not None else compact_schema.compact_dtypes(df))
+    if PARTITION_COL in df.columns:
+        df = df.assign(**{PARTITION_COL: df[PARTITION_COL].astype(str)})
+    return df
+
+
+def partition_keys(df):
+    if PARTITION_COL in df.columns:
+        return df[PARTITION_COL].astype(str)
+    for c in TIMESTAMP_COLS:
+        if c in df.columns:
+            return df[c].dt.to_period("M").astype(str)
+    return pd.Series("all", index=df.index)
+
+
+class StoreWriter:
+    """Writes frames (one or many chunks) into a partitioned store.
+
+    A fresh writer replaces any existing store; ``append=True`` continues the
+    store described by its manifest.
+    """
+
+    def __init__(self, root=STORE_PATH, append=False):
+        _require_pyarrow()
+        self.root = root
+        manifest = read_manifest(root) if append else None
+        if manifest is None:
+            if os.path.isdir(root):
+                shutil.rmtree(root)
+            os.makedirs(root)
+            manifest = {}
+        self.parts = manifest.get("parts", 0)
+        self.rows = manifest.get("rows", 0)
+        self.columns = manifest.get("columns")
+        self.dtypes = manifest.get("dtypes")
+        self.derived = manifest.get("derived")
+        self.written = self.bytes_in = self.bytes_out = 0
+        self.months = set(manifest.get("months", []))
+        self.countries = set(manifest.get("countries", []))
+        self.time_range = manifest.get("time_range")
+
+    def write(self, df, replace=False):
+        """Append ``df``; with ``replace=True`` its partitions overwrite the stored ones."""
+        if self.columns is None:
+            self.columns = df.columns.tolist()
+        if self.derived is None:
+            self.derived = compact_schema.derivable(df.columns)
+        typed = to_store_schema(df, self.dtypes, self.derived)
+        if self.dtypes is None:
+            self.dtypes = {c: str(t) for c, t in typed.dtypes.items()}
+        self.bytes_in += df.memory_usage(index=False, deep=True).sum()
+        self.bytes_out += typed.memory_usage(index=False, deep=True).sum()
+        self.written += len(df)
+        keys = partition_keys(typed)
+        if PARTITION_COL not in typed.columns:
+            typed[PARTITION_COL] = keys
+        self._track(typed, keys)
+
+        table = pa.Table.from_pandas(typed, preserve_index=False)
+        ds.write_dataset(
+            table, self.root, format="parquet",
+            partitioning=ds.partitioning(pa.schema([(PARTITION_COL, pa.string())]), flavor="hive"),
+            basename_template=f"part-{self.parts:05d}-{{i}}.parquet",
+            existing_data_behavior="delete_matching" if replace else "overwrite_or_ignore",
+        )
+        self.parts += 1
+        self.rows += len(df)
+
+    def _track(self, typed, keys):
+        self.months.update(keys.dropna().unique().tolist())
+        if "country" in typed.columns:
+            self.countries.update(typed["country"].dropna().unique().tolist())
+        for c in TIMESTAMP_COLS:
+            if c in typed.columns and typed[c].notna().any():
+                lo, hi = typed[c].min(), typed[c].max()
+                if self.time_range is not None:
+                    lo = min(lo, pd.Timestamp(self.time_range[0]))
+                    hi = max(hi, pd.Timestamp(self.time_range[1]))
+                self.time_range = [lo.isoformat(), hi.isoformat()]
+
+    def close(self, rows=None):
+        manifest = {
+            "rows": self.rows if rows is None else rows,
+            "parts": self.parts,
+            "columns": self.columns or [],
+            "dtypes": self.dtypes or {},
+            "derived": self.derived or {},
+            "months": sorted(self.months),
+            "countries": sorted(self.countries),
+            "time_range": self.time_range,
+        }
+        with open(os.path.join(self.root, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+
+def read_manifest(root=STORE_PATH):
+    path = os.path.join(root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def version_dirs(root=VERSIONS_DIR):
+    """Store version directories under ``root``, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    names = [d for d in os.listdir(root) if d.startswith(VERSION_PREFIX) and d[len(VERSION_PREFIX):].isdigit()]
+    return [os.path.join(root, d) for d in sorted(names, key=lambda d: int(d[len(VERSION_PREFIX):]))]
+
+
+def next_version_path(root=VERSIONS_DIR):
+    dirs = version_dirs(root)
+    version = int(os.path.basename(dirs[-1])[len(VERSION_PREFIX):]) + 1 if dirs else 1
+    return os.path.join(root, f"{VERSION_PREFIX}{version:06d}")
+
+
+def is_version(path, root=VERSIONS_DIR):
+    return os.path.abspath(path) in {os.path.abspath(d) for d in version_dirs(root)}
+
+
+def link_store(src, dst):
+    """Copy the store at ``src`` to ``dst`` for an appending run, hard-linking the data files.
+
+    Appends only add new part files and replacements delete (unlink) old
+    ones, so linked files are never rewritten; the manifest, which ``close``
+    rewrites, is copied.
+    """
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    for parent, _, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(parent, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            if name.endswith(".parquet"):
+                try:
+                    os.link(os.path.join(parent, name), os.path.join(target, name))
+                    continue
+                except OSError:  # another filesystem, or no hard links
+                    pass
+            shutil.copy2(os.path.join(parent, name), os.path.join(target, name))
+
+
+def evict_versions(root=VERSIONS_DIR, keep=MAX_VERSIONS, keep_paths=()):
+    """Remove all but the newest ``keep`` version directories, and never one of ``keep_paths``."""
+    kept = {os.path.abspath(p) for p in keep_paths if p}
+    for path in version_dirs(root)[:-keep or None]:
+        if os.path.abspath(path) not in kept:
+            # Processes still reading these files keep them open until they let go (POSIX)
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def drop_version(path, current=None, root=VERSIONS_DIR):
+    """Remove the version directory ``path`` once its readers are done, unless it is ``current``."""
+    if path and is_version(path, root) and not (current and os.path.abspath(current) == os.path.abspath(path)):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def numeric_columns(manifest, columns=None):
+    """Numeric (non-boolean) columns of the store described by ``manifest``, derived ones included."""
+    derived = manifest.get("derived", {})
+    dtypes = {c: pd.api.types.pandas_dtype(t) for c, t in manifest.get("dtypes", {}).items()}
+    return [c for c in (manifest.get("columns", []) if columns is None else columns) if c in derived or c in dtypes
+            and pd.api.types.is_numeric_dtype(dtypes[c]) and not pd.api.types.is_bool_dtype(dtypes[c])]
+
+
+def months_in_range(months, start, end):
+    lo, hi = pd.Timestamp(start).strftime("%Y-%m"), pd.Timestamp(end).strftime("%Y-%m")
+    return [m for m in months if lo <= m <= hi]
+
+
+def read_store(root=STORE_PATH, columns=None, months=None, where=None):
+    """Load the store, projecting ``columns`` and pruning to ``months`` partitions.
+
+    ``where`` is an extra pyarrow filter expression pushed into the scan.
+    Derived (imperial) columns are computed from their stored metric source.
+    """
+    _require_pyarrow()
+    manifest = read_manifest(root) or {}
+    stored = manifest.get("columns")
+    derived = manifest.get("derived", {})
+    if columns is None:
+        columns = stored
+    elif stored is not None:
+        columns = [c for c in columns if c in stored]
+    physical = None
+    if columns is not None:
+        physical = list(dict.fromkeys(derived.get(c, c) for c in columns))
+
+    dataset = ds.dataset(root, format="parquet", partitioning=ds.partitioning(
+        pa.schema([(PARTITION_COL, pa.string())]), flavor="hive"))
+    flt = ds.field(PARTITION_COL).isin(list(months)) if months is not None else None
+    if where is not None:
+        flt = where if flt is None else flt & where
+    df = dataset.to_table(columns=physical, filter=flt).to_pandas()
+    if columns is None:
+        return df
+    return compact_schema.with_derived(df, columns)[columns]
+
+
+def read_selection(root=STORE_PATH, start=None, end=None, countries=None, country_col="country", columns=None):
+    """Rows of [start, end) in ``countries`` (all when empty) with every stored column, or ``columns``.
+
+    Month partitions outside the range are pruned and the time and country
+    filter is pushed into the scan, so only the selection is read.
+    """
+    _require_pyarrow()
+    manifest = read_manifest(root) or {}
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    # The end is exclusive
+    months = months_in_range(manifest.get("months", []), start, end - pd.Timedelta(1, "ns"))
+    time = ds.field(timestamps.TIME_COL)
+    where = (time >= pa.scalar(start.to_datetime64())) & (time < pa.scalar(end.to_datetime64()))
+    if countries and country_col:
+        where = where & ds.field(country_col).isin(list(countries))
+    return read_store(root, columns, months, where)
@@ -0,0 +1,99 @@
+"""Schema-driven dtype compaction for the cleaned weather data.
+
+Metrics become float32, bounded integer readings that are never mean-filled
+int16 and repeated strings categoricals. Imperial unit columns are not stored: they are recomputed from
+their metric source on demand (``with_derived``), rounded to the precision
+the upstream feed uses. The upstream converts from unrounded values, so a
+derived value can differ from the original by one unit in the last place.
+"""
+import numpy as np
+import pandas as pd
+
+# Imperial column -> (metric source, conversion, decimals)
+DERIVED_UNITS = {
+    "temperature_fahrenheit": ("temperature_celsius", lambda c: c * 9 / 5 + 32, 1),
+    "feels_like_fahrenheit": ("feels_like_celsius", lambda c: c * 9 / 5 + 32, 1),
+    "wind_mph": ("wind_kph", lambda k: k / 1.609344, 1),
+    "gust_mph": ("gust_kph", lambda k: k / 1.609344, 1),
+    "pressure_in": ("pressure_mb", lambda mb: mb * 0.0295299830714, 2),
+    "precip_in": ("precip_mm", lambda mm: mm / 25.4, 2),
+    "visibility_miles": ("visibility_km", lambda km: km / 1.609344, 0),
+}
+# Bounded integer readings that are never filled: prep drops rows missing a critical column
+# ("humid", "wind", ...) instead of filling them with the column mean
+INT16_COLS = ["humidity", "wind_degree"]
+# Integer readings prep fills with the (fractional) column mean: float32, so filled rows keep their value
+FILLED_INT_COLS = ["cloud", "moon_illumination", "air_quality_us-epa-index", "air_quality_gb-defra-index"]
+CATEGORY_COLS = ["country", "location_name", "timezone", "condition_text", "wind_direction", "moon_phase",
+                 "sunrise", "sunset", "moonrise", "moonset", "iso_code"]
+# Kept at full width: epochs overflow float32's 24-bit mantissa
+KEEP_COLS = ["last_updated_epoch"]
+
+
+def derivable(columns):
+    """Derived columns whose metric source is present in ``columns``."""
+    return {c: spec[0] for c, spec in DERIVED_UNITS.items() if c in columns and spec[0] in columns}
+
+
+def derive(df, column):
+    source, convert, decimals = DERIVED_UNITS[column]
+    return convert(df[source].astype("float64")).round(decimals).astype("float32")
+
+
+def with_derived(df, columns):
+    """Add the requested derived columns (in place) from their metric sources."""
+    for c in columns:
+        if c not in df.columns and c in DERIVED_UNITS and DERIVED_UNITS[c][0] in df.columns:
+            df[c] = derive(df, c)
+    return df
+
+
+def compact_dtypes(df):
+    """Target dtype per column, decided from the schema and the column's dtype (never from its values).
+
+    A float column stays float (float32) even when listed in ``INT16_COLS``:
+    monthly means and inputs with gaps are not integral.
+    """
+    dtypes = {}
+    for c, t in df.dtypes.items():
+        if c in KEEP_COLS:
+            continue
+        if c in CATEGORY_COLS and (t == object or pd.api.types.is_string_dtype(t)):
+            dtypes[c] = "category"
+        elif c in INT16_COLS and pd.api.types.is_integer_dtype(t):
+            dtypes[c] = "int16"
+        elif c in FILLED_INT_COLS and pd.api.types.is_numeric_dtype(t) and t != np.float32:
+            dtypes[c] = "float32"
+        elif pd.api.types.is_float_dtype(t) and t != np.float32:
+            dtypes[c] = "float32"
+    return dtypes
+
+
+def cast(df, dtypes):
+    out = {}
+    for c, t in dtypes.items():
+        if c not in df.columns or str(df[c].dtype) == t:
+            continue
+        col = df[c]
+        if t == "int16" and pd.api.types.is_float_dtype(col.dtype):
+            # A store pinned to int16 by its first chunk: never round a value to fit
+            v = col.to_numpy()
+            if np.isnan(v).any() or (v != np.round(v)).any():
+                raise ValueError(f"{c}: non-integral values do not fit the stored int16 schema")
+        out[c] = col.astype(t)
+    return df.assign(**out) if out else df
+
+
+def compact(df, drop_derived=True):
+    """Compact copy of ``df``; with ``drop_derived`` imperial columns are dropped."""
+    if drop_derived:
+        df = df.drop(columns=list(derivable(df.columns)))
+    return cast(df, compact_dtypes(df))
+
+
+def bytes_per_row(df):
+    return float(df.memory_usage(index=False, deep=True).sum()) / max(len(df), 1)
+
+
+def format_report(before, after):
+    return f"{before:,.0f} → {after:,.0f} bytes/row ({before / max(after, 1):.1f}x smaller)"
@@ -1,112 +1,773 @@
- feature/milestone2
-import pandas as pd
-import numpy as np
+import argparse
+import copy
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import columnar_store
+import compact_schema
+import dataset_registry
+import dedup
+import instrument
+import iso_lookup
+import prep_state
+import rollups
+
+# === Configuration ===
+RAW_PATH = "data/global-weather-repository.csv"
+OUT_DIR = "processed"
+OUT_PATH = os.path.join(OUT_DIR, "cleaned_weather.csv")
+STORE_PATH = columnar_store.STORE_PATH
+ROLLUP_DIR = rollups.ROLLUP_DIR
+ISO_LOOKUP_PATH = iso_lookup.LOOKUP_PATH
+OUTPUT_FORMATS = ["parquet", "csv", "both"]
+CRITICAL_KEYWORDS = ["temp", "humid", "precip", "wind"]
+GROUP_KEYS = ["year_month", "country"]
+DEFAULT_CHUNKSIZE = 100_000
 
-# === 1. Load Dataset ===
-file_path = "data/global-weather-repository.csv"
-df = pd.read_csv(file_path)
-print("✅ Data loaded successfully!")
-print("Shape:", df.shape)
-print(df.head())
 
-# === 2. Inspect Columns & Data Types ===
-print("\nColumn info:")
-print(df.info())
+def critical_columns(columns):
+    return [c for c in columns if any(k in c.lower() for k in CRITICAL_KEYWORDS)]
+
 
 # === 3. Handle Missing Values ===
-# Drop rows with missing critical weather data
-critical_cols = [c for c in df.columns if any(k in c.lower() for k in ["temp", "humid", "precip", "wind"])]
-df = df.dropna(subset=critical_cols, how="any")
+def drop_missing_critical(df):
+    # Drop rows with missing critical weather data
+    return df.dropna(subset=critical_columns(df.columns), how="any")
+
+
+def fill_missing(df, means):
+    # Fill remaining missing numeric values with column means
+    return df.fillna(means)
 
-# Fill remaining missing numeric values with column means
-df = df.fillna(df.mean(numeric_only=True))
 
 # === 4. Convert Temperature Units if needed ===
-if "temperature" in df.columns:
-    if df["temperature"].mean() > 100:  # likely Kelvin
+def convert_kelvin(df, temp_mean):
+    if "temperature" in df.columns and temp_mean > 100:  # likely Kelvin
         df["temperature"] = df["temperature"] - 273.15
+    return df
+
 
 # === 5. Normalize Temperature ===
-if "temperature" in df.columns:
-    df["temperature_norm"] = (df["temperature"] - df["temperature"].min()) / (
-        df["temperature"].max() - df["temperature"].min()
-    )
-
-# === 6. Convert Date & Aggregate to Monthly ===
-if "date" in df.columns:
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df["year_month"] = df["date"].dt.to_period("M")
-    monthly = df.groupby(["year_month", "country"], as_index=False).mean(numeric_only=True)
-else:
-    monthly = df.copy()
+def normalize_temperature(df, temp_min, temp_max):
+    if "temperature" in df.columns:
+        df["temperature_norm"] = (df["temperature"] - temp_min) / (temp_max - temp_min)
+    return df
+
+
+# === 6. Convert Date ===
+def add_year_month(df):
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"], errors="coerce")
+        df["year_month"] = df["date"].dt.to_period("M")
+    return df
+
 
 # === 7. Save Cleaned Data ===
-os.makedirs("processed", exist_ok=True)
-out_path = "processed/cleaned_weather.csv"
-monthly.to_csv(out_path, index=False)
-print(f"✅ Cleaned dataset saved → {out_path}")
+class OutputSink:
+    """Writes cleaned frames to the columnar store and/or the CSV export, chunk by chunk.
+
+    Country names are resolved to ISO-3 once per unique name into a persistent
+    lookup table; the store also gets the codes as a categorical ``iso_code``.
+    """
+
+    def __init__(self, out_path=OUT_PATH, store_path=STORE_PATH, fmt="parquet", append=False,
+                 iso_path=ISO_LOOKUP_PATH):
+        self.csv_path = out_path if fmt in ("csv", "both") else None
+        self.store = columnar_store.StoreWriter(store_path, append=append) if fmt in ("parquet", "both") else None
+        self.header = not (append and self.csv_path and os.path.exists(self.csv_path))
+        self.rows = None
+        self.iso_path = iso_path
+        self.iso_table = iso_lookup.load_lookup(iso_path) if iso_path else {}
+        if self.csv_path:
+            os.makedirs(os.path.dirname(self.csv_path) or ".", exist_ok=True)
+
+    def write(self, df, csv_text=None):
+        # csv_text: ``df`` already formatted without a header (parallel workers)
+        if "country" in df.columns:
+            with instrument.stage("write.iso"):
+                iso_lookup.update_lookup(self.iso_table, df["country"].unique())
+        if self.csv_path:
+            with instrument.stage("write.csv", rows=len(df)):
+                if csv_text is not None:
+                    with open(self.csv_path, "w" if self.header else "a", newline="") as f:
+                        if self.header:
+                            f.write(df.iloc[:0].to_csv(index=False))
+                        f.write(csv_text)
+                else:
+                    df.to_csv(self.csv_path, index=False, mode="w" if self.header else "a", header=self.header)
+        if self.store:
+            with instrument.stage("write.store", rows=len(df)):
+                self.store.write(self.with_iso_codes(df))
+        self.header = False
+
+    def replace(self, df, months=None):
+        # Small aggregate outputs: the CSV is rewritten, the store only for the given months
+        if "country" in df.columns:
+            iso_lookup.update_lookup(self.iso_table, df["country"].unique())
+        if self.csv_path:
+            df.to_csv(self.csv_path, index=False)
+        if self.store:
+            part = df if months is None else df[df[columnar_store.PARTITION_COL].astype(str).isin(months)]
+            self.store.write(self.with_iso_codes(part), replace=True)
+        self.header = False
+        self.rows = len(df)
+
+    def with_iso_codes(self, df):
+        if "country" not in df.columns:
+            return df
+        return df.assign(iso_code=iso_lookup.iso_codes(df["country"], self.iso_table))
+
+    @instrument.timed("write.close")
+    def close(self):
+        if self.csv_path and self.header:
+            pd.DataFrame().to_csv(self.csv_path, index=False)
+        if self.store:
+            self.store.close(rows=self.rows)
+            if self.store.written:
+                n = self.store.written
+                print("Store compaction:", compact_schema.format_report(self.store.bytes_in / n,
+                                                                         self.store.bytes_out / n))
+        if self.iso_path and self.iso_table:
+            iso_lookup.save_lookup(self.iso_table, self.iso_path)
+        for path in (self.store and self.store.root, self.csv_path):
+            if path:
+                print(f"✅ Cleaned dataset saved → {path}")
+
+
+@instrument.timed("rollups.save")
+def save_rollups(builder, rollup_dir):
+    if builder is not None and builder.save(rollup_dir):
+        print(f"✅ Rollup cube saved → {rollup_dir}")
+
+
+def default_format():
+    return "parquet" if columnar_store.available() else "csv"
+
 
 # === 8. Generate Summary ===
-summary = {
-    "num_rows": len(monthly),
-    "columns": monthly.columns.tolist(),
-    "missing_values": monthly.isna().sum().to_dict()
-}
+def print_summary(summary):
+    print("\n=== Summary ===")
+    for k, v in summary.items():
+        print(f"{k}: {v}")
 
-print("\n=== Summary ===")
-for k, v in summary.items():
-    print(f"{k}: {v}")
 
+# === 9. Sanity Ranges & Duplicates ===
+def range_filter(df):
+    if "temperature" in df.columns:
+        df = df[(df["temperature"] >= -90) & (df["temperature"] <= 60)]
+    if "humidity" in df.columns:
+        df = df[(df["humidity"] >= 0) & (df["humidity"] <= 100)]
+    if "precip_mm" in df.columns:
+        df = df[df["precip_mm"] >= 0]
+    return df
 
-df = df[(df["temperature"] >= -90) & (df["temperature"] <= 60)]
-df = df[(df["humidity"] >= 0) & (df["humidity"] <= 100)]
-if "precip_mm" in df.columns:
-    df = df[df["precip_mm"] >= 0]
 
-# Remove duplicate rows if any
-duplicate_count = df.duplicated().sum()
-print("Duplicate rows found:", duplicate_count)
-df = df.drop_duplicates()
+def run_batch(file_path=RAW_PATH, out_path=OUT_PATH, store_path=STORE_PATH, fmt="csv", rollup_dir=ROLLUP_DIR):
+    # === 1. Load Dataset ===
+    with instrument.stage("read") as info:
+        df = pd.read_csv(file_path)
+        info["rows"] = len(df)
+    print("✅ Data loaded successfully!")
+    print("Shape:", df.shape)
+    print(df.head())
 
-import pandas as pd
-import numpy as np
-import os
-file_path = "data/global-weather-repository.csv"
-df = pd.read_csv(file_path)
-print("Data loaded successfully!")
-print("Shape:", df.shape)
-print(df.head())
-print("\nColumn info:")
-print(df.info())
-critical_cols = [c for c in df.columns if any(k in c.lower() for k in ["temp", "humid", "precip", "wind"])]
-df = df.dropna(subset=critical_cols, how="any")
-df = df.fillna(df.mean(numeric_only=True))
-if "temperature" in df.columns:
-    if df["temperature"].mean() > 100:  # likely Kelvin
-        df["temperature"] = df["temperature"] - 273.15
-if "temperature" in df.columns:
-    df["temperature_norm"] = (df["temperature"] - df["temperature"].min()) / (
-        df["temperature"].max() - df["temperature"].min()
-    )
-if "date" in df.columns:
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df["year_month"] = df["date"].dt.to_period("M")
-    monthly = df.groupby(["year_month", "country"], as_index=False).mean(numeric_only=True)
-else:
-    monthly = df.copy()
-os.makedirs("processed", exist_ok=True)
-out_path = "processed/cleaned_weather.csv"
-monthly.to_csv(out_path, index=False)
-print(f"Cleaned dataset saved → {out_path}")
-summary = {
-    "num_rows": len(monthly),
-    "columns": monthly.columns.tolist(),
-    "missing_values": monthly.isna().sum().to_dict()
-}
-
-print("\n=== Summary ===")
-for k, v in summary.items():
-    print(f"{k}: {v}")
-
-main
+    # === 2. Inspect Columns & Data Types ===
+    print("\nColumn info:")
+    print(df.info())
+
+    with instrument.stage("clean") as info:
+        df = drop_missing_critical(df)
+        df = fill_missing(df, df.mean(numeric_only=True))
+        if "temperature" in df.columns:
+            df = convert_kelvin(df, df["temperature"].mean())
+            df = normalize_temperature(df, df["temperature"].min(), df["temperature"].max())
+        df = add_year_month(df)
+        info["rows"] = len(df)
+
+    with instrument.stage("aggregate"):
+        if "year_month" in df.columns:
+            monthly = df.groupby(GROUP_KEYS, as_index=False).mean(numeric_only=True)
+        else:
+            monthly = df.copy()
+
+    sink = OutputSink(out_path, store_path, fmt)
+    sink.write(monthly)
+    sink.close()
+    if rollup_dir and "year_month" not in monthly.columns and columnar_store.available():
+        with instrument.stage("rollups", rows=len(monthly)):
+            builder = rollups.RollupBuilder.for_frame(monthly)
+            builder.add(monthly)
+        save_rollups(builder, rollup_dir)
+
+    print_summary({
+        "num_rows": len(monthly),
+        "columns": monthly.columns.tolist(),
+        "missing_values": monthly.isna().sum().to_dict()
+    })
+
+    with instrument.stage("dedup", rows=len(df)):
+        df = range_filter(df)
+        # One hash per row instead of duplicated() plus drop_duplicates() each comparing every column
+        duplicate_count = dedup.count_duplicates([dedup.fingerprints(df)])
+    print("Duplicate rows found:", duplicate_count)
+    return monthly
+
+
+# ----------------------------------
+# Streaming mode: two passes over the CSV, one chunk in memory at a time.
+# Pass 1 collects the global statistics (dtypes, fill means, Kelvin mean,
+# temperature min/max); pass 2 applies them and either appends rows to the
+# output or merges partial (year_month, country) sums and counts.
+# ----------------------------------
+def _promote_dtype(a, b):
+    if a == b:
+        return a
+    if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+        return np.dtype("float64")
+    return np.dtype("object")
+
+
+def new_running_stats():
+    return {"rows": 0, "dtypes": {}, "sums": {}, "counts": {}, "mins": {}, "maxs": {},
+            "temp": {"sum": 0.0, "count": 0, "min": None, "max": None}}
+
+
+def update_running_stats(running, chunk):
+    # Plain floats/strings only, so the running stats round-trip through state.json
+    running["rows"] += len(chunk)
+    for col, dt in chunk.dtypes.items():
+        running["dtypes"][col] = str(_promote_dtype(np.dtype(running["dtypes"].get(col, dt)), dt))
+    chunk = drop_missing_critical(chunk)
+    num = chunk.select_dtypes(include="number")
+    for col, v in num.sum().items():
+        running["sums"][col] = running["sums"].get(col, 0.0) + float(v)
+    for col, v in num.count().items():
+        running["counts"][col] = running["counts"].get(col, 0) + int(v)
+    for col, v in num.min().dropna().items():
+        running["mins"][col] = min(running["mins"].get(col, float(v)), float(v))
+    for col, v in num.max().dropna().items():
+        running["maxs"][col] = max(running["maxs"].get(col, float(v)), float(v))
+    if "temperature" in chunk.columns and len(chunk):
+        t, temp = chunk["temperature"], running["temp"]
+        temp["sum"] += float(t.sum())
+        temp["count"] += int(t.count())
+        temp["min"] = float(t.min()) if temp["min"] is None else min(temp["min"], float(t.min()))
+        temp["max"] = float(t.max()) if temp["max"] is None else max(temp["max"], float(t.max()))
+    return running
+
+
+def finalize_stats(running):
+    # Columns that are numeric in some chunks but not others are not numeric overall
+    dtypes = {c: np.dtype(dt) for c, dt in running["dtypes"].items()}
+    numeric = [c for c, dt in dtypes.items() if pd.api.types.is_numeric_dtype(dt)]
+    sums, counts = pd.Series(running["sums"], dtype=float), pd.Series(running["counts"], dtype=float)
+    means = (sums / counts.replace(0, np.nan)).reindex(numeric)
+    temp = running["temp"]
+    temp_mean = temp["sum"] / temp["count"] if temp["count"] else np.nan
+    temp_min, temp_max = temp["min"], temp["max"]
+    mins, maxs = dict(running["mins"]), dict(running["maxs"])
+    if temp_mean > 100:
+        temp_min -= 273.15
+        temp_max -= 273.15
+        mins["temperature"], maxs["temperature"] = temp_min, temp_max
+    if temp["count"]:
+        mins["temperature_norm"], maxs["temperature_norm"] = 0.0, 1.0
+    return {
+        "rows": running["rows"],
+        "dtypes": {c: dt for c, dt in dtypes.items() if c in numeric},
+        "means": means,
+        "temp_mean": temp_mean,
+        "kelvin": bool(temp_mean > 100),
+        "temp_min": temp_min,
+        "temp_max": temp_max,
+        "mins": mins,
+        "maxs": maxs,
+    }
+
+
+@instrument.timed("scan")
+def scan_statistics(file_path, chunksize):
+    running = new_running_stats()
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        update_running_stats(running, chunk)
+    return running
+
+
+@instrument.timed("scan")
+def scan_new_rows(source, read_opts, running, seen, key):
+    """Pass 1 over the rows whose natural key ``seen`` does not have yet.
+
+    Admitted keys are added to ``seen``. Returns the per-chunk masks of
+    admitted rows (pass 2 reads the same chunks and applies them) and the
+    counts of rejected exact repeats and revised observations.
+    """
+    masks, exact, changed = [], 0, 0
+    for chunk in pd.read_csv(source, **read_opts):
+        keep, e, c = seen.admit(dedup.key_hashes(chunk, key), dedup.raw_fingerprints(chunk))
+        update_running_stats(running, chunk if keep.all() else chunk[keep])
+        masks.append(keep)
+        exact += e
+        changed += c
+    return masks, exact, changed
+
+
+def print_rejected(exact, changed):
+    print(f"Rows rejected as already seen: {exact + changed} ({changed} with revised values)")
+
+
+def clean_chunk(chunk, stats):
+    with instrument.stage("clean", rows=len(chunk)):
+        chunk = drop_missing_critical(chunk)
+        chunk = fill_missing(chunk, stats["means"])
+        if "temperature" in chunk.columns:
+            chunk = convert_kelvin(chunk, stats["temp_mean"])
+            chunk = normalize_temperature(chunk, stats["temp_min"], stats["temp_max"])
+        return add_year_month(chunk)
+
+
+def merge_partials(acc, part):
+    if acc is None:
+        return part
+    return acc.add(part, fill_value=0)
+
+
+@instrument.timed("aggregate")
+def monthly_partials(chunk):
+    num_cols = [c for c in chunk.select_dtypes(include="number").columns if c not in GROUP_KEYS]
+    grouped = chunk.groupby(GROUP_KEYS)[num_cols]
+    return grouped.sum(), grouped.count()
+
+
+def finalize_monthly(sums, counts, stats):
+    monthly = (sums / counts).sort_index().reset_index()
+    # mean((t - lo) / (hi - lo)) == (mean(t) - lo) / (hi - lo), so the norm follows the latest bounds
+    if "temperature_norm" in monthly.columns:
+        monthly = normalize_temperature(monthly, stats["temp_min"], stats["temp_max"])
+    return monthly
+
+
+@instrument.timed("dedup")
+def row_fingerprints(chunk):
+    return dedup.fingerprints(range_filter(chunk))
+
+
+def run_streaming(file_path=RAW_PATH, out_path=OUT_PATH, chunksize=DEFAULT_CHUNKSIZE, store_path=STORE_PATH, fmt="csv",
+                  state_dir=None, rollup_dir=ROLLUP_DIR, dedup_key=dedup.NATURAL_KEY):
+    # Cursor first: rows appended while this run is in progress are left for the next one
+    mark = prep_state.cursor(file_path) if state_dir else None
+
+    def source():
+        return prep_state.open_range(file_path, 0, mark["offset"]) if mark else file_path
+
+    # === 1. Load Dataset (pass 1: global statistics) ===
+    # With a state dir the run seeds the key set of incremental runs, so rows
+    # with an already-seen natural key are dropped here as they will be there
+    seen, masks = None, None
+    if state_dir:
+        seen = dedup.KeySet()
+        running = new_running_stats()
+        masks, exact, changed = scan_new_rows(source(), {"chunksize": chunksize}, running, seen, dedup_key)
+    else:
+        running = scan_statistics(source(), chunksize)
+    stats = finalize_stats(running)
+    print(f"✅ Data scanned in chunks of {chunksize:,} rows!")
+    print("Rows:", stats["rows"])
+
+    sink = OutputSink(out_path, store_path, fmt)
+    sums, counts = None, None
+    written, missing, columns = 0, None, None
+    hashes = []
+    max_epoch = None
+    builder = None
+
+    # === 3-6. Clean, convert, normalize (pass 2) ===
+    chunks = pd.read_csv(source(), chunksize=chunksize, dtype=stats["dtypes"])
+    for i, chunk in enumerate(instrument.timed_iter("read", chunks)):
+        if masks is not None and not masks[i].all():
+            chunk = chunk[masks[i]]
+        max_epoch = latest_epoch(chunk, max_epoch)
+        chunk = clean_chunk(chunk, stats)
+        if "year_month" in chunk.columns:
+            part_sums, part_counts = monthly_partials(chunk)
+            sums = merge_partials(sums, part_sums)
+            counts = merge_partials(counts, part_counts)
+        else:
+            # === 7. Save Cleaned Data (row-level, appended per chunk) ===
+            sink.write(chunk)
+            if rollup_dir and columnar_store.available():
+                if builder is None:
+                    metrics, hist = rollups.cube_metrics(chunk)
+                    edges = rollups.hist_edges(hist, stats["mins"], stats["maxs"])
+                    builder = rollups.RollupBuilder(metrics, hist, edges, rollups.grid_metric(chunk.columns))
+                with instrument.stage("rollups", rows=len(chunk)):
+                    builder.add(chunk)
+            columns = chunk.columns.tolist()
+            written += len(chunk)
+            part = chunk.isna().sum()
+            missing = part if missing is None else missing + part
+        hashes.append(row_fingerprints(chunk))
+
+    if sums is not None:
+        # === 7. Save Cleaned Data (merged monthly means) ===
+        monthly = finalize_monthly(sums, counts, stats)
+        sink.write(monthly)
+        written, columns, missing = len(monthly), monthly.columns.tolist(), monthly.isna().sum()
+    elif columns is None:
+        columns, missing = [], pd.Series(dtype=int)
+    sink.close()
+    save_rollups(builder, rollup_dir)
+
+    print_summary({
+        "num_rows": written,
+        "columns": columns,
+        "missing_values": missing.to_dict()
+    })
+    print("Duplicate rows found:", dedup.count_duplicates(hashes))
+
+    if state_dir:
+        print_rejected(exact, changed)
+        save_state(state_dir, file_path, mark, running, stats, max_epoch, sums, counts, seen, dedup_key)
+
+
+# ----------------------------------
+# Parallel mode: the two streaming passes with the chunks farmed out to a
+# process pool. The input is cut into the same row blocks the serial
+# streaming run reads (one per ``chunksize`` rows), workers parse, clean and
+# pre-aggregate their block, and the main process merges the per-block
+# results in block order. Every floating-point reduction therefore happens in
+# the serial order, so the output is byte-identical to ``--chunksize`` alone
+# for any number of workers.
+# ----------------------------------
+def merge_running_stats(running, part):
+    # Same operations, in the same order, as update_running_stats over the block's chunk
+    running["rows"] += part["rows"]
+    for col, dt in part["dtypes"].items():
+        running["dtypes"][col] = str(_promote_dtype(np.dtype(running["dtypes"].get(col, dt)), np.dtype(dt)))
+    for col, v in part["sums"].items():
+        running["sums"][col] = running["sums"].get(col, 0.0) + v
+    for col, v in part["counts"].items():
+        running["counts"][col] = running["counts"].get(col, 0) + v
+    for col, v in part["mins"].items():
+        running["mins"][col] = min(running["mins"].get(col, v), v)
+    for col, v in part["maxs"].items():
+        running["maxs"][col] = max(running["maxs"].get(col, v), v)
+    temp, t = running["temp"], part["temp"]
+    if t["count"] or t["min"] is not None:
+        temp["sum"] += t["sum"]
+        temp["count"] += t["count"]
+        temp["min"] = t["min"] if temp["min"] is None else min(temp["min"], t["min"])
+        temp["max"] = t["max"] if temp["max"] is None else max(temp["max"], t["max"])
+    return running
+
+
+def _read_block(file_path, block, columns, dtypes=None):
+    return pd.read_csv(prep_state.open_range(file_path, *block), header=None, names=columns, dtype=dtypes)
+
+
+def _scan_block(args):
+    file_path, block, columns = args
+    return update_running_stats(new_running_stats(), _read_block(file_path, block, columns))
+
+
+def latest_epoch(chunk, max_epoch=None):
+    """Largest ``last_updated_epoch`` seen so far; rows without an epoch don't count."""
+    if "last_updated_epoch" not in chunk.columns:
+        return max_epoch
+    latest = chunk["last_updated_epoch"].max()
+    if pd.isna(latest):
+        return max_epoch
+    return max(max_epoch or 0, int(latest))
+
+
+def _clean_block(args):
+    file_path, block, columns, stats, builder, with_csv = args
+    chunk = _read_block(file_path, block, columns, stats["dtypes"])
+    out = {"max_epoch": latest_epoch(chunk)}
+    chunk = clean_chunk(chunk, stats)
+    if "year_month" in chunk.columns:
+        out["partials"] = monthly_partials(chunk)
+    else:
+        out["frame"] = chunk
+        out["csv"] = chunk.to_csv(index=False, header=False) if with_csv else None
+        out["cube"] = builder.partials(chunk) if builder is not None else None
+    out["hashes"] = row_fingerprints(chunk)
+    return out
+
+
+def run_parallel(file_path=RAW_PATH, out_path=OUT_PATH, chunksize=DEFAULT_CHUNKSIZE, store_path=STORE_PATH,
+                 fmt="csv", workers=None, rollup_dir=ROLLUP_DIR):
+    columns = pd.read_csv(file_path, nrows=0).columns.tolist()
+    blocks = prep_state.row_blocks(file_path, chunksize)
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # === 1. Load Dataset (pass 1: global statistics, reduced in block order) ===
+        running = new_running_stats()
+        with instrument.stage("scan"):
+            for part in pool.map(_scan_block, [(file_path, b, columns) for b in blocks]):
+                merge_running_stats(running, part)
+        stats = finalize_stats(running)
+        print(f"✅ Data scanned in {len(blocks)} blocks of {chunksize:,} rows on {workers} workers!")
+        print("Rows:", stats["rows"])
+
+        # The cube layout follows the first cleaned block, as in the serial run
+        builder = None
+        if rollup_dir and columnar_store.available() and blocks:
+            first = clean_chunk(_read_block(file_path, blocks[0], columns, stats["dtypes"]), stats)
+            if "year_month" not in first.columns:
+                metrics, hist = rollups.cube_metrics(first)
+                builder = rollups.RollupBuilder(metrics, hist, rollups.hist_edges(hist, stats["mins"], stats["maxs"]),
+                                                rollups.grid_metric(first.columns))
+
+        sink = OutputSink(out_path, store_path, fmt)
+        sums, counts = None, None
+        written, missing, out_columns = 0, None, None
+        hashes = []
+        with_csv = sink.csv_path is not None
+
+        # === 3-6. Clean, convert, normalize (pass 2, merged in block order) ===
+        tasks = [(file_path, b, columns, stats, builder, with_csv) for b in blocks]
+        for res in pool.map(_clean_block, tasks):
+            if "partials" in res:
+                sums = merge_partials(sums, res["partials"][0])
+                counts = merge_partials(counts, res["partials"][1])
+            else:
+                # === 7. Save Cleaned Data (row-level, appended per block) ===
+                chunk = res["frame"]
+                sink.write(chunk, res["csv"])
+                if builder is not None:
+                    with instrument.stage("rollups", rows=len(chunk)):
+                        builder.add_partials(res["cube"])
+                out_columns = chunk.columns.tolist()
+                written += len(chunk)
+                part = chunk.isna().sum()
+                missing = part if missing is None else missing + part
+            hashes.append(res["hashes"])
+
+    if sums is not None:
+        # === 7. Save Cleaned Data (merged monthly means) ===
+        monthly = finalize_monthly(sums, counts, stats)
+        sink.write(monthly)
+        written, out_columns, missing = len(monthly), monthly.columns.tolist(), monthly.isna().sum()
+    elif out_columns is None:
+        out_columns, missing = [], pd.Series(dtype=int)
+    sink.close()
+    save_rollups(builder, rollup_dir)
+
+    print_summary({
+        "num_rows": written,
+        "columns": out_columns,
+        "missing_values": missing.to_dict()
+    })
+    print("Duplicate rows found:", dedup.count_duplicates(hashes))
+
+
+# ----------------------------------
+# Incremental mode: only the bytes appended since the last run are read.
+# The running statistics are updated with the new rows, new rows are cleaned
+# with the updated statistics, and only the touched (year_month, country)
+# aggregates are recomputed. Fill values of earlier rows stay as they were
+# written; anything that would change earlier output (a dtype promotion, the
+# Kelvin decision, or temperature bounds for row-level output) triggers a full
+# streaming rebuild instead. New rows whose natural key was consumed before
+# are rejected against the persisted key set without rereading history.
+# ----------------------------------
+@instrument.timed("state.save")
+def save_state(state_dir, file_path, mark, running, stats, max_epoch, sums, counts, seen, dedup_key):
+    prep_state.save({
+        "input": os.path.abspath(file_path),
+        "columns": list(running["dtypes"]),
+        "dedup_key": list(dedup_key),
+        "cursor": mark,
+        "max_epoch": max_epoch,
+        "kelvin": stats["kelvin"],
+        "temp_bounds": [stats["temp_min"], stats["temp_max"]],
+        "monthly": sums is not None,
+        "running": running,
+    }, state_dir)
+    if sums is not None:
+        prep_state.save_partials(sums, counts, state_dir)
+    prep_state.save_keys(seen, state_dir)
+
+
+def outputs_exist(state, out_path, store_path, fmt, rollup_dir):
+    if fmt in ("csv", "both") and not os.path.exists(out_path):
+        return False
+    if fmt in ("parquet", "both") and columnar_store.read_manifest(store_path) is None:
+        return False
+    if rollup_dir and not state["monthly"] and columnar_store.available() and rollups.load_cube(rollup_dir) is None:
+        return False
+    return True
+
+
+def rebuild_reason(state, stats):
+    old = finalize_stats(state["running"])
+    if old["dtypes"] != stats["dtypes"]:
+        return "column dtypes changed"
+    if old["kelvin"] != stats["kelvin"]:
+        return "Kelvin detection changed"
+    if not state["monthly"] and [stats["temp_min"], stats["temp_max"]] != state["temp_bounds"]:
+        return "temperature bounds moved"
+    return None
+
+
+def run_incremental(file_path=RAW_PATH, out_path=OUT_PATH, chunksize=DEFAULT_CHUNKSIZE, store_path=STORE_PATH, fmt="csv",
+                    state_dir=prep_state.STATE_DIR, rollup_dir=ROLLUP_DIR, dedup_key=dedup.NATURAL_KEY):
+    with instrument.stage("state.load"):
+        state = prep_state.load(state_dir)
+        seen = prep_state.load_keys(state_dir)
+    if (state is None or seen is None or state["input"] != os.path.abspath(file_path)
+            or not prep_state.is_append_of(state, file_path)
+            or not outputs_exist(state, out_path, store_path, fmt, rollup_dir)):
+        print("ℹ️ No usable prep state for this input — running a full streaming pass.")
+        prep_state.clear(state_dir)
+        return run_streaming(file_path, out_path, chunksize, store_path, fmt, state_dir, rollup_dir, dedup_key)
+    if state.get("dedup_key") != list(dedup_key):
+        print("ℹ️ Deduplication key changed — running a full streaming pass.")
+        prep_state.clear(state_dir)
+        return run_streaming(file_path, out_path, chunksize, store_path, fmt, state_dir, rollup_dir, dedup_key)
+
+    mark = prep_state.cursor(file_path)
+    start = state["cursor"]["offset"]
+    if mark["offset"] <= start:
+        print("✅ No new observations since the last run.")
+        return
+    read_opts = {"header": None, "names": state["columns"], "chunksize": chunksize}
+
+    # === 1. Load Dataset (new bytes only; reject seen keys, update running statistics) ===
+    running = copy.deepcopy(state["running"])
+    masks, exact, changed = scan_new_rows(prep_state.open_range(file_path, start, mark["offset"]), read_opts, running,
+                                          seen, dedup_key)
+    stats = finalize_stats(running)
+    reason = rebuild_reason(state, stats)
+    if reason:
+        print(f"ℹ️ {reason} — running a full streaming pass.")
+        prep_state.clear(state_dir)
+        return run_streaming(file_path, out_path, chunksize, store_path, fmt, state_dir, rollup_dir, dedup_key)
+    print(f"✅ Read {mark['offset'] - start:,} new bytes after offset {start:,}.")
+
+    sink = OutputSink(out_path, store_path, fmt, append=True)
+    sums, counts = prep_state.load_partials(state_dir)
+    touched = set()
+    hashes = []
+    max_epoch = state["max_epoch"]
+    added = 0
+    cube = rollups.load_cube(rollup_dir) if rollup_dir and columnar_store.available() else None
+    builder = rollups.RollupBuilder(cube["metrics"], cube["hist_metrics"], cube["edges"],
+                                    cube.get("grid_metric"), cube.get("sketch_metrics", [])) if cube else None
+
+    # === 3-6. Clean, convert, normalize (new rows) ===
+    chunks = pd.read_csv(prep_state.open_range(file_path, start, mark["offset"]), dtype=stats["dtypes"], **read_opts)
+    for keep, chunk in zip(masks, instrument.timed_iter("read", chunks)):
+        if not keep.all():
+            chunk = chunk[keep]
+        max_epoch = latest_epoch(chunk, max_epoch)
+        chunk = clean_chunk(chunk, stats)
+        added += len(chunk)
+        if state["monthly"]:
+            part_sums, part_counts = monthly_partials(chunk)
+            touched.update(part_sums.index.get_level_values("year_month").astype(str))
+            sums = merge_partials(sums, part_sums)
+            counts = merge_partials(counts, part_counts)
+        else:
+            sink.write(chunk)
+            if builder is not None:
+                with instrument.stage("rollups", rows=len(chunk)):
+                    builder.add(chunk)
+        hashes.append(row_fingerprints(chunk))
+
+    if state["monthly"] and sums is not None:
+        # Norm bounds moved: every month's temperature_norm changes, so all months are rewritten
+        if [stats["temp_min"], stats["temp_max"]] != state["temp_bounds"]:
+            touched = None
+        monthly = finalize_monthly(sums, counts, stats)
+        sink.replace(monthly, touched)
+    sink.close()
+    if builder is not None:
+        builder.merge_cube(cube)
+        save_rollups(builder, rollup_dir)
+
+    summary = {"new_rows": added, "max_epoch": max_epoch}
+    if state["monthly"]:
+        summary["months_updated"] = "all" if touched is None else sorted(touched)
+    print_summary(summary)
+    print("Duplicate rows found:", dedup.count_duplicates(hashes))
+    print_rejected(exact, changed)
+    save_state(state_dir, file_path, mark, running, stats, max_epoch, sums, counts, seen, dedup_key)
+
+
+def new_store_version(previous=None):
+    """Directory for this run's store, next to (never over) the one the dashboard may be reading.
+
+    An incremental run passes the last completed store as ``previous`` and
+    starts from a linked copy of it.
+    """
+    store = columnar_store.next_version_path()
+    if previous and columnar_store.read_manifest(previous) is not None:
+        columnar_store.link_store(previous, store)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean and aggregate the global weather repository.")
+    parser.add_argument("--input", default=RAW_PATH)
+    parser.add_argument("--output", default=OUT_PATH, help="CSV export path.")
+    parser.add_argument("--store", default=None,
+                        help="Partitioned Parquet store directory (default: a new processed/store-<version> per run).")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=None,
+                        help="Output format (default: parquet when pyarrow is installed, else csv).")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Stream the input in chunks of this many rows instead of loading it whole.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Run the streaming passes on this many processes (implies streaming).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process rows appended since the last incremental run (implies streaming).")
+    parser.add_argument("--state-dir", default=prep_state.STATE_DIR, help="Where incremental runs keep their state.")
+    parser.add_argument("--dedup-key", default=",".join(dedup.NATURAL_KEY),
+                        help="Comma-separated natural key; incremental runs reject rows whose key was seen before "
+                             "(empty string: the whole row).")
+    parser.add_argument("--rollups", default=ROLLUP_DIR,
+                        help="Directory for the dashboard rollup cube (empty string to skip).")
+    parser.add_argument("--ready-marker", default=dataset_registry.READY_PATH,
+                        help="Marker replaced once every output is written; the dashboard reloads when it changes "
+                             "(empty string to skip).")
+    parser.add_argument("--timings", action="store_true", help="Print the time spent in each stage.")
+    parser.add_argument("--timing-log", default=None,
+                        help=f"Append a JSON line of stage timings to this file ('-' for stderr; default ${instrument.LOG_ENV}).")
+    args = parser.parse_args()
+    fmt = args.format or default_format()
+    dedup_key = [c for c in args.dedup_key.split(",") if c]
+
+    instrument.configure_logging(args.timing_log)
+    mode = ("incremental" if args.incremental else "parallel" if args.workers
+            else "streaming" if args.chunksize else "batch")
+    timings = instrument.start("prep", mode=mode, input=args.input, format=fmt)
+    # The store the dashboard serves until this run's marker replaces it
+    served = (dataset_registry.read_ready(args.ready_marker) or {}).get("store") if args.ready_marker else None
+    store = args.store or new_store_version(served if args.incremental else None)
+    if args.incremental:
+        run_incremental(args.input, args.output, args.chunksize or DEFAULT_CHUNKSIZE, store, fmt, args.state_dir,
+                        args.rollups, dedup_key)
+    elif args.workers:
+        run_parallel(args.input, args.output, args.chunksize or DEFAULT_CHUNKSIZE, store, fmt, args.workers,
+                     args.rollups)
+    elif args.chunksize:
+        run_streaming(args.input, args.output, args.chunksize, store, fmt, rollup_dir=args.rollups)
+    else:
+        run_batch(args.input, args.output, store, fmt, args.rollups)
+    # Last, after the store, CSV, rollups and ISO-3 table are all in place
+    if args.ready_marker:
+        dataset_registry.mark_ready(args.ready_marker, mode=mode, input=args.input,
+                                    store=store if fmt in ("parquet", "both") else None)
+    if not args.store:
+        columnar_store.evict_versions(keep_paths=[served, store])
+    timings.emit()
+    if args.timings:
+        print("\n=== Timings ===")
+        print(timings.format_table())
+
+
+if __name__ == "__main__":
+    main()
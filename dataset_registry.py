@@ -0,0 +1,174 @@
+"""Versioned registry of the prep outputs behind the running dashboard.
+
+A prep run writes its outputs (store, cleaned CSV, rollup cube, ISO-3 table)
+one after another and then, once all of them are in place, replaces the
+ready marker (``READY_PATH``); a dataset version is identified by that
+marker alone, so a poll between two outputs never sees a mix of versions.
+The store goes to a new directory per run, named in the marker (``store``),
+so the version a rerun holds stays on disk until it is retired.
+One ``Registry`` per server process polls the fingerprint from a daemon
+thread. When it changes, the new version is loaded and warmed on that thread,
+off the request path, and only then made current by swapping one reference. A rerun leases the version it starts with and uses
+it to the end, so a swap never changes data under a running rerun; the
+replaced version is retired once its last lease is released (or expires).
+"""
+import contextlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+READY_PATH = "processed/_ready.json"
+REFRESH_ENV = "CLIMATESCOPE_REFRESH_SECONDS"
+# Poll interval of the refresh thread; 0 turns background refreshes off
+REFRESH_SECONDS = 10.0
+# A rerun that never released its lease (stopped early) stops pinning its version after this long
+LEASE_SECONDS = 300.0
+logger = logging.getLogger("climatescope.refresh")
+
+
+def refresh_interval():
+    return float(os.environ.get(REFRESH_ENV, REFRESH_SECONDS))
+
+
+def file_fingerprint(paths):
+    """(path, mtime in ns) of each of ``paths`` that exists, or None when none do."""
+    stamps = []
+    for path in paths:
+        try:
+            stamps.append((path, os.stat(path).st_mtime_ns))
+        except OSError:
+            continue
+    return tuple(stamps) or None
+
+
+def mark_ready(path=READY_PATH, **info):
+    """Replace the ready marker at ``path`` (atomically) once every prep output is written."""
+    previous = read_ready(path) or {}
+    marker = dict(info, version=previous.get("version", 0) + 1, completed=datetime.now().isoformat())
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(marker, f, indent=2)
+    os.replace(tmp, path)
+    return marker
+
+
+def read_ready(path=READY_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class Registry:
+    """Current dataset version of a server process, refreshed in the background.
+
+    ``load(fingerprint)`` returns the dataset (a dict) for the outputs on disk;
+    the registry adds ``fingerprint`` and ``seq``, a number that grows with
+    every version. ``warm(dataset)`` runs before a version becomes current and
+    ``retire(dataset)`` once a replaced version is no longer leased.
+    """
+
+    def __init__(self, fingerprint, load, warm=None, retire=None, interval=None):
+        self._fingerprint = fingerprint
+        self._load = load
+        self._warm = warm
+        self._retire = retire
+        self.interval = refresh_interval() if interval is None else interval
+        self._lock = threading.Lock()
+        self._current = None
+        self._leases = {}
+        self._retired = []
+        self._seq = itertools.count(1)
+        self._tokens = itertools.count()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _open(self, fingerprint):
+        dataset = self._load(fingerprint)
+        dataset.update(fingerprint=fingerprint, seq=next(self._seq))
+        return dataset
+
+    def current(self):
+        # Only the very first version is loaded on a request; later ones arrive warm
+        with self._lock:
+            if self._current is None:
+                self._current = self._open(self._fingerprint())
+            return self._current
+
+    def lease(self):
+        """(dataset, token): the current version, pinned until ``release(token)``."""
+        dataset = self.current()
+        with self._lock:
+            token = next(self._tokens)
+            self._leases[token] = (dataset, time.monotonic() + LEASE_SECONDS)
+        return dataset, token
+
+    @contextlib.contextmanager
+    def leased(self):
+        """The current version for the body of a ``with`` block, released however the block ends."""
+        dataset, token = self.lease()
+        try:
+            yield dataset
+        finally:
+            self.release(token)
+
+    def release(self, token):
+        with self._lock:
+            self._leases.pop(token, None)
+            drained = self._drain()
+        self._retire_all(drained)
+
+    def _drain(self):
+        # Replaced versions no live lease points at; called with the lock held
+        now = time.monotonic()
+        self._leases = {t: lease for t, lease in self._leases.items() if lease[1] > now}
+        leased = {id(dataset) for dataset, _ in self._leases.values()}
+        drained = [d for d in self._retired if id(d) not in leased]
+        self._retired = [d for d in self._retired if id(d) in leased]
+        return drained
+
+    def _retire_all(self, datasets):
+        if self._retire is not None:
+            for dataset in datasets:
+                self._retire(dataset)
+
+    def refresh(self):
+        """Switch to the outputs on disk if a newer prep run completed; True when a new version became current."""
+        current = self.current()
+        fingerprint = self._fingerprint()
+        if fingerprint is None or fingerprint == current["fingerprint"]:
+            return False
+        dataset = self._open(fingerprint)
+        if self._warm is not None:
+            self._warm(dataset)
+        with self._lock:
+            self._retired.append(self._current)
+            self._current = dataset
+            drained = self._drain()
+        self._retire_all(drained)
+        logger.info("dataset version %s is current", dataset["seq"])
+        return True
+
+    def start(self):
+        """Start the refresh thread (once; not at all when the interval is 0)."""
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="dataset-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                # An unreadable output: keep serving the current version, retry next poll
+                logger.exception("dataset refresh failed")
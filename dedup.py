@@ -0,0 +1,99 @@
+"""Hash-based deduplication of weather observations.
+
+Every row gets a 64-bit hash of its natural key (``location_name`` and
+``last_updated_epoch`` by default) and a fingerprint of the whole row. A
+``KeySet`` holds the key hashes seen so far as a sorted array, with a 32-bit
+row fingerprint next to each, so an incoming row can be checked against all
+earlier rows with a binary search instead of a rescan: a known key with the
+same fingerprint is a re-sent observation, a known key with a different one a
+revised observation. The first occurrence of a key is kept either way.
+"""
+import numpy as np
+import pandas as pd
+
+NATURAL_KEY = ["location_name", "last_updated_epoch"]
+
+
+def fingerprints(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def raw_fingerprints(df):
+    # Raw chunks infer int or float per chunk (a gap turns ints into floats); hash numbers as float64
+    num = df.select_dtypes(include="number").columns
+    return fingerprints(df.astype(dict.fromkeys(num, "float64")) if len(num) else df)
+
+
+def key_hashes(df, key=NATURAL_KEY):
+    # Hashed like raw_fingerprints, so a key hashes the same whether its chunk read the epoch as int or float;
+    # inputs without the key columns fall back to the whole row as the key
+    if not key or any(c not in df.columns for c in key):
+        return raw_fingerprints(df)
+    return raw_fingerprints(df[list(key)])
+
+
+def count_duplicates(hashes):
+    # Row fingerprints (8 bytes per row) stand in for the full-frame duplicated()
+    all_hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+    return len(all_hashes) - len(np.unique(all_hashes))
+
+
+def _first_unique(keys):
+    # Positions of the first occurrence of each key, in input order
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+    return first
+
+
+class KeySet:
+    """Sorted key hashes with a compact row fingerprint per key."""
+
+    def __init__(self, keys=None, fps=None):
+        self.keys = np.empty(0, dtype=np.uint64) if keys is None else np.asarray(keys, dtype=np.uint64)
+        self.fps = np.empty(0, dtype=np.uint32) if fps is None else np.asarray(fps, dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys):
+        """Position of each key in the set, and whether it is present at all."""
+        pos = np.searchsorted(self.keys, keys)
+        found = np.zeros(len(keys), dtype=bool)
+        inside = pos < len(self.keys)
+        found[inside] = self.keys[pos[inside]] == keys[inside]
+        return pos, found
+
+    def admit(self, keys, fps):
+        """Mask of the rows to keep; kept rows are added to the set.
+
+        Returns ``(keep, exact, changed)``: rejected rows split into exact
+        repeats of an earlier row and rows whose key was seen with other values.
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        fps = np.asarray(fps, dtype=np.uint64).astype(np.uint32)
+        pos, found = self.lookup(keys)
+        same = np.zeros(len(keys), dtype=bool)
+        same[found] = self.fps[pos[found]] == fps[found]
+        keep = np.zeros(len(keys), dtype=bool)
+        new = np.flatnonzero(~found)
+        keep[new[_first_unique(keys[new])]] = True
+        self.add(keys[keep], fps[keep])
+        # Repeats inside the batch compare against the fingerprint of the row that was kept
+        repeat = ~found & ~keep
+        if repeat.any():
+            pos, _ = self.lookup(keys[repeat])
+            same[repeat] = self.fps[pos] == fps[repeat]
+        rejected = ~keep
+        return keep, int((rejected & same).sum()), int((rejected & ~same).sum())
+
+    def add(self, keys, fps):
+        # ``keys`` must be unique and not in the set yet (``admit`` guarantees both)
+        if not len(keys):
+            return
+        order = np.argsort(keys)
+        keys, fps = keys[order], np.asarray(fps, dtype=np.uint32)[order]
+        at = np.searchsorted(self.keys, keys)
+        self.keys, self.fps = np.insert(self.keys, at, keys), np.insert(self.fps, at, fps)
+
+    def copy(self):
+        return KeySet(self.keys.copy(), self.fps.copy())
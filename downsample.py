@@ -0,0 +1,100 @@
+"""Server-side downsampling for the dashboard charts.
+
+Plotly ships every point to the browser, so wide selections are reduced
+before plotting: line series with LTTB (Largest-Triangle-Three-Buckets) or
+per-bucket min/max, distributions with an evenly spaced quantile sample, and
+timelines as pre-binned counts. Series already within the budget are
+returned unchanged.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_BUDGET = 2000
+
+
+def _as_float(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return values.astype(np.float64)
+
+
+def lttb(x, y, n_out):
+    """Indices of the ``n_out`` points LTTB keeps; ``x`` must be sorted."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x, y = _as_float(x), _as_float(y)
+    # n_out - 2 buckets over the interior points; first and last points are always kept
+    bounds = np.append(np.linspace(1, n - 1, n_out - 1).astype(np.int64), n)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        nlo, nhi = bounds[i + 1], bounds[i + 2]
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+
+def minmax(y, n_out):
+    """Indices of the min and max of each of ``n_out // 2`` equal-count buckets, in order."""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    y = _as_float(y)
+    bucket = np.arange(n) * (n_out // 2) // n
+    order = np.lexsort((y, bucket))
+    first = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    last = np.r_[first[1:] - 1, n - 1]
+    return np.unique(np.concatenate([order[first], order[last]]))
+
+
+def quantile_sample(y, n_out):
+    """Indices of ``n_out`` points at evenly spaced ranks (keeps min, max and the shape)."""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    order = np.argsort(_as_float(y), kind="stable")
+    return np.sort(order[np.linspace(0, n - 1, n_out).round().astype(np.int64)])
+
+
+def reduce_series(df, x, y, group=None, budget=DEFAULT_BUDGET, method="lttb"):
+    """Cap every trace (one per ``group`` value) at ``budget`` points.
+
+    ``method`` is ``"lttb"`` or ``"minmax"`` for line charts (rows sorted by
+    ``x``) and ``"quantile"`` for distributions of ``y``.
+    """
+    df = df.dropna(subset=[c for c in (x, y) if c])
+    groups = df.groupby(group, observed=True, sort=False) if group else [(None, df)]
+    parts = []
+    for _, part in groups:
+        if x and method != "quantile":
+            part = part.sort_values(x, kind="stable")
+        if len(part) > budget:
+            if method == "lttb":
+                keep = lttb(part[x].to_numpy(), part[y].to_numpy(), budget)
+            elif method == "minmax":
+                keep = minmax(part[y].to_numpy(), budget)
+            else:
+                keep = quantile_sample(part[y].to_numpy(), budget)
+            part = part.iloc[keep]
+        parts.append(part)
+    return pd.concat(parts) if parts else df
+
+
+def binned_counts(times, nbins=50, weights=None):
+    """Pre-binned time histogram: bin centre, bin width (ms) and summed counts."""
+    t = pd.Series(times).to_numpy(dtype="datetime64[ns]")
+    ok = ~np.isnat(t)
+    v = t[ok].astype(np.int64)
+    if not len(v):
+        return pd.DataFrame({"bin": pd.to_datetime([]), "width_ms": [], "count": []})
+    w = None if weights is None else np.asarray(weights)[ok]
+    counts, edges = np.histogram(v, bins=nbins, range=(v.min(), v.max() if v.max() > v.min() else v.min() + 1),
+                                 weights=w)
+    return pd.DataFrame({"bin": pd.to_datetime((edges[:-1] + np.diff(edges) / 2).astype(np.int64)),
+                         "width_ms": np.diff(edges) / 1e6, "count": counts})
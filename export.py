@@ -0,0 +1,97 @@
+"""On-demand, chunked exports of the filtered data (Summary tab download).
+
+Files are written chunk by chunk to a small on-disk cache keyed by the
+filter selection, so only one chunk of text is held in memory at a time and
+a repeated download of the same selection is a file read. Each writer uses a
+temporary file of its own, so sessions exporting the same selection at once
+never write into each other's file; the last one to finish replaces the
+cached copy with identical content.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+
+import columnar_store
+import timestamps
+
+EXPORT_DIR = "processed/_exports"
+MAX_CACHED = 8
+DEFAULT_CHUNKSIZE = 100_000
+# Label -> (file suffix, MIME type)
+FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def available_formats():
+    return [f for f in FORMATS if f != "Parquet" or columnar_store.available()]
+
+
+def filter_key(*parts):
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _chunks(df, chunksize):
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def write_csv(df, path, compress=False, chunksize=DEFAULT_CHUNKSIZE):
+    opener = gzip.open if compress else open
+    with opener(path, "wt", encoding="utf-8", newline="") as f:
+        header = True
+        for chunk in _chunks(df, chunksize):
+            # Timestamps become text one chunk at a time
+            timestamps.as_text(chunk).to_csv(f, index=False, header=header)
+            header = False
+        if header:
+            df.to_csv(f, index=False)
+
+
+def write_parquet(df, path, chunksize=DEFAULT_CHUNKSIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(df, chunksize):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def _evict(root, keep):
+    files = sorted((os.path.join(root, f) for f in os.listdir(root) if not f.startswith(".")),
+                   key=os.path.getmtime, reverse=True)
+    for path in files[keep:]:
+        os.remove(path)
+
+
+def export_file(df, fmt, key, root=EXPORT_DIR, chunksize=DEFAULT_CHUNKSIZE):
+    """Path of the export for ``key`` in ``fmt``, written on first request."""
+    suffix = FORMATS[fmt][0]
+    path = os.path.join(root, f"{key}{suffix}")
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    os.makedirs(root, exist_ok=True)
+    # Dot-prefixed, so eviction never counts a file still being written
+    with tempfile.NamedTemporaryFile(dir=root, prefix=f".{key}", suffix=f"{suffix}.tmp", delete=False) as f:
+        tmp = f.name
+    try:
+        if fmt == "Parquet":
+            write_parquet(df, tmp, chunksize)
+        else:
+            write_csv(df, tmp, compress=fmt == "CSV (gzip)", chunksize=chunksize)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    _evict(root, MAX_CACHED)
+    return path
+
+
+def open_export(df, fmt, key, root=EXPORT_DIR, chunksize=DEFAULT_CHUNKSIZE):
+    """The export for ``key`` in ``fmt``, opened for reading (stays readable if evicted meanwhile)."""
+    return open(export_file(df, fmt, key, root, chunksize), "rb")
@@ -0,0 +1,71 @@
+"""Sorted (country, last_updated) index for the dashboard filters.
+
+The frame is sorted once by country then time and a per-country offset table
+is kept, so a date range + country selection is a couple of binary searches
+per country instead of full-length boolean masks. A single matching range is
+returned as a zero-copy slice; several ranges are gathered in one ``take``
+that touches only the selected rows.
+"""
+import numpy as np
+import pandas as pd
+
+
+class SortedFrameIndex:
+    def __init__(self, df, time_col="last_updated", country_col=None, presorted=False):
+        # presorted: ``df`` is already the ``frame`` of an index over the same columns and is used as is
+        self.time_col = time_col
+        self.country_col = country_col
+        if country_col:
+            col = df[country_col]
+            if isinstance(col.dtype, pd.CategoricalDtype):
+                codes, names = col.cat.codes.to_numpy(), col.cat.categories
+            else:
+                codes, names = pd.factorize(col, sort=True)
+        else:
+            codes, names = np.zeros(len(df), dtype=np.int64), pd.Index([None])
+
+        times = df[time_col].to_numpy(dtype="datetime64[ns]")
+        if presorted:
+            self.frame, self.times, codes = df, times, np.asarray(codes)
+        else:
+            order = np.lexsort((times, codes))
+            self.frame = df.iloc[order].reset_index(drop=True)
+            self.times = times[order]
+            codes = np.asarray(codes)[order]
+
+        # Offset table: country -> [lo, hi) in the sorted frame (missing countries have code -1)
+        present = np.unique(codes)
+        bounds = np.searchsorted(codes, np.append(present, present[-1] + 1 if len(present) else 0))
+        self.offsets = {}
+        for i, code in enumerate(present):
+            key = names[code] if code >= 0 else None
+            self.offsets[key] = (int(bounds[i]), int(bounds[i + 1]))
+
+    def __len__(self):
+        return len(self.frame)
+
+    def ranges(self, start, end, countries=None):
+        """Row ranges with ``start <= time < end`` for the given countries (all when empty)."""
+        keys = countries if countries else list(self.offsets)
+        lo_t, hi_t = np.datetime64(pd.Timestamp(start), "ns"), np.datetime64(pd.Timestamp(end), "ns")
+        out = []
+        for key in keys:
+            if key not in self.offsets:
+                continue
+            lo, hi = self.offsets[key]
+            seg = self.times[lo:hi]
+            a = lo + int(np.searchsorted(seg, lo_t, side="left"))
+            b = lo + int(np.searchsorted(seg, hi_t, side="left"))
+            if a < b:
+                out.append((a, b))
+        return out
+
+    def slice(self, start, end, countries=None):
+        ranges = self.ranges(start, end, countries)
+        if len(ranges) == 1:
+            a, b = ranges[0]
+            return self.frame.iloc[a:b]
+        if not ranges:
+            return self.frame.iloc[0:0]
+        rows = np.concatenate([np.arange(a, b) for a, b in sorted(ranges)])
+        return self.frame.take(rows)
@@ -0,0 +1,165 @@
+"""Lightweight stage timing for the prep pipeline and the dashboard.
+
+``with stage("name"):`` adds the block's wall time, the change in process
+RSS and (when the caller sets ``info["rows"]``) a row count to the current
+``Recorder``. Repeated stages (one per chunk, one per figure) are summed per
+name. Without a current recorder a stage costs one context-variable lookup,
+and with one it costs two clock reads and two ``/proc`` reads, so the timers
+can stay in place in production.
+
+A finished recorder is written as one JSON line to the ``climatescope.timing``
+logger; ``configure_logging`` (or the ``CLIMATESCOPE_TIMING_LOG`` environment
+variable: a file path, or ``-`` for stderr) gives that logger a destination.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import time
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; /proc is used on Linux and memory is skipped elsewhere
+    psutil = None
+
+LOG_ENV = "CLIMATESCOPE_TIMING_LOG"
+DEBUG_ENV = "CLIMATESCOPE_DEBUG"
+logger = logging.getLogger("climatescope.timing")
+
+_current = contextvars.ContextVar("climatescope_recorder", default=None)
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss():
+    """Resident set size of this process in bytes, or None where it cannot be read cheaply."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except (OSError, IndexError, ValueError):
+        if psutil is not None:
+            return psutil.Process().memory_info().rss
+        return None
+
+
+class Recorder:
+    """Per-name totals of the stages run while this recorder is current."""
+
+    def __init__(self, name, **context):
+        self.name = name
+        self.context = context
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def add(self, name, seconds, rows=None, mem_delta=None):
+        s = self.stages.setdefault(name, {"stage": name, "calls": 0, "seconds": 0.0, "rows": None,
+                                          "mem_delta_mb": None})
+        s["calls"] += 1
+        s["seconds"] += seconds
+        if rows is not None:
+            s["rows"] = (s["rows"] or 0) + int(rows)
+        if mem_delta is not None:
+            s["mem_delta_mb"] = (s["mem_delta_mb"] or 0.0) + mem_delta / 2**20
+
+    def records(self):
+        return list(self.stages.values())
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def emit(self):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"run": self.name, "time": time.time(), **self.context,
+                                    "total_seconds": round(self.elapsed(), 6), "rss_mb": _mb(rss()),
+                                    "stages": [_rounded(s) for s in self.records()]}, default=str))
+
+    def format_table(self):
+        lines = [f"{'stage':<28}{'calls':>7}{'seconds':>10}{'rows':>12}{'Δmem MB':>10}"]
+        for s in self.records():
+            rows = "" if s["rows"] is None else f"{s['rows']:,}"
+            mem = "" if s["mem_delta_mb"] is None else f"{s['mem_delta_mb']:+.1f}"
+            lines.append(f"{s['stage']:<28}{s['calls']:>7}{s['seconds']:>10.3f}{rows:>12}{mem:>10}")
+        lines.append(f"{'total':<28}{'':>7}{self.elapsed():>10.3f}")
+        return "\n".join(lines)
+
+
+def _mb(value):
+    return None if value is None else round(value / 2**20, 1)
+
+
+def _rounded(s):
+    out = dict(s, seconds=round(s["seconds"], 6))
+    if out["mem_delta_mb"] is not None:
+        out["mem_delta_mb"] = round(out["mem_delta_mb"], 2)
+    return out
+
+
+def start(name, **context):
+    """Make a new recorder current for this thread / context and return it."""
+    recorder = Recorder(name, **context)
+    _current.set(recorder)
+    return recorder
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """Time the block into the current recorder; set ``info["rows"]`` inside to record a row count."""
+    recorder = _current.get()
+    info = {"rows": rows}
+    if recorder is None:
+        yield info
+        return
+    mem = rss()
+    t0 = time.perf_counter()
+    try:
+        yield info
+    finally:
+        seconds = time.perf_counter() - t0
+        after = rss() if mem is not None else None
+        recorder.add(name, seconds, info["rows"], None if after is None else after - mem)
+
+
+def timed(name):
+    """Decorator form of ``stage``."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def timed_iter(name, iterable):
+    """Yield from ``iterable``, timing the production of each item (e.g. a CSV chunk) as ``name``."""
+    it = iter(iterable)
+    while True:
+        with stage(name) as info:
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            info["rows"] = len(item) if hasattr(item, "__len__") else None
+        yield item
+
+
+def configure_logging(target=None):
+    """Send the JSON timing lines to ``target`` (path or ``-``), by default ``$CLIMATESCOPE_TIMING_LOG``."""
+    target = target or os.environ.get(LOG_ENV)
+    if not target or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if target == "-" else logging.FileHandler(target)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def debug_enabled():
+    return os.environ.get(DEBUG_ENV, "") not in ("", "0")
@@ -0,0 +1,102 @@
+"""Country name -> ISO-3 lookup, resolved once per unique name.
+
+The prep stage keeps a small persistent table (``processed/iso3_lookup.csv``)
+so the dashboard never runs pycountry's fuzzy lookup per row. Names in the
+weather repository that pycountry does not know are mapped in ``ALIASES``.
+"""
+import functools
+import os
+
+import pandas as pd
+
+try:
+    import pycountry
+except ImportError:  # aliases still resolve; other names stay unresolved
+    pycountry = None
+
+LOOKUP_PATH = "processed/iso3_lookup.csv"
+
+ALIASES = {
+    "Brunei": "BRN",
+    "Burma": "MMR",
+    "Cape Verde": "CPV",
+    "Democratic Republic of Congo": "COD",
+    "East Timor": "TLS",
+    "Fiji Islands": "FJI",
+    "Holland": "NLD",
+    "Ivory Coast": "CIV",
+    "Kosovo": "XKX",
+    "Kyrghyzstan": "KGZ",
+    "Macedonia": "MKD",
+    "Micronesia": "FSM",
+    "Palestine": "PSE",
+    "Russia": "RUS",
+    "Seychelles Islands": "SYC",
+    "Swaziland": "SWZ",
+    "Turkey": "TUR",
+    "USA United States of America": "USA",
+    "Vatican City": "VAT",
+    # Localized names that appear in the upstream feed
+    "Bélgica": "BEL",
+    "Estonie": "EST",
+    "Inde": "IND",
+    "Jemen": "YEM",
+    "Komoren": "COM",
+    "Letonia": "LVA",
+    "Malásia": "MYS",
+    "Marrocos": "MAR",
+    "Mexique": "MEX",
+    "Polônia": "POL",
+    "Saudi Arabien": "SAU",
+    "Südkorea": "KOR",
+    "Turkménistan": "TKM",
+    "Гватемала": "GTM",
+    "Польша": "POL",
+    "Турция": "TUR",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def resolve(name):
+    if name in ALIASES:
+        return ALIASES[name]
+    if pycountry is None:
+        return None
+    try:
+        return pycountry.countries.lookup(name).alpha_3
+    except LookupError:
+        return None
+
+
+def load_lookup(path=LOOKUP_PATH):
+    if not os.path.exists(path):
+        return {}
+    table = pd.read_csv(path, keep_default_na=False)
+    return {c: (iso or None) for c, iso in zip(table["country"], table["iso_code"])}
+
+
+def save_lookup(table, path=LOOKUP_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    rows = sorted(table.items())
+    pd.DataFrame(rows, columns=["country", "iso_code"]).to_csv(path, index=False)
+
+
+def update_lookup(table, names):
+    """Resolve only the names not in ``table`` yet; returns the number added."""
+    added = 0
+    for name in names:
+        if isinstance(name, str) and name not in table:
+            table[name] = resolve(name)
+            added += 1
+    return added
+
+
+def iso_codes(countries, table):
+    """Categorical ISO-3 codes for a country column, one lookup per unique name."""
+    if isinstance(countries.dtype, pd.CategoricalDtype):
+        names = countries.cat.categories
+    else:
+        names = countries.dropna().unique()
+    mapping = {c: table[c] if c in table else resolve(c) for c in names}
+    # A categorical input is mapped through its categories, not row by row
+    return countries.map(mapping).astype("category")
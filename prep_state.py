@@ -0,0 +1,159 @@
+"""Persistent state for incremental runs of data_preparation.py.
+
+``state.json`` keeps the high-water mark of the raw CSV (byte offset of the
+last consumed line, a hash of the bytes before it and the max
+``last_updated_epoch`` seen) together with the running statistics used for
+filling and normalization. The monthly partial sums/counts live next to it in
+``monthly_partials.pkl`` and the natural-key hashes of every consumed row
+(see ``dedup.KeySet``) in ``seen_keys.npz``.
+"""
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import dedup
+
+STATE_DIR = "processed/_prep_state"
+STATE_FILE = "state.json"
+PARTIALS_FILE = "monthly_partials.pkl"
+KEYS_FILE = "seen_keys.npz"
+HASH_BYTES = 1 << 16
+
+
+def load(state_dir=STATE_DIR):
+    path = os.path.join(state_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(state, state_dir=STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    tmp = os.path.join(state_dir, STATE_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, os.path.join(state_dir, STATE_FILE))
+
+
+def load_partials(state_dir=STATE_DIR):
+    path = os.path.join(state_dir, PARTIALS_FILE)
+    if not os.path.exists(path):
+        return None, None
+    partials = pd.read_pickle(path)
+    return partials["sums"], partials["counts"]
+
+
+def save_partials(sums, counts, state_dir=STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    pd.to_pickle({"sums": sums, "counts": counts}, os.path.join(state_dir, PARTIALS_FILE))
+
+
+def load_keys(state_dir=STATE_DIR):
+    path = os.path.join(state_dir, KEYS_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        return dedup.KeySet(f["keys"], f["fps"])
+
+
+def save_keys(seen, state_dir=STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    tmp = os.path.join(state_dir, KEYS_FILE + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, keys=seen.keys, fps=seen.fps)
+    os.replace(tmp, os.path.join(state_dir, KEYS_FILE))
+
+
+def clear(state_dir=STATE_DIR):
+    for name in (STATE_FILE, PARTIALS_FILE, KEYS_FILE):
+        path = os.path.join(state_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _prefix_hash(f, offset):
+    # Hash the bytes just before the cursor; a rewritten or rotated file will not match
+    start = max(0, offset - HASH_BYTES)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+def cursor(file_path):
+    """Offset just past the last complete line, and the hash of the bytes before it."""
+    with open(file_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        offset = size
+        while offset > 0:
+            step = min(HASH_BYTES, offset)
+            f.seek(offset - step)
+            block = f.read(step)
+            nl = block.rfind(b"\n")
+            if nl >= 0:
+                offset = offset - step + nl + 1
+                break
+            offset -= step
+        return {"offset": offset, "hash": _prefix_hash(f, offset)}
+
+
+def is_append_of(state, file_path):
+    """True when ``file_path`` still starts with the bytes consumed by the last run."""
+    mark = state.get("cursor") or {}
+    offset = mark.get("offset", -1)
+    if offset < 0 or os.path.getsize(file_path) < offset:
+        return False
+    with open(file_path, "rb") as f:
+        return _prefix_hash(f, offset) == mark.get("hash")
+
+
+class _RangeReader(io.RawIOBase):
+    def __init__(self, file_path, start, end):
+        self.f = open(file_path, "rb")
+        self.f.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf):
+        data = self.f.read(min(len(buf), self.remaining))
+        buf[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def open_range(file_path, start, end):
+    """Binary stream over ``[start, end)`` of the file, read lazily like a normal file."""
+    return io.BufferedReader(_RangeReader(file_path, start, end))
+
+
+def row_blocks(file_path, rows_per_block, end=None, read_bytes=1 << 24):
+    """Byte ranges of consecutive ``rows_per_block``-row blocks after the header line.
+
+    Like ``cursor``, this assumes one row per line (no quoted newlines).
+    """
+    end = os.path.getsize(file_path) if end is None else end
+    starts = []
+    seen = 0  # newlines so far; the first one ends the header
+    with open(file_path, "rb") as f:
+        pos = 0
+        while pos < end:
+            buf = f.read(min(read_bytes, end - pos))
+            if not buf:
+                break
+            nl = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == 0x0A)
+            # Row r (0-based, after the header) starts just past newline number r
+            rows = seen + np.arange(len(nl))
+            cut = pos + nl[rows % rows_per_block == 0] + 1
+            starts.extend(int(c) for c in cut if c < end)
+            seen += len(nl)
+            pos += len(buf)
+    return list(zip(starts, starts[1:] + [end]))
@@ -0,0 +1,150 @@
+"""Mergeable KLL quantile sketches for the box and violin plots.
+
+A sketch is a set of retained values, each with a level: a value at level
+``h`` stands for ``2**h`` observations. New values enter at level 0; when a
+level holds more than its capacity, its values are sorted, paired off and one
+of each pair (the odd or the even ones, at random) moves up a level, which
+keeps every rank within ``2**h`` of the truth. Capacities shrink by ``DECAY``
+per level below the top (at least ``MIN_CAPACITY``), so a sketch keeps at
+most about ``3 * K`` values however many observations it summarizes, and
+cells with fewer than ``K`` values stay exact.
+
+Sketches are stored long, one row per retained value (``keys``, metric,
+level, value), and every operation works on many sketches at once, so the
+prep stage builds one per country x day and metric chunk by chunk, merges
+chunks by concatenating and compacting, and the dashboard reads any selection
+straight from the concatenated cells.
+
+Accuracy: with ``K = 200`` the rank of any quantile read from a merged
+sketch is within ``RANK_ERROR`` (1.5%) of the exact one (e.g. the reported
+median lies between the exact 48.5th and 51.5th percentiles); the benchmark
+suite checks this against exact pandas quantiles on every selection.
+"""
+import numpy as np
+import pandas as pd
+
+K = 200
+DECAY = 2 / 3
+MIN_CAPACITY = 8
+RANK_ERROR = 0.015
+# Outliers drawn per box; the rest are summarized by the whiskers
+MAX_OUTLIERS = 50
+COLUMNS = ["metric", "level", "value"]
+
+
+def _runs(sorted_ids):
+    # Start offset of each run of equal ids, run number and rank within the run per item
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]])
+    run = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(sorted_ids)]))
+    return starts, run, np.arange(len(sorted_ids)) - starts[run]
+
+
+def compact(items, keys=()):
+    """``items`` with every over-full level compacted, for all sketches (``keys`` + metric) at once."""
+    if items.empty:
+        return items
+    group = items.groupby(list(keys) + ["metric"], observed=True, sort=False).ngroup().to_numpy()
+    level = items["level"].to_numpy(dtype=np.int64)
+    value = items["value"].to_numpy(dtype=np.float64)
+    rows = np.arange(len(items))
+    # Seeded by the input so a rebuild gives the same sketch
+    rng = np.random.default_rng(len(items))
+    while True:
+        order = np.lexsort((value, level, group))
+        group, level, value, rows = group[order], level[order], value[order], rows[order]
+        starts, run, rank = _runs(group * 64 + level)
+        sizes = np.diff(np.r_[starts, len(group)])
+        group_starts, group_run, _ = _runs(group)
+        top = np.maximum.reduceat(level, group_starts)[group_run]
+        capacity = np.maximum(MIN_CAPACITY, np.ceil(K * DECAY ** (top - level))).astype(np.int64)
+        full = sizes[run] > capacity
+        if not full.any():
+            break
+        # Pairs of neighbours in an over-full level; an odd last value stays where it is
+        paired = full & (rank < sizes[run] - sizes[run] % 2)
+        keep = ~paired | (rank % 2 == rng.integers(0, 2, len(starts))[run])
+        level = np.where(paired, level + 1, level)[keep]
+        group, value, rows = group[keep], value[keep], rows[keep]
+    out = items.iloc[rows].copy()
+    out["level"] = level.astype(np.int8)
+    return out.reset_index(drop=True)
+
+
+def partial_sketch(df, metrics, keys=()):
+    """Sketches of ``metrics`` in ``df`` grouped by ``keys`` (Series aligned with ``df``)."""
+    parts = []
+    for m in metrics:
+        if m not in df.columns:
+            continue
+        v = df[m].to_numpy(dtype="float64")
+        ok = ~np.isnan(v)
+        part = pd.DataFrame({k.name: k.to_numpy()[ok] for k in keys})
+        part["metric"], part["level"], part["value"] = m, np.int8(0), v[ok]
+        parts.append(part)
+    if not parts:
+        return pd.DataFrame(columns=[k.name for k in keys] + COLUMNS)
+    return compact(pd.concat(parts, ignore_index=True), [k.name for k in keys])
+
+
+def _ranked(items, by):
+    # Values sorted within each ``by`` group, with group numbers and the weight share up to each value
+    group = items.groupby(by, observed=True, sort=True).ngroup().to_numpy()
+    value = items["value"].to_numpy(dtype=np.float64)
+    order = np.lexsort((value, group))
+    group, value = group[order], value[order]
+    cum = np.cumsum(np.ldexp(1.0, items["level"].to_numpy(dtype=np.int64)[order]))
+    starts, run, _ = _runs(group)
+    ends = np.r_[starts[1:], len(group)] - 1
+    before = np.r_[0.0, cum[ends[:-1]]]
+    return group, value, (cum - before[run]) / (cum[ends] - before)[run]
+
+
+def quantiles(items, probs, by, lo=None, hi=None):
+    """Quantiles at ``probs`` per ``by`` group: a frame of ``by``, ``q`` and ``value``.
+
+    With the exact per-group ``lo`` / ``hi`` (Series indexed by group), the 0
+    and 1 quantiles are those instead of the sketch's smallest and largest values.
+    """
+    probs = np.asarray(probs, dtype=np.float64)
+    if items.empty:
+        return pd.DataFrame(columns=[by, "q", "value"])
+    groups = np.sort(items[by].unique())
+    group, value, share = _ranked(items, by)
+    # Groups are sorted, so ``group + share`` increases and one search finds every group's quantiles
+    target = np.repeat(np.arange(len(groups)), len(probs)) + np.tile(np.clip(probs, 1e-12, 1.0), len(groups))
+    at = np.minimum(np.searchsorted(group + np.minimum(share, 1.0), target, side="left"), len(value) - 1)
+    out = pd.DataFrame({by: np.repeat(groups, len(probs)), "q": np.tile(probs, len(groups)), "value": value[at]})
+    for q, exact in ((0.0, lo), (1.0, hi)):
+        if exact is not None:
+            at_end = out["q"] == q
+            out.loc[at_end, "value"] = out.loc[at_end, by].map(exact).fillna(out.loc[at_end, "value"])
+    return out
+
+
+def box_stats(items, by, lo=None, hi=None):
+    """Quartiles, Tukey whiskers and a bounded outlier sample per ``by`` group.
+
+    ``lo`` / ``hi`` are the exact minimum and maximum per group (Series indexed
+    by group), if known: the sketch may have compacted the extremes away.
+    Returns (boxes, outliers) frames.
+    """
+    q = quantiles(items, [0.25, 0.5, 0.75], by)
+    boxes = q.pivot(index=by, columns="q", values="value").set_axis(["q1", "median", "q3"], axis=1)
+    iqr = boxes["q3"] - boxes["q1"]
+    boxes["low"], boxes["high"] = boxes["q1"] - 1.5 * iqr, boxes["q3"] + 1.5 * iqr
+    values = items[[by, "value"]]
+    if lo is not None and hi is not None:
+        values = pd.concat([values, lo.rename("value").rename_axis(by).reset_index(),
+                            hi.rename("value").rename_axis(by).reset_index()], ignore_index=True)
+    values = values.join(boxes[["low", "high"]], on=by)
+    inside = values["value"].between(values["low"], values["high"])
+    # Whiskers end at the furthest values inside the fences
+    fences = values[inside].groupby(by)["value"].agg(lowerfence="min", upperfence="max")
+    boxes = boxes.drop(columns=["low", "high"]).join(fences).reset_index()
+    outside = values[~inside].drop_duplicates([by, "value"]).sort_values([by, "value"])
+    rank = outside.groupby(by).cumcount().to_numpy()
+    size = outside.groupby(by)["value"].transform("size").to_numpy()
+    # Evenly spaced through each group's outliers, always including the lowest and the highest
+    step = np.maximum((size - 1) / (MAX_OUTLIERS - 1), 1.0)
+    keep = (np.floor(rank / step) != np.floor((rank - 1) / step)) | (rank == size - 1)
+    return boxes, outside.loc[keep, [by, "value"]].reset_index(drop=True)
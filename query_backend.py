@@ -0,0 +1,454 @@
+"""Pluggable query backends for the dashboard's row-level aggregations.
+
+Every backend answers the same questions for a (start, end, countries)
+selection: the rows themselves, their count, overall and per-country means,
+per-country histogram counts, the z-score extremes and describe/correlation.
+
+``PandasBackend`` works on the in-memory ``SortedFrameIndex`` (binary-search
+filter, then pandas) and stays the default for data that fits in memory.
+``DuckDBBackend`` and ``PolarsBackend`` run the same queries against the
+partitioned Parquet store without loading it: the time and country filter is
+pushed into the scan (month partitions pruned, row groups skipped on their
+statistics), the aggregation runs multi-threaded inside the engine and only
+its result comes back as pandas. Derived (imperial) columns are computed in
+the engine from their metric source. Both engines are optional.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+import columnar_store
+import compact_schema
+import extremes
+import stats_service
+import timestamps
+
+try:
+    import duckdb
+except ImportError:  # optional engine
+    duckdb = None
+
+try:
+    import polars as pl
+except ImportError:  # optional engine
+    pl = None
+
+ENV = "CLIMATESCOPE_QUERY_BACKEND"
+BACKENDS = ["auto", "pandas", "duckdb", "polars"]
+# Under "auto", stores with at least this many rows are queried in place instead of loaded
+OUT_OF_CORE_ROWS = 20_000_000
+DESCRIBE_ROWS = ["count", "mean", "std", "min", "25%", "50%", "75%", "max"]
+
+
+def available():
+    """Installed backends, preferred first."""
+    return [name for name, module in [("duckdb", duckdb), ("polars", pl)] if module is not None] + ["pandas"]
+
+
+def choose(requested=None, rows=None):
+    """Backend name for ``requested`` (default ``$CLIMATESCOPE_QUERY_BACKEND`` or "auto") and a store of ``rows``."""
+    requested = (requested or os.environ.get(ENV) or "auto").lower()
+    engines = available()
+    if requested == "auto":
+        return engines[0] if rows is not None and rows >= OUT_OF_CORE_ROWS else "pandas"
+    # An engine that is not installed falls back to pandas
+    return requested if requested in engines else "pandas"
+
+
+def _hist_frame(counts, edges, country_col, metric):
+    # Same layout as rollups.histogram: (country, bin, count, bin centre)
+    edges = np.asarray(edges)
+    counts = counts.rename(columns={country_col: "country"}) if country_col else counts.assign(country="All")
+    counts[metric] = (edges[:-1] + np.diff(edges) / 2)[counts["bin"].to_numpy()]
+    return counts.sort_values(["country", "bin"]).reset_index(drop=True)
+
+
+def _edges(lo, hi, bins):
+    if lo is None or hi is None or not np.isfinite([lo, hi]).all():
+        return None
+    return np.linspace(lo, hi if hi > lo else lo + 1, bins + 1)
+
+
+class PandasBackend:
+    """Queries on the in-memory index; describe/corr go through the shared ``StatsService``."""
+
+    name = "pandas"
+
+    def __init__(self, index, stats=None, version=None):
+        self.index = index
+        self.country_col = index.country_col
+        self.stats = stats or stats_service.StatsService()
+        self.version = version
+
+    @property
+    def columns(self):
+        return self.index.frame.columns.tolist()
+
+    def numeric_columns(self):
+        return stats_service.numeric_columns(self.index.frame)
+
+    def countries(self):
+        return sorted(k for k in self.index.offsets if k is not None)
+
+    def time_range(self):
+        valid = self.index.times[~np.isnat(self.index.times)]
+        return (pd.Timestamp(valid.min()), pd.Timestamp(valid.max())) if len(valid) else (None, None)
+
+    def rows(self, start, end, countries=None, columns=None):
+        df = self.index.slice(start, end, countries).reset_index(drop=True)
+        return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+    def count(self, start, end, countries=None):
+        return sum(b - a for a, b in self.index.ranges(start, end, countries))
+
+    def means(self, start, end, countries, metrics):
+        return self.rows(start, end, countries)[list(metrics)].astype("float64").mean()
+
+    def country_means(self, start, end, countries, metric):
+        df = self.rows(start, end, countries, [self.country_col, metric]).dropna(subset=[metric])
+        return df[metric].astype("float64").groupby(df[self.country_col], observed=True).mean().reset_index()
+
+    def histogram(self, start, end, countries, metric, bins):
+        df = self.rows(start, end, countries, [c for c in (self.country_col, metric) if c]).dropna(subset=[metric])
+        v = df[metric].to_numpy(dtype="float64")
+        edges = _edges(v.min() if len(v) else None, v.max() if len(v) else None, bins)
+        if edges is None:
+            return None
+        b = np.clip(((v - edges[0]) / (edges[-1] - edges[0]) * bins).astype(np.int64), 0, bins - 1)
+        keys = [df[self.country_col].to_numpy(), b] if self.country_col else [b]
+        names = [self.country_col, "bin"] if self.country_col else ["bin"]
+        counts = pd.DataFrame(dict(zip(names, keys))).groupby(names, observed=True).size().rename("count")
+        return _hist_frame(counts.reset_index(), edges, self.country_col, metric)
+
+    def extremes(self, start, end, countries, metric, n=10, threshold=extremes.Z_THRESHOLD):
+        """Top and bottom ``n`` rows by per-country z-score, and the number beyond ``threshold``."""
+        df_z = extremes.flag(self.rows(start, end, countries).dropna(subset=[metric]), [metric], self.country_col,
+                             threshold)
+        z_col = f"z_{metric}"
+        return df_z.nlargest(n, z_col), df_z.nsmallest(n, z_col), int(df_z[f"{metric}_is_extreme"].sum())
+
+    def describe(self, start, end, countries, columns):
+        return self.stats.describe(self.index, columns, start, end, countries, self.version)
+
+    def corr(self, start, end, countries, columns):
+        return self.stats.corr(self.index, columns, start, end, countries, self.version)
+
+
+class _StoreBackend:
+    """Common state of the engines that query the Parquet store in place."""
+
+    def __init__(self, root, columns=None, country_col="country"):
+        self.root = root
+        self.manifest = columnar_store.read_manifest(root) or {}
+        stored = self.manifest.get("columns", [])
+        self.derived = self.manifest.get("derived", {})
+        self._columns = [c for c in (columns or stored) if c in stored]
+        self.country_col = country_col if country_col in self._columns else None
+        self.months = self.manifest.get("months", [])
+        self.dtypes = self.manifest.get("dtypes", {})
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def numeric_columns(self):
+        return columnar_store.numeric_columns(self.manifest, self._columns)
+
+    def countries(self):
+        return list(self.manifest.get("countries", []))
+
+    def time_range(self):
+        lo, hi = self.manifest.get("time_range") or (None, None)
+        return (pd.Timestamp(lo) if lo else None, pd.Timestamp(hi) if hi else None)
+
+    def _months(self, start, end):
+        # Partitions that can hold [start, end): the end is exclusive
+        return columnar_store.months_in_range(self.months, start, pd.Timestamp(end) - pd.Timedelta(1, "ns"))
+
+    def _typed(self, df):
+        return compact_schema.cast(df, compact_schema.compact_dtypes(df))
+
+    @staticmethod
+    def _describe_frame(values, columns):
+        return pd.DataFrame(values, index=DESCRIBE_ROWS, columns=list(columns), dtype="float64")
+
+
+class _Sql:
+    """SQL text that composes with the arithmetic of ``compact_schema.DERIVED_UNITS`` conversions."""
+
+    def __init__(self, text):
+        self.text = text
+
+    def _op(self, op, other, swap=False):
+        other = other.text if isinstance(other, _Sql) else repr(float(other))
+        return _Sql(f"({other} {op} {self.text})" if swap else f"({self.text} {op} {other})")
+
+    def __add__(self, o):
+        return self._op("+", o)
+
+    def __radd__(self, o):
+        return self._op("+", o, True)
+
+    def __sub__(self, o):
+        return self._op("-", o)
+
+    def __rsub__(self, o):
+        return self._op("-", o, True)
+
+    def __mul__(self, o):
+        return self._op("*", o)
+
+    def __rmul__(self, o):
+        return self._op("*", o, True)
+
+    def __truediv__(self, o):
+        return self._op("/", o)
+
+    def __rtruediv__(self, o):
+        return self._op("/", o, True)
+
+
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DuckDBBackend(_StoreBackend):
+    """Pushed-down SQL over ``read_parquet`` of the store (hive partitions on ``year_month``)."""
+
+    name = "duckdb"
+
+    def __init__(self, root, columns=None, country_col="country", threads=None):
+        if duckdb is None:
+            raise ImportError("duckdb is required for the DuckDB query backend")
+        super().__init__(root, columns, country_col)
+        self.con = duckdb.connect()
+        if threads:
+            self.con.execute(f"SET threads = {int(threads)}")
+        select = []
+        for c in self._columns:
+            if c in self.derived:
+                source, convert, decimals = compact_schema.DERIVED_UNITS[c]
+                expr = convert(_Sql(f"CAST({_q(source)} AS DOUBLE)")).text
+                select.append(f"CAST(round({expr}, {decimals}) AS FLOAT) AS {_q(c)}")
+            else:
+                select.append(_q(c))
+        select.append(_q(columnar_store.PARTITION_COL))
+        files = os.path.join(root, "**", "*.parquet").replace("'", "''")
+        self.con.execute(f"CREATE VIEW weather AS SELECT {', '.join(select)} "
+                         f"FROM read_parquet('{files}', hive_partitioning = true)")
+
+    def _query(self, sql, params=()):
+        # A cursor per query: the backend is shared by all sessions' threads
+        return self.con.cursor().execute(sql, list(params)).df()
+
+    def _where(self, start, end, countries, not_null=()):
+        months = self._months(start, end)
+        clauses = [f"{_q(timestamps.TIME_COL)} >= ?", f"{_q(timestamps.TIME_COL)} < ?"]
+        params = [pd.Timestamp(start).to_pydatetime(), pd.Timestamp(end).to_pydatetime()]
+        clauses.append(f"{_q(columnar_store.PARTITION_COL)} IN ({', '.join('?' * len(months)) or 'NULL'})")
+        params += months
+        if countries and self.country_col:
+            clauses.append(f"{_q(self.country_col)} IN ({', '.join('?' * len(countries))})")
+            params += list(countries)
+        clauses += [f"{_q(c)} IS NOT NULL" for c in not_null]
+        return " AND ".join(clauses), params
+
+    def rows(self, start, end, countries=None, columns=None):
+        columns = [c for c in (columns or self._columns) if c in self._columns]
+        where, params = self._where(start, end, countries)
+        order = ", ".join(_q(c) for c in (self.country_col, timestamps.TIME_COL) if c and c in self._columns)
+        sql = f"SELECT {', '.join(map(_q, columns))} FROM weather WHERE {where}" + (f" ORDER BY {order}" if order else "")
+        return self._typed(self._query(sql, params))
+
+    def count(self, start, end, countries=None):
+        where, params = self._where(start, end, countries)
+        return int(self._query(f"SELECT count(*) AS n FROM weather WHERE {where}", params)["n"].iloc[0])
+
+    def means(self, start, end, countries, metrics):
+        where, params = self._where(start, end, countries)
+        sql = f"SELECT {', '.join(f'avg({_q(m)}) AS {_q(m)}' for m in metrics)} FROM weather WHERE {where}"
+        return self._query(sql, params).iloc[0].astype("float64")
+
+    def country_means(self, start, end, countries, metric):
+        where, params = self._where(start, end, countries, [metric])
+        c = _q(self.country_col)
+        return self._query(f"SELECT {c}, avg({_q(metric)}) AS {_q(metric)} FROM weather WHERE {where} "
+                           f"GROUP BY {c} ORDER BY {c}", params)
+
+    def histogram(self, start, end, countries, metric, bins):
+        where, params = self._where(start, end, countries, [metric])
+        m = _q(metric)
+        lo, hi = self._query(f"SELECT min({m}) AS lo, max({m}) AS hi FROM weather WHERE {where}", params).iloc[0]
+        edges = _edges(None if pd.isna(lo) else float(lo), None if pd.isna(hi) else float(hi), bins)
+        if edges is None:
+            return None
+        lo, width = float(edges[0]), float(edges[-1] - edges[0])
+        b = f"CAST(least(greatest(floor(({m} - {lo!r}) / {width!r} * {bins}), 0), {bins - 1}) AS BIGINT)"
+        keys = f"{_q(self.country_col)}, " if self.country_col else ""
+        counts = self._query(f"SELECT {keys}{b} AS bin, count(*) AS count FROM weather WHERE {where} "
+                             f"GROUP BY ALL", params)
+        return _hist_frame(counts, edges, self.country_col, metric)
+
+    def extremes(self, start, end, countries, metric, n=10, threshold=extremes.Z_THRESHOLD):
+        where, params = self._where(start, end, countries, [metric])
+        m, z = _q(metric), _q(f"z_{metric}")
+        window = f"PARTITION BY {_q(self.country_col)}" if self.country_col else ""
+        # Population std with 0 counted as 1, as extremes.zscores
+        sql = f"""
+            WITH scored AS (
+                SELECT {', '.join(map(_q, self._columns))},
+                       (CAST({m} AS DOUBLE) - avg({m}) OVER w)
+                           / coalesce(nullif(stddev_pop({m}) OVER w, 0), 1) AS {z}
+                FROM weather WHERE {where} WINDOW w AS ({window})
+            ), ranked AS (
+                SELECT *, row_number() OVER (ORDER BY {z} DESC) AS _hot, row_number() OVER (ORDER BY {z}) AS _cold,
+                       count(*) FILTER (WHERE abs({z}) >= ?) OVER () AS _extreme
+                FROM scored
+            )
+            SELECT * FROM ranked WHERE _hot <= ? OR _cold <= ?"""
+        df = self._query(sql, params + [threshold, n, n])
+        n_extreme = int(df["_extreme"].iloc[0]) if len(df) else 0
+        df[f"{metric}_is_extreme"] = df[f"z_{metric}"].abs() >= threshold
+        hot = df[df["_hot"] <= n].sort_values("_hot").drop(columns=["_hot", "_cold", "_extreme"])
+        cold = df[df["_cold"] <= n].sort_values("_cold").drop(columns=["_hot", "_cold", "_extreme"])
+        return self._typed(hot), self._typed(cold), n_extreme
+
+    def describe(self, start, end, countries, columns):
+        where, params = self._where(start, end, countries)
+        aggs = []
+        for c in columns:
+            q = _q(c)
+            aggs += [f"count({q})", f"avg({q})", f"stddev_samp({q})", f"min({q})",
+                     f"quantile_cont({q}, 0.25)", f"quantile_cont({q}, 0.5)", f"quantile_cont({q}, 0.75)",
+                     f"max({q})"]
+        row = self.con.cursor().execute(f"SELECT {', '.join(aggs)} FROM weather WHERE {where}", params).fetchone()
+        values = np.array(row, dtype="float64").reshape(len(columns), len(DESCRIBE_ROWS)).T
+        return self._describe_frame(values, columns)
+
+    def corr(self, start, end, countries, columns):
+        where, params = self._where(start, end, countries)
+        pairs = [(i, j) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+        r = np.eye(len(columns))
+        if pairs:
+            sql = ", ".join(f"corr({_q(columns[i])}, {_q(columns[j])})" for i, j in pairs)
+            row = self.con.cursor().execute(f"SELECT {sql} FROM weather WHERE {where}", params).fetchone()
+            for (i, j), v in zip(pairs, row):
+                r[i, j] = r[j, i] = np.nan if v is None else v
+        return pd.DataFrame(r, index=list(columns), columns=list(columns))
+
+
+class PolarsBackend(_StoreBackend):
+    """Lazy ``scan_parquet`` plans over the store; polars prunes partitions and pushes the filter down."""
+
+    name = "polars"
+
+    def __init__(self, root, columns=None, country_col="country"):
+        if pl is None:
+            raise ImportError("polars is required for the Polars query backend")
+        super().__init__(root, columns, country_col)
+        lf = pl.scan_parquet(os.path.join(root, "**", "*.parquet"), hive_partitioning=True)
+        exprs = []
+        for c in self._columns:
+            if c in self.derived:
+                source, convert, decimals = compact_schema.DERIVED_UNITS[c]
+                exprs.append(convert(pl.col(source).cast(pl.Float64)).round(decimals).cast(pl.Float32).alias(c))
+            elif self.dtypes.get(c) == "category":
+                exprs.append(pl.col(c).cast(pl.Utf8))
+            else:
+                exprs.append(pl.col(c))
+        self.lf = lf.select(exprs + [pl.col(columnar_store.PARTITION_COL)])
+
+    def _selection(self, start, end, countries, not_null=()):
+        cond = (pl.col(columnar_store.PARTITION_COL).is_in(self._months(start, end))
+                & (pl.col(timestamps.TIME_COL) >= pd.Timestamp(start).to_pydatetime())
+                & (pl.col(timestamps.TIME_COL) < pd.Timestamp(end).to_pydatetime()))
+        if countries and self.country_col:
+            cond = cond & pl.col(self.country_col).is_in(list(countries))
+        for c in not_null:
+            cond = cond & pl.col(c).is_not_null()
+        return self.lf.filter(cond)
+
+    def rows(self, start, end, countries=None, columns=None):
+        columns = [c for c in (columns or self._columns) if c in self._columns]
+        order = [c for c in (self.country_col, timestamps.TIME_COL) if c and c in self._columns]
+        lf = self._selection(start, end, countries)
+        lf = lf.sort(order) if order else lf
+        return self._typed(lf.select(columns).collect().to_pandas())
+
+    def count(self, start, end, countries=None):
+        return int(self._selection(start, end, countries).select(pl.len()).collect().item())
+
+    def means(self, start, end, countries, metrics):
+        out = self._selection(start, end, countries).select([pl.col(m).cast(pl.Float64).mean() for m in metrics])
+        return out.collect().to_pandas().iloc[0].astype("float64")
+
+    def country_means(self, start, end, countries, metric):
+        lf = self._selection(start, end, countries, [metric])
+        lf = lf.group_by(self.country_col).agg(pl.col(metric).cast(pl.Float64).mean()).sort(self.country_col)
+        return lf.collect().to_pandas()
+
+    def histogram(self, start, end, countries, metric, bins):
+        lf = self._selection(start, end, countries, [metric])
+        lo, hi = lf.select(pl.col(metric).min().alias("lo"), pl.col(metric).max().alias("hi")).collect().row(0)
+        edges = _edges(lo, hi, bins)
+        if edges is None:
+            return None
+        b = (((pl.col(metric).cast(pl.Float64) - edges[0]) / (edges[-1] - edges[0]) * bins).floor()
+             .clip(0, bins - 1).cast(pl.Int64).alias("bin"))
+        keys = ([pl.col(self.country_col)] if self.country_col else []) + [b]
+        counts = lf.group_by(keys).agg(pl.len().alias("count")).collect().to_pandas()
+        return _hist_frame(counts, edges, self.country_col, metric)
+
+    def extremes(self, start, end, countries, metric, n=10, threshold=extremes.Z_THRESHOLD):
+        v = pl.col(metric).cast(pl.Float64)
+        mean, std = v.mean(), v.std(ddof=0)
+        if self.country_col:
+            mean, std = mean.over(self.country_col), std.over(self.country_col)
+        z_col = f"z_{metric}"
+        # Population std with 0 counted as 1, as extremes.zscores
+        std = pl.when(std == 0).then(1.0).otherwise(std).fill_null(1.0)
+        scored = (self._selection(start, end, countries, [metric]).select(self._columns)
+                  .with_columns(((v - mean) / std).alias(z_col))
+                  .with_columns((pl.col(z_col).abs() >= threshold).alias(f"{metric}_is_extreme")))
+        hot, cold, n_extreme = pl.collect_all([
+            scored.sort(z_col, descending=True).head(n), scored.sort(z_col).head(n),
+            scored.select(pl.col(f"{metric}_is_extreme").sum()),
+        ])
+        return self._typed(hot.to_pandas()), self._typed(cold.to_pandas()), int(n_extreme.item() or 0)
+
+    def describe(self, start, end, countries, columns):
+        aggs = []
+        for i, c in enumerate(columns):
+            v = pl.col(c).cast(pl.Float64)
+            aggs += [v.count().cast(pl.Float64).alias(f"{i}_0"), v.mean().alias(f"{i}_1"),
+                     v.std().alias(f"{i}_2"), v.min().alias(f"{i}_3"),
+                     v.quantile(0.25, "linear").alias(f"{i}_4"), v.quantile(0.5, "linear").alias(f"{i}_5"),
+                     v.quantile(0.75, "linear").alias(f"{i}_6"), v.max().alias(f"{i}_7")]
+        row = self._selection(start, end, countries).select(aggs).collect().row(0)
+        values = np.array(row, dtype="float64").reshape(len(columns), len(DESCRIBE_ROWS)).T
+        return self._describe_frame(values, columns)
+
+    def corr(self, start, end, countries, columns):
+        pairs = [(i, j) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+        r = np.eye(len(columns))
+        if pairs:
+            aggs = []
+            for i, j in pairs:
+                a, b = pl.col(columns[i]).cast(pl.Float64), pl.col(columns[j]).cast(pl.Float64)
+                # Pairwise-complete, as pandas and the stats service
+                both = a.is_not_null() & b.is_not_null()
+                aggs.append(pl.corr(a.filter(both), b.filter(both)).alias(f"{i}_{j}"))
+            row = self._selection(start, end, countries).select(aggs).collect().row(0)
+            for (i, j), v in zip(pairs, row):
+                r[i, j] = r[j, i] = np.nan if v is None else v
+        return pd.DataFrame(r, index=list(columns), columns=list(columns))
+
+
+def open_store_backend(name, root=columnar_store.STORE_PATH, columns=None, country_col="country"):
+    """Out-of-core backend ``name`` ("duckdb" or "polars") over the store at ``root``."""
+    if name == "duckdb":
+        return DuckDBBackend(root, columns, country_col)
+    if name == "polars":
+        return PolarsBackend(root, columns, country_col)
+    raise ValueError(f"{name!r} is not an out-of-core backend")
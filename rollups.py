@@ -0,0 +1,341 @@
+"""Pre-aggregated rollup cube for the dashboard.
+
+Cells are keyed by country x day (and country x month) and hold, per metric,
+``count``, ``sum``, ``sumsq``, ``min`` and ``max`` plus a row count. Selected
+metrics also get fixed-bin histograms, stored long as (country, period,
+metric, bin, count). When rows carry coordinates, a country x month
+``spatial_grid`` of the temperature backs the bubble map, and the metrics of
+the box and violin plots get country x period ``quantile_sketch`` cells
+(stored long as (country, period, metric, level, value)). Everything is
+mergeable, so cubes are built chunk by chunk in the prep stage and a dashboard
+query only sums a few cells.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import quantile_sketch
+import spatial_grid
+import timestamps
+import weather_schema
+
+ROLLUP_DIR = "processed/rollups"
+COUNTRY_COL = "country"
+TIME_COL = "last_updated"
+GRID_KEYS = [COUNTRY_COL, "period"]
+# Histogram bins per dashboard role (mirrors the nbins used by app.py)
+HIST_BINS = {"temp": 50, "hum": 40, "uv": 30}
+# Metrics drawn as box / violin plots
+SKETCH_ROLES = ["precip", "temp", "wind"]
+# Day sketches waiting to be merged are compacted once they outgrow the merged ones
+SKETCH_FLUSH_ROWS = 1_000_000
+
+
+def cube_metrics(df):
+    numeric = set(df.select_dtypes(include="number").columns)
+    cols = weather_schema.detect_columns(df.columns)
+    hist = {cols[r]: bins for r, bins in HIST_BINS.items() if cols[r] in numeric}
+    return [c for c in weather_schema.metric_columns(df.columns) if c in numeric], hist
+
+
+def hist_edges(hist_metrics, mins, maxs):
+    edges = {}
+    for m, bins in hist_metrics.items():
+        lo, hi = mins.get(m), maxs.get(m)
+        if lo is None or hi is None or not np.isfinite([lo, hi]).all():
+            continue
+        edges[m] = np.linspace(lo, hi if hi > lo else lo + 1, bins + 1).tolist()
+    return edges
+
+
+def grid_metric(columns):
+    # The bubble map colours cells by temperature
+    return weather_schema.detect_columns(columns)["temp"]
+
+
+def _sketch_metrics(metrics):
+    cols = weather_schema.detect_columns(metrics)
+    return [cols[r] for r in SKETCH_ROLES if cols[r]]
+
+
+def _agg_map(metrics):
+    agg = {"rows": "sum"}
+    for m in metrics:
+        agg.update({f"{m}__count": "sum", f"{m}__sum": "sum", f"{m}__sumsq": "sum",
+                    f"{m}__min": "min", f"{m}__max": "max"})
+    return agg
+
+
+def _period_keys(df, freq):
+    return timestamps.parse(df[TIME_COL]).dt.to_period(freq).dt.start_time
+
+
+def partial_stats(df, metrics, freq="D"):
+    """Country x period stat cells for one chunk of cleaned rows."""
+    keys = [df[COUNTRY_COL].astype(str).rename(COUNTRY_COL), _period_keys(df, freq).rename("period")]
+    values = df[metrics].astype("float64")
+    g = values.groupby(keys, observed=True)
+    parts = [g.size().rename("rows")]
+    for name, frame in [("count", g.count()), ("sum", g.sum()), ("sumsq", (values ** 2).groupby(keys).sum()),
+                        ("min", g.min()), ("max", g.max())]:
+        parts.append(frame.add_suffix(f"__{name}"))
+    cells = pd.concat(parts, axis=1)
+    return cells[list(_agg_map(metrics))].reset_index()
+
+
+def partial_hist(df, edges, freq="D"):
+    """Long (country, period, metric, bin, count) histogram cells for one chunk."""
+    out = []
+    period = _period_keys(df, freq)
+    for m, e in edges.items():
+        v = df[m].to_numpy(dtype="float64")
+        ok = ~np.isnan(v)
+        nb = len(e) - 1
+        # Values outside the stored edges (later appends) land in the end bins
+        b = np.clip(((v[ok] - e[0]) / (e[-1] - e[0]) * nb).astype(np.int64), 0, nb - 1)
+        part = pd.DataFrame({COUNTRY_COL: df[COUNTRY_COL].astype(str).to_numpy()[ok],
+                             "period": period.to_numpy()[ok], "bin": b})
+        part = part.groupby([COUNTRY_COL, "period", "bin"]).size().rename("count").reset_index()
+        part.insert(2, "metric", m)
+        out.append(part)
+    if not out:
+        return pd.DataFrame(columns=[COUNTRY_COL, "period", "metric", "bin", "count"])
+    return pd.concat(out, ignore_index=True)
+
+
+def partial_grid(df, metric):
+    """Country x month level-0 grid cells for one chunk, or None without coordinates."""
+    if metric is None or not {"latitude", "longitude"} <= set(df.columns):
+        return None
+    keys = [df[COUNTRY_COL].astype(str).rename(COUNTRY_COL), _period_keys(df, "M").rename("period")]
+    return spatial_grid.partial_grid(df, metric, keys)
+
+
+def partial_sketch(df, metrics):
+    """Country x day quantile sketches of ``metrics`` for one chunk."""
+    keys = [df[COUNTRY_COL].astype(str).rename(COUNTRY_COL), _period_keys(df, "D").rename("period")]
+    return quantile_sketch.partial_sketch(df, metrics, keys)
+
+
+def merge_stats(acc, part, metrics):
+    if acc is None:
+        return part
+    both = pd.concat([acc, part], ignore_index=True)
+    return both.groupby([COUNTRY_COL, "period"], as_index=False).agg(_agg_map(metrics))
+
+
+def merge_hist(acc, part):
+    if acc is None:
+        return part
+    both = pd.concat([acc, part], ignore_index=True)
+    return both.groupby([COUNTRY_COL, "period", "metric", "bin"], as_index=False)["count"].sum()
+
+
+class RollupBuilder:
+    """Accumulates country x day cells chunk by chunk; months are derived on save."""
+
+    def __init__(self, metrics, hist_metrics, edges, grid_metric=None, sketch_metrics=None):
+        self.metrics = metrics
+        self.hist_metrics = hist_metrics
+        self.edges = edges
+        self.grid_metric = grid_metric
+        self.sketch_metrics = _sketch_metrics(metrics) if sketch_metrics is None else sketch_metrics
+        self.day = None
+        self.hist = None
+        self.grid = None
+        self._sketch = None
+        self._sketch_parts = []
+
+    @classmethod
+    def for_frame(cls, df):
+        metrics, hist = cube_metrics(df)
+        return cls(metrics, hist, hist_edges(hist, df[list(hist)].min().to_dict(), df[list(hist)].max().to_dict()),
+                   grid_metric(df.columns))
+
+    def partials(self, df):
+        """Cells for one chunk; computed apart from ``add_partials`` so workers can build them."""
+        if TIME_COL not in df.columns or COUNTRY_COL not in df.columns or df.empty:
+            return None
+        return (partial_stats(df, self.metrics), partial_hist(df, self.edges), partial_grid(df, self.grid_metric),
+                partial_sketch(df, self.sketch_metrics) if self.sketch_metrics else None)
+
+    def add_partials(self, parts):
+        if parts is None:
+            return
+        self.day = merge_stats(self.day, parts[0], self.metrics)
+        self.hist = merge_hist(self.hist, parts[1])
+        if parts[2] is not None:
+            self.grid = spatial_grid.merge_grid(self.grid, parts[2], GRID_KEYS)
+        if parts[3] is not None:
+            # Compacting re-sorts every cell, so parts are merged in batches rather than per chunk
+            self._sketch_parts.append(parts[3])
+            merged = len(self._sketch) if self._sketch is not None else 0
+            if sum(map(len, self._sketch_parts)) > max(SKETCH_FLUSH_ROWS, merged):
+                self._merge_sketch_parts()
+
+    def _merge_sketch_parts(self):
+        if self._sketch_parts:
+            parts = ([self._sketch] if self._sketch is not None else []) + self._sketch_parts
+            self._sketch = quantile_sketch.compact(pd.concat(parts, ignore_index=True), GRID_KEYS)
+            self._sketch_parts = []
+
+    @property
+    def sketch(self):
+        self._merge_sketch_parts()
+        return self._sketch
+
+    def add(self, df):
+        self.add_partials(self.partials(df))
+
+    def merge_cube(self, cube):
+        """Continue from a saved cube (incremental runs)."""
+        self.day = merge_stats(cube["day"], self.day, self.metrics) if self.day is not None else cube["day"]
+        self.hist = merge_hist(cube["hist_day"], self.hist) if self.hist is not None else cube["hist_day"]
+        if cube.get("grid") is not None:
+            self.grid = spatial_grid.merge_grid(cube["grid"], self.grid, GRID_KEYS) if self.grid is not None \
+                else cube["grid"]
+        if cube.get("sketch_day") is not None:
+            self._sketch_parts.insert(0, cube["sketch_day"])
+
+    def save(self, root=ROLLUP_DIR):
+        if self.day is None:
+            return False
+        os.makedirs(root, exist_ok=True)
+        month = self.day.assign(period=self.day["period"].dt.to_period("M").dt.start_time)
+        month = month.groupby([COUNTRY_COL, "period"], as_index=False).agg(_agg_map(self.metrics))
+        hist_month = self.hist.assign(period=self.hist["period"].dt.to_period("M").dt.start_time)
+        hist_month = hist_month.groupby([COUNTRY_COL, "period", "metric", "bin"], as_index=False)["count"].sum()
+        for name, frame in [("day", self.day), ("month", month), ("hist_day", self.hist),
+                            ("hist_month", hist_month)]:
+            frame.to_parquet(os.path.join(root, f"{name}.parquet"), index=False)
+        sketch = self.sketch
+        optional = [("grid", self.grid), ("sketch_day", sketch),
+                    ("sketch_month", None if sketch is None else sketch_months(sketch))]
+        for name, frame in optional:
+            path = os.path.join(root, f"{name}.parquet")
+            if frame is not None:
+                frame.to_parquet(path, index=False)
+            elif os.path.exists(path):
+                os.remove(path)
+        with open(os.path.join(root, "meta.json"), "w") as f:
+            json.dump({"metrics": self.metrics, "hist_metrics": self.hist_metrics, "edges": self.edges,
+                       "grid_metric": self.grid_metric if self.grid is not None else None,
+                       "sketch_metrics": self.sketch_metrics if sketch is not None else []}, f)
+        return True
+
+
+def load_cube(root=ROLLUP_DIR):
+    meta_path = os.path.join(root, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        cube = json.load(f)
+    for name in ["day", "month", "hist_day", "hist_month"]:
+        cube[name] = pd.read_parquet(os.path.join(root, f"{name}.parquet"))
+    for name in ["grid", "sketch_day", "sketch_month"]:
+        path = os.path.join(root, f"{name}.parquet")
+        cube[name] = pd.read_parquet(path) if os.path.exists(path) else None
+    return cube
+
+
+def sketch_months(sketch_day):
+    """Country x month sketches merged from the day ones."""
+    month = sketch_day.assign(period=sketch_day["period"].dt.to_period("M").dt.start_time)
+    return quantile_sketch.compact(month, GRID_KEYS)
+
+
+def cube_from_frame(df):
+    """Day-level cube computed on the fly (dashboard fallback when no prebuilt cube exists)."""
+    builder = RollupBuilder.for_frame(df)
+    builder.add(df)
+    return {"metrics": builder.metrics, "hist_metrics": builder.hist_metrics, "edges": builder.edges,
+            "day": builder.day, "hist_day": builder.hist, "grid_metric": builder.grid_metric, "grid": builder.grid,
+            "sketch_metrics": builder.sketch_metrics, "sketch_day": builder.sketch}
+
+
+# ----------------------------------
+# Queries
+# ----------------------------------
+def _split_range(start, end):
+    # Whole months inside [start, end] come from the month cells, the ragged edges from day cells
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    full_lo = start if start.is_month_start else start + pd.offsets.MonthBegin(1)
+    full_hi = (end + pd.Timedelta(days=1)).to_period("M").start_time
+    return start, end, full_lo, full_hi
+
+
+def _select(day, month, start, end, countries):
+    start, end, full_lo, full_hi = _split_range(start, end)
+    if month is not None and full_lo < full_hi:
+        parts = [month[(month["period"] >= full_lo) & (month["period"] < full_hi)],
+                 day[((day["period"] >= start) & (day["period"] < full_lo))
+                     | ((day["period"] >= full_hi) & (day["period"] <= end))]]
+        cells = pd.concat(parts, ignore_index=True)
+    else:
+        cells = day[(day["period"] >= start) & (day["period"] <= end)]
+    if countries:
+        cells = cells[cells[COUNTRY_COL].isin(countries)]
+    return cells
+
+
+def select_cells(cube, start, end, countries=None):
+    return _select(cube["day"], cube.get("month"), start, end, countries)
+
+
+def select_hist(cube, start, end, countries=None):
+    return _select(cube["hist_day"], cube.get("hist_month"), start, end, countries)
+
+
+def select_sketch(cube, start, end, countries=None):
+    return _select(cube["sketch_day"], cube.get("sketch_month"), start, end, countries)
+
+
+def country_extremes(cells, metric):
+    """Exact per-country minimum and maximum of ``metric`` (Series indexed by country)."""
+    g = cells.groupby(COUNTRY_COL)
+    return g[f"{metric}__min"].min(), g[f"{metric}__max"].max()
+
+
+def select_grid(cube, start, end, countries=None):
+    """Grid cells of the whole months in [start, end] and the [lo, hi) ranges left to bin from rows."""
+    start, end, full_lo, full_hi = _split_range(start, end)
+    stop = end + pd.Timedelta(days=1)
+    grid = cube.get("grid") if cube else None
+    if grid is None or full_lo >= full_hi:
+        return None, [(start, stop)]
+    cells = grid[(grid["period"] >= full_lo) & (grid["period"] < full_hi)]
+    if countries:
+        cells = cells[cells[COUNTRY_COL].isin(countries)]
+    edges = [(lo, hi) for lo, hi in [(start, full_lo), (full_hi, stop)] if lo < hi]
+    return cells, edges
+
+
+def record_count(cells):
+    return int(cells["rows"].sum())
+
+
+def overall_mean(cells, metric):
+    n = cells[f"{metric}__count"].sum()
+    return cells[f"{metric}__sum"].sum() / n if n else np.nan
+
+
+def country_means(cells, metric):
+    g = cells.groupby(COUNTRY_COL)[[f"{metric}__sum", f"{metric}__count"]].sum()
+    g = g[g[f"{metric}__count"] > 0]
+    return (g[f"{metric}__sum"] / g[f"{metric}__count"]).rename(metric).reset_index()
+
+
+def timeline(cube, start, end, countries=None):
+    days = _select(cube["day"], None, start, end, countries)
+    return days.groupby("period", as_index=False)["rows"].sum()
+
+
+def histogram(cube, hist_cells, metric):
+    """Per-country counts with bin centres, ready for a stacked ``px.bar``."""
+    edges = np.asarray(cube["edges"][metric])
+    h = hist_cells[hist_cells["metric"] == metric]
+    h = h.groupby([COUNTRY_COL, "bin"], as_index=False)["count"].sum()
+    h[metric] = (edges[:-1] + np.diff(edges) / 2)[h["bin"].to_numpy()]
+    return h
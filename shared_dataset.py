@@ -0,0 +1,116 @@
+"""Read-only, memory-mapped copy of the dashboard dataset shared across sessions and processes.
+
+The sorted frame behind the dashboard's ``SortedFrameIndex`` is written once
+per dataset version as one ``.npy`` file per column (categoricals as their
+codes plus a small categories file) under ``SHARED_DIR``. Every Streamlit
+process maps the same files with ``np.load(mmap_mode="r")`` and wraps them in
+a DataFrame without copying, so concurrent sessions and worker processes read
+one copy of the data from the OS page cache instead of each holding its own.
+Under pandas copy-on-write, filtered views and ``assign`` results keep
+pointing at the mapping; only written columns get private memory.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+SHARED_DIR = "processed/_shared"
+META_NAME = "_meta.json"
+# Older versions stay mapped by processes that have not picked up the new one yet
+MAX_VERSIONS = 2
+
+
+def dataset_key(*parts):
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _plain(col):
+    # Column as a numpy array that np.load can map back, or a categorical
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return col
+    if pd.api.types.is_datetime64_any_dtype(col.dtype) and getattr(col.dtype, "tz", None) is None:
+        return col.to_numpy(dtype="datetime64[ns]")
+    values = col.to_numpy()
+    if values.dtype == object:
+        return col.astype("category")
+    return values
+
+
+def write_frame(df, path):
+    """Write ``df`` (default index) as per-column ``.npy`` files into the directory ``path``.
+
+    The directory appears atomically; if another process wrote it first its copy is kept.
+    """
+    parent = os.path.dirname(path) or "."
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+    columns = []
+    try:
+        for i, name in enumerate(df.columns):
+            col = _plain(df[name])
+            entry = {"name": name, "file": f"{i:04d}.npy"}
+            if isinstance(col, pd.Series):
+                np.save(os.path.join(tmp, entry["file"]), col.cat.codes.to_numpy())
+                np.save(os.path.join(tmp, f"{i:04d}.categories.npy"),
+                        col.cat.categories.to_numpy(dtype=object), allow_pickle=True)
+                entry.update(kind="category", ordered=bool(col.cat.ordered))
+            else:
+                np.save(os.path.join(tmp, entry["file"]), col)
+                entry["kind"] = "array"
+            columns.append(entry)
+        with open(os.path.join(tmp, META_NAME), "w") as f:
+            json.dump({"rows": len(df), "columns": columns}, f, indent=2)
+        os.replace(tmp, path)
+    except OSError:
+        if not os.path.exists(os.path.join(path, META_NAME)):
+            raise
+    finally:
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+def open_frame(path):
+    """DataFrame over the memory-mapped columns in ``path``, or None if it was not written."""
+    meta_path = os.path.join(path, META_NAME)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    data = {}
+    for entry in meta["columns"]:
+        values = np.load(os.path.join(path, entry["file"]), mmap_mode="r")
+        if entry["kind"] == "category":
+            categories = np.load(os.path.join(path, entry["file"].replace(".npy", ".categories.npy")),
+                                 allow_pickle=True)
+            values = pd.Categorical.from_codes(values, categories=categories, ordered=entry["ordered"])
+        data[entry["name"]] = values
+    return pd.DataFrame(data, index=pd.RangeIndex(meta["rows"]), copy=False)
+
+
+def _evict(root, keep):
+    dirs = sorted((os.path.join(root, d) for d in os.listdir(root) if not d.startswith(".")),
+                  key=os.path.getmtime, reverse=True)
+    for path in dirs[keep:]:
+        # Processes still mapping these files keep their pages until they let go (POSIX)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def open_shared(key, root=SHARED_DIR):
+    path = os.path.join(root, key)
+    frame = open_frame(path)
+    if frame is not None:
+        os.utime(path)
+    return frame
+
+
+def share(df, key, root=SHARED_DIR):
+    """Write ``df`` under ``key`` unless present, and return the memory-mapped copy."""
+    path = os.path.join(root, key)
+    if not os.path.exists(os.path.join(path, META_NAME)):
+        write_frame(df, path)
+        _evict(root, MAX_VERSIONS)
+    return open_shared(key, root)
@@ -0,0 +1,87 @@
+"""Multi-resolution lat/lon grid for the localized bubble map.
+
+Rows are binned into square cells of ``BASE_SIZE`` degrees, each holding a
+row count, the lat/lon sums (a bubble sits at the centroid of its rows rather
+than at the cell corner) and count / sum / min / max of the temperature.
+Level ``k`` doubles the cell size ``k`` times, so its cells are
+``(row >> k, col >> k)`` of the finest ones and every level is a regroup of
+level 0: only level 0 is stored (per country and month, with the rollup
+cube), the map regroups to the level its zoom and point budget call for.
+Streamlit does not report the browser's zoom back, so the zoom is the one the
+map opens at, fitted to the selected cells.
+"""
+import numpy as np
+import pandas as pd
+
+BASE_SIZE = 0.25
+# 0.25° (~28 km) up to 16° cells
+LEVELS = 7
+VALUES = {"rows": "sum", "lat_sum": "sum", "lon_sum": "sum", "temp_count": "sum", "temp_sum": "sum",
+          "temp_min": "min", "temp_max": "max"}
+# Cells smaller than this many pixels at the map's zoom would only draw on top of each other
+MIN_CELL_PX = 2
+MAX_ZOOM = 10
+
+
+def cell_size(level):
+    return BASE_SIZE * 2 ** level
+
+
+def partial_grid(df, metric, keys=()):
+    """Level-0 cells of ``df`` grouped by ``keys`` (Series aligned with ``df``) and cell row/col."""
+    lat = df["latitude"].to_numpy(dtype="float64")
+    lon = df["longitude"].to_numpy(dtype="float64")
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    frame = pd.DataFrame({k.name: k.to_numpy()[ok] for k in keys})
+    frame["row"] = np.floor((lat[ok] + 90) / BASE_SIZE).astype(np.int32)
+    frame["col"] = np.floor((lon[ok] + 180) / BASE_SIZE).astype(np.int32)
+    frame["lat"], frame["lon"] = lat[ok], lon[ok]
+    frame["t"] = df[metric].to_numpy(dtype="float64")[ok] if metric in df.columns else np.nan
+    g = frame.groupby([k.name for k in keys] + ["row", "col"], observed=True, sort=False)
+    return g.agg(rows=("lat", "size"), lat_sum=("lat", "sum"), lon_sum=("lon", "sum"), temp_count=("t", "count"),
+                 temp_sum=("t", "sum"), temp_min=("t", "min"), temp_max=("t", "max")).reset_index()
+
+
+def merge_grid(acc, part, keys=()):
+    if acc is None:
+        return part
+    both = pd.concat([acc, part], ignore_index=True)
+    return both.groupby(list(keys) + ["row", "col"], as_index=False, observed=True).agg(VALUES)
+
+
+def at_level(cells, level):
+    """Cells regrouped to ``level`` over everything else (countries, months), with centroid and mean."""
+    g = cells.assign(row=cells["row"].to_numpy() >> level, col=cells["col"].to_numpy() >> level)
+    g = g.groupby(["row", "col"], as_index=False).agg(VALUES)
+    return g.assign(latitude=g["lat_sum"] / g["rows"], longitude=g["lon_sum"] / g["rows"],
+                    temp_mean=g["temp_sum"] / g["temp_count"].where(g["temp_count"] > 0))
+
+
+def fit_view(cells):
+    """Map zoom and center that fit the cells' centroids (about a 700 x 450 px map)."""
+    lat = cells["lat_sum"].to_numpy() / cells["rows"].to_numpy()
+    lon = cells["lon_sum"].to_numpy() / cells["rows"].to_numpy()
+    lat_span = max(lat.max() - lat.min(), 1.0)
+    lon_span = max(lon.max() - lon.min(), 1.0)
+    zoom = float(np.clip(np.floor(min(np.log2(984 / lon_span), np.log2(316 / lat_span))), 0, MAX_ZOOM))
+    return zoom, {"lat": float((lat.max() + lat.min()) / 2), "lon": float((lon.max() + lon.min()) / 2)}
+
+
+def choose_level(cells, zoom, budget):
+    """Finest level with at most ``budget`` cells that are still visible apart at ``zoom``."""
+    min_size = MIN_CELL_PX * 360 / (256 * 2 ** zoom)
+    level = next((k for k in range(LEVELS) if cell_size(k) >= min_size), LEVELS - 1)
+    rows, cols = cells["row"].to_numpy(), cells["col"].to_numpy()
+    while level < LEVELS - 1:
+        keys = (rows.astype(np.int64) >> level) * 2**32 + (cols >> level)
+        if len(np.unique(keys)) <= budget:
+            break
+        level += 1
+    return level
+
+
+def map_points(cells, budget):
+    """Bubbles for the level matching the fitted zoom: (points, zoom, center, level)."""
+    zoom, center = fit_view(cells)
+    level = choose_level(cells, zoom, budget)
+    return at_level(cells, level), zoom, center, level
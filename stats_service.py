@@ -0,0 +1,193 @@
+"""Memoized describe() / correlation for the dashboard's filter selections.
+
+Statistics are built from mergeable pairwise moments: for every column pair
+the count, means, sums of squared deviations and co-moment over rows where
+both are present (pandas' pairwise-complete semantics). Moments are computed
+per (country, month) partition of a ``SortedFrameIndex`` and combined with
+the parallel-variance update, so a new selection only computes its ragged
+month edges and any partition not seen before. Quantiles are not mergeable
+and are taken exactly from the selected rows.
+
+Partitions and finished results share one LRU keyed by dataset version,
+bounded by ``max_bytes``.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_BYTES = 128 * 2**20
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+class Moments:
+    """Pairwise count / mean / M2 / co-moment matrices plus per-column min and max.
+
+    ``mean[i, j]`` and ``m2[i, j]`` are over the rows where columns i and j
+    are both present; the diagonal holds the plain per-column values.
+    """
+
+    __slots__ = ("n", "mean", "m2", "cxy", "min", "max")
+
+    def __init__(self, n, mean, m2, cxy, mn, mx):
+        self.n, self.mean, self.m2, self.cxy, self.min, self.max = n, mean, m2, cxy, mn, mx
+
+    @classmethod
+    def from_values(cls, x):
+        x = np.asarray(x, dtype=np.float64)
+        present = ~np.isnan(x)
+        k = x.shape[1]
+        if not len(x):
+            zeros = np.zeros((k, k))
+            return cls(zeros, zeros, zeros, zeros, np.full(k, np.nan), np.full(k, np.nan))
+        # Shift by the partition means so the sums below don't lose precision
+        counts = present.sum(axis=0)
+        shift = np.where(counts > 0, np.where(present, x, 0).sum(axis=0) / np.maximum(counts, 1), 0)
+        x0 = np.where(present, x - shift, 0.0)
+        m = present.astype(np.float64)
+        n = m.T @ m
+        sx = x0.T @ m
+        sxx = (x0 ** 2).T @ m
+        sxy = x0.T @ x0
+        safe = np.where(n > 0, n, 1)
+        mean = np.where(n > 0, sx / safe, 0.0)
+        m2 = np.maximum(sxx - sx * mean, 0.0)
+        cxy = sxy - sx * mean.T
+        mean = np.where(n > 0, mean + shift[:, None], 0.0)
+        mn = np.where(counts > 0, np.where(present, x, np.inf).min(axis=0), np.nan)
+        mx = np.where(counts > 0, np.where(present, x, -np.inf).max(axis=0), np.nan)
+        return cls(n, mean, m2, cxy, mn, mx)
+
+    def merge(self, other):
+        n = self.n + other.n
+        safe = np.where(n > 0, n, 1)
+        dx = other.mean - self.mean
+        dy = dx.T
+        w = self.n * other.n / safe
+        return Moments(n, self.mean + dx * other.n / safe, self.m2 + other.m2 + dx ** 2 * w,
+                       self.cxy + other.cxy + dx * dy * w, np.fmin(self.min, other.min),
+                       np.fmax(self.max, other.max))
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.n, self.mean, self.m2, self.cxy, self.min, self.max))
+
+    def describe(self, columns, quantiles=None):
+        count = np.diag(self.n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(np.diag(self.m2) / (count - 1))
+        rows = {"count": count, "mean": np.where(count > 0, np.diag(self.mean), np.nan),
+                "std": np.where(count > 1, std, np.nan), "min": self.min}
+        for q, values in (quantiles or {}).items():
+            rows[f"{q * 100:g}%"] = values
+        rows["max"] = self.max
+        return pd.DataFrame(rows, index=columns).T
+
+    def corr(self, columns):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r = self.cxy / np.sqrt(self.m2 * self.m2.T)
+        r = np.where(self.n > 1, np.clip(r, -1, 1), np.nan)
+        var = np.diag(self.m2)
+        np.fill_diagonal(r, np.where(var > 0, 1.0, np.nan))
+        return pd.DataFrame(r, index=columns, columns=columns)
+
+
+def _nbytes(value):
+    if isinstance(value, Moments):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    return 64
+
+
+class StatsService:
+    """LRU-cached statistics over ``SortedFrameIndex`` selections, shared across sessions."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, compute):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        value = compute()
+        size = _nbytes(value)
+        with self._lock:
+            if key not in self._cache and size <= self.max_bytes:
+                self._cache[key] = value
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    _, old = self._cache.popitem(last=False)
+                    self.nbytes -= _nbytes(old)
+        return value
+
+    def drop_version(self, version):
+        """Forget everything cached for ``version`` (a dataset version no rerun uses any more)."""
+        with self._lock:
+            for key in [k for k in self._cache if k[1] == version]:
+                self.nbytes -= _nbytes(self._cache.pop(key))
+
+    def _rows_moments(self, index, columns, a, b):
+        return Moments.from_values(index.frame[list(columns)].iloc[a:b].to_numpy(dtype=np.float64, na_value=np.nan))
+
+    def moments(self, index, columns, start, end, countries=None, version=None):
+        columns = tuple(columns)
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        # Whole months inside [start, end) are cached partitions; the ragged edges are read directly
+        first_full = start if start == start.to_period("M").start_time else start + pd.offsets.MonthBegin(1)
+        months = pd.date_range(first_full.normalize(), end, freq="MS")
+        months = months[months + pd.offsets.MonthBegin(1) <= end]
+        total = None
+        for country, (lo, hi) in sorted(index.offsets.items(), key=lambda kv: str(kv[0])):
+            if countries and country not in countries:
+                continue
+            seg = index.times[lo:hi]
+
+            def pos(ts):
+                return lo + int(np.searchsorted(seg, np.datetime64(ts, "ns"), side="left"))
+
+            parts = []
+            if len(months):
+                edges = [(pos(start), pos(months[0])),
+                         (pos(months[-1] + pd.offsets.MonthBegin(1)), pos(end))]
+                for month in months:
+                    a, b = pos(month), pos(month + pd.offsets.MonthBegin(1))
+                    if a < b:
+                        key = ("partition", version, columns, country, month)
+                        parts.append(self._get(key, lambda a=a, b=b: self._rows_moments(index, columns, a, b)))
+            else:
+                edges = [(pos(start), pos(end))]
+            for a, b in edges:
+                if a < b:
+                    parts.append(self._rows_moments(index, columns, a, b))
+            for part in parts:
+                total = part if total is None else total.merge(part)
+        if total is None:
+            total = Moments.from_values(np.empty((0, len(columns))))
+        return total
+
+    def describe(self, index, columns, start, end, countries=None, version=None):
+        columns = tuple(columns)
+        key = ("describe", version, columns, start, end, tuple(countries or ()))
+
+        def compute():
+            m = self.moments(index, columns, start, end, countries, version)
+            rows = index.slice(start, end, countries)[list(columns)].to_numpy(dtype=np.float64, na_value=np.nan)
+            with np.errstate(invalid="ignore"):
+                qs = np.nanquantile(rows, QUANTILES, axis=0) if len(rows) else np.full((len(QUANTILES), len(columns)), np.nan)
+            return m.describe(list(columns), dict(zip(QUANTILES, qs)))
+        return self._get(key, compute)
+
+    def corr(self, index, columns, start, end, countries=None, version=None):
+        columns = tuple(columns)
+        key = ("corr", version, columns, start, end, tuple(countries or ()))
+        return self._get(key, lambda: self.moments(index, columns, start, end, countries, version).corr(list(columns)))
+
+
+def numeric_columns(df):
+    return df.select_dtypes(include="number").columns.tolist()
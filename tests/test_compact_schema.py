@@ -0,0 +1,41 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+
+import columnar_store
+import compact_schema
+import data_preparation
+import synthetic
+
+
+def test_dtypes_come_from_the_schema_not_the_values():
+    df = pd.DataFrame({"humidity": [40, 60], "wind_degree": [10.0, 20.0], "cloud": [0, 100],
+                       "moon_illumination": [12.5, 50.0]})
+    dtypes = compact_schema.compact_dtypes(df)
+    assert dtypes["humidity"] == "int16"
+    # Integer readings that are mean-filled, or already float, stay float32
+    assert dtypes["cloud"] == "float32" and dtypes["moon_illumination"] == "float32"
+    assert dtypes["wind_degree"] == "float32"
+    out = compact_schema.cast(df, dtypes)
+    np.testing.assert_array_equal(out["moon_illumination"].to_numpy(), [12.5, 50.0])
+
+
+def test_store_matches_csv_when_a_later_chunk_is_mean_filled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = next(synthetic.frames(4000, seed=2)).drop_duplicates(["location_name", "last_updated_epoch"])
+    # Gaps in a filled integer column only after the first chunk
+    df.loc[df.index[2500:2600], "cloud"] = np.nan
+    df.to_csv(tmp_path / "raw.csv", index=False)
+    out, store = tmp_path / "cleaned.csv", tmp_path / "store"
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_preparation.run_streaming(str(tmp_path / "raw.csv"), str(out), 1000, str(store), "both", None, None)
+    csv = pd.read_csv(out)
+    stored = columnar_store.read_store(str(store), columns=csv.columns.tolist())
+    stored["location_name"] = stored["location_name"].astype(str)
+    key = ["location_name", "last_updated_epoch"]
+    csv, stored = csv.sort_values(key).reset_index(drop=True), stored.sort_values(key).reset_index(drop=True)
+    assert (csv["cloud"] % 1 != 0).any()
+    for c in ["cloud", "humidity", "moon_illumination", "air_quality_us-epa-index"]:
+        np.testing.assert_allclose(stored[c].to_numpy(dtype="float64"), csv[c].to_numpy(), rtol=1e-6, err_msg=c)
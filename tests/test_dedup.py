@@ -0,0 +1,49 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+
+import data_preparation
+import dedup
+import synthetic
+
+
+def test_key_hashes_ignore_int_or_float_epoch():
+    rows = pd.DataFrame({"location_name": ["A", "B", "C"], "last_updated_epoch": [1_700_000_000, 1_700_000_900,
+                                                                                  1_700_001_800]})
+    as_float = rows.astype({"last_updated_epoch": "float64"})
+    np.testing.assert_array_equal(dedup.key_hashes(rows), dedup.key_hashes(as_float))
+
+
+def test_resent_rows_rejected_across_int_and_float_chunks():
+    first = pd.DataFrame({"location_name": ["A", "B", "C"], "last_updated_epoch": [1, 2, 3], "temp": [1.0, 2.0, 3.0]})
+    # The same rows again, in a chunk where a missing epoch made the column float
+    resent = pd.concat([first, pd.DataFrame({"location_name": ["D"], "last_updated_epoch": [np.nan],
+                                             "temp": [4.0]})], ignore_index=True)
+    assert resent["last_updated_epoch"].dtype == np.float64
+    seen = dedup.KeySet()
+    seen.admit(dedup.key_hashes(first), dedup.raw_fingerprints(first))
+    keep, exact, changed = seen.admit(dedup.key_hashes(resent), dedup.raw_fingerprints(resent))
+    assert keep.tolist() == [False, False, False, True]
+    assert (exact, changed) == (3, 0)
+
+
+def test_incremental_run_rejects_resent_rows_after_a_float_chunk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw, out, state = tmp_path / "raw.csv", tmp_path / "cleaned.csv", tmp_path / "state"
+    df = next(synthetic.frames(3000, seed=1)).drop_duplicates()
+    df.to_csv(raw, index=False)
+    run = dict(out_path=str(out), chunksize=1000, store_path=str(tmp_path / "store"), fmt="csv",
+               state_dir=str(state), rollup_dir=None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        data_preparation.run_incremental(str(raw), **run)
+    before = len(pd.read_csv(out))
+
+    # 50 re-sent rows plus one new row without an epoch: that chunk reads the epoch as float
+    appended = pd.concat([df.sample(50, random_state=0), df.iloc[[0]].assign(
+        location_name="New place", last_updated_epoch=np.nan)], ignore_index=True)
+    appended.to_csv(raw, mode="a", header=False, index=False)
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        data_preparation.run_incremental(str(raw), **run)
+    assert len(pd.read_csv(out)) == before + 1, log.getvalue()
@@ -0,0 +1,28 @@
+import os
+import threading
+
+import pandas as pd
+
+import export
+
+
+def test_concurrent_exports_of_one_selection(tmp_path):
+    df = pd.DataFrame({"country": ["A", "B"] * 5000, "temp": range(10000),
+                       "last_updated": pd.date_range("2024-05-01", periods=10000, freq="min")})
+    errors = []
+
+    def run():
+        try:
+            with export.open_export(df, "CSV (gzip)", "sel", root=str(tmp_path), chunksize=500) as f:
+                assert len(pd.read_csv(f, compression="gzip")) == len(df)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    # One cached copy, no temporary files left behind
+    assert os.listdir(tmp_path) == ["sel.csv.gz"]
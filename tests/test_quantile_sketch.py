@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import quantile_sketch
+
+COUNTRIES = 12
+DAYS = 120
+ROWS = 1_200_000
+CHUNKS = 6
+PROBS = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+
+
+@pytest.fixture(scope="module")
+def observations():
+    # Country x day cells of uneven size and skewed, shifted distributions, with a heavy upper tail
+    rng = np.random.default_rng(7)
+    country = rng.integers(0, COUNTRIES, ROWS)
+    day = np.minimum(rng.exponential(DAYS / 3, ROWS).astype(np.int64), DAYS - 1)
+    value = rng.normal(20 + country, 5 + country / 2, ROWS) + rng.pareto(3.0, ROWS) * 4
+    return pd.DataFrame({"country": country, "period": day, "temp": value})
+
+
+@pytest.fixture(scope="module")
+def sketch(observations):
+    # As the rollup builder does: one partial sketch per chunk, then the parts merged by concatenating and compacting
+    parts = []
+    for rows in np.array_split(np.arange(len(observations)), CHUNKS):
+        chunk = observations.iloc[rows]
+        parts.append(quantile_sketch.partial_sketch(chunk, ["temp"], [chunk["country"], chunk["period"]]))
+    return quantile_sketch.compact(pd.concat(parts, ignore_index=True), ["country", "period"])
+
+
+def rank_of(exact_sorted, value):
+    # Share of exact values at or below ``value``, taking ties half-way
+    lo = np.searchsorted(exact_sorted, value, side="left")
+    hi = np.searchsorted(exact_sorted, value, side="right")
+    return (lo + hi) / 2 / len(exact_sorted)
+
+
+def exact_by_country(observations):
+    return {c: np.sort(g.to_numpy()) for c, g in observations.groupby("country")["temp"]}
+
+
+def test_merged_sketch_is_compacted(observations, sketch):
+    cells = observations.groupby(["country", "period"]).size()
+    kept = sketch.groupby(["country", "period"]).size()
+    assert len(kept) == len(cells) and cells.max() > 10 * quantile_sketch.K
+    # Large cells were compacted to a bounded size; a level-h value stands for 2**h observations, so
+    # compaction keeps every cell's total weight
+    assert kept.max() <= 3 * quantile_sketch.K
+    assert sketch["level"].max() > 0
+    weight = np.ldexp(1.0, sketch["level"].to_numpy(dtype=np.int64))
+    np.testing.assert_array_equal(pd.Series(weight).groupby([sketch["country"], sketch["period"]]).sum().to_numpy(),
+                                  cells.to_numpy())
+    # Cells smaller than K were never compacted and stay exact
+    small = cells[cells < quantile_sketch.K].index
+    assert (sketch.set_index(["country", "period"]).loc[small, "level"] == 0).all()
+
+
+def test_quantiles_of_merged_cells_within_rank_error(observations, sketch):
+    # A selection spanning many day cells per country, merged at query time
+    selected = sketch[sketch["period"].between(10, 99)]
+    q = quantile_sketch.quantiles(selected, PROBS, "country")
+    exact = exact_by_country(observations[observations["period"].between(10, 99)])
+    for row in q.itertuples():
+        assert abs(rank_of(exact[row.country], row.value) - row.q) <= quantile_sketch.RANK_ERROR
+        assert abs(row.value - np.quantile(exact[row.country], row.q)) < 2.0
+
+
+def test_box_and_violin_stats_within_rank_error(observations, sketch):
+    exact = exact_by_country(observations)
+    lo = pd.Series({c: v[0] for c, v in exact.items()})
+    hi = pd.Series({c: v[-1] for c, v in exact.items()})
+    boxes, outliers = quantile_sketch.box_stats(sketch, "country", lo, hi)
+    for box in boxes.itertuples():
+        values = exact[box.country]
+        q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+        for got, p in ((box.q1, 0.25), (box.median, 0.5), (box.q3, 0.75)):
+            assert abs(rank_of(values, got) - p) <= quantile_sketch.RANK_ERROR
+        # Whiskers end at values inside the exact Tukey fences, near the furthest such values
+        low_fence, high_fence = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        exact_low = values[values >= low_fence][0]
+        exact_high = values[values <= high_fence][-1]
+        assert abs(rank_of(values, box.lowerfence) - rank_of(values, exact_low)) <= quantile_sketch.RANK_ERROR
+        assert abs(rank_of(values, box.upperfence) - rank_of(values, exact_high)) <= quantile_sketch.RANK_ERROR
+    # The bounded outlier sample keeps each group's exact extremes
+    per_group = outliers.groupby("country")["value"]
+    assert (per_group.size() <= quantile_sketch.MAX_OUTLIERS).all()
+    np.testing.assert_array_equal(per_group.max().to_numpy(), hi.loc[per_group.max().index].to_numpy())
+
+    # Violin outlines: evenly spaced quantiles with the exact ends
+    probs = np.linspace(0, 1, 101)
+    violin = quantile_sketch.quantiles(sketch, probs, "country", lo, hi)
+    for row in violin.itertuples():
+        values = exact[row.country]
+        if row.q in (0.0, 1.0):
+            assert row.value == (values[0] if row.q == 0.0 else values[-1])
+        else:
+            assert abs(rank_of(values, row.value) - row.q) <= quantile_sketch.RANK_ERROR
@@ -0,0 +1,40 @@
+import os
+
+import pandas as pd
+
+import columnar_store
+
+
+def frame(start, rows):
+    return pd.DataFrame({"country": ["A", "B"] * (rows // 2), "temperature_celsius": range(start, start + rows),
+                         "last_updated": pd.date_range(f"2024-0{start // 100 + 5}-01", periods=rows, freq="h")})
+
+
+def test_appending_run_leaves_previous_version_intact(tmp_path):
+    root = str(tmp_path)
+    old = columnar_store.next_version_path(root)
+    writer = columnar_store.StoreWriter(old)
+    writer.write(frame(0, 100))
+    writer.close()
+
+    # As an incremental prep run does: a linked copy of the served store, then an append and a replaced month
+    new = columnar_store.next_version_path(root)
+    columnar_store.link_store(old, new)
+    writer = columnar_store.StoreWriter(new, append=True)
+    writer.write(frame(100, 100))
+    writer.write(frame(0, 50), replace=True)
+    writer.close()
+
+    assert columnar_store.read_manifest(old)["rows"] == 100
+    assert sorted(columnar_store.read_store(old)["temperature_celsius"]) == list(range(100))
+    assert len(columnar_store.read_store(new)) == 150
+
+    # Eviction keeps the newest versions and any still in use
+    third = columnar_store.next_version_path(root)
+    os.makedirs(third)
+    columnar_store.evict_versions(root, keep=1, keep_paths=[new])
+    assert columnar_store.version_dirs(root) == [new, third]
+    columnar_store.drop_version(new, current=new, root=root)
+    assert os.path.isdir(new)
+    columnar_store.drop_version(new, current=third, root=root)
+    assert columnar_store.version_dirs(root) == [third]
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+import time_series
+
+
+def cells(rows):
+    return pd.DataFrame(rows, columns=["country", "period", "count", "sum"]).assign(
+        period=lambda d: pd.to_datetime(d["period"]))
+
+
+def test_update_matches_a_fresh_engine_when_a_key_disappears():
+    before = cells([("A", "2024-01-01", 10, 100.0), ("A", "2024-02-01", 10, 120.0),
+                    ("B", "2024-01-01", 5, 40.0), ("B", "2024-02-01", 5, 60.0)])
+    # A rebuild that no longer has B's February (and revised A's January)
+    after = cells([("A", "2024-01-01", 12, 130.0), ("A", "2024-02-01", 10, 120.0), ("B", "2024-01-01", 5, 40.0)])
+    engine = time_series.TrendEngine("temp")
+    engine.update(before, 1)
+    engine.update(after, 2)
+    fresh = time_series.TrendEngine("temp")
+    fresh.update(after, 2)
+
+    assert ("B", pd.Timestamp("2024-02-01")) not in engine.cells.index
+    pd.testing.assert_frame_equal(engine.cells, fresh.cells)
+    pd.testing.assert_frame_equal(engine.climatology, fresh.climatology)
+    pd.testing.assert_frame_equal(engine.series(), fresh.series())
+    world = engine.series().set_index(["country", "period"]).loc[("Global", pd.Timestamp("2024-02-01")), "mean"]
+    assert np.isclose(world, 12.0)
+
+
+def test_update_with_no_changes_is_a_no_op():
+    month = cells([("A", "2024-01-01", 10, 100.0)])
+    engine = time_series.TrendEngine("temp")
+    assert engine.update(month, 1) > 0
+    assert engine.update(month, 2) == 0
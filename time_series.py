@@ -0,0 +1,112 @@
+"""Seasonality and trends from the rollup cube's country x month cells.
+
+For one metric, ``TrendEngine`` keeps the monthly count / sum per country
+(plus a ``GLOBAL`` series over all countries) and the climatology totals per
+country and calendar month. Everything it keeps is additive, so ``update``
+takes the current month cells, applies only their difference (new, revised
+and removed cells), and the climatology never needs the older months again. ``series`` derives, for every
+country at once, the monthly mean, the climatology of its calendar month,
+the anomaly against it, and the rolling mean and least-squares slope of the
+anomaly over the last ``window`` months.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+COUNTRY_COL = "country"
+GLOBAL = "Global"
+TREND_MONTHS = 12
+KEYS = [COUNTRY_COL, "period"]
+
+
+def month_cells(cube, metric):
+    """(country, period, count, sum) month cells of ``metric``; day-only cubes are regrouped to months."""
+    cells = cube.get("month")
+    if cells is None:
+        day = cube["day"]
+        cells = day.assign(period=day["period"].dt.to_period("M").dt.start_time)
+    out = cells[KEYS + [f"{metric}__count", f"{metric}__sum"]].set_axis(KEYS + ["count", "sum"], axis=1)
+    return out.groupby(KEYS, as_index=False, observed=True).sum()
+
+
+class TrendEngine:
+    """Monthly climatology, anomalies and rolling trends of one metric, updated month by month."""
+
+    def __init__(self, metric, window=TREND_MONTHS):
+        self.metric = metric
+        self.window = window
+        self.version = None
+        self.cells = pd.DataFrame(columns=["count", "sum"], index=pd.MultiIndex.from_arrays([[], []], names=KEYS),
+                                  dtype="float64")
+        self.climatology = pd.DataFrame(columns=["count", "sum"], dtype="float64",
+                                        index=pd.MultiIndex.from_arrays([[], []], names=[COUNTRY_COL, "month"]))
+        self._series = None
+        self._lock = threading.Lock()
+
+    def update(self, cells, version=None):
+        """Take ``cells`` (as ``month_cells``) as every current country x month cell; keys left out are gone."""
+        with self._lock:
+            new = cells.set_index(KEYS)[["count", "sum"]].astype("float64")
+            new = new[~new.index.duplicated(keep="last")]
+            old = self.cells.drop(GLOBAL, level=COUNTRY_COL, errors="ignore")
+            # Only what changed moves the totals: new months, months a prep run appended to, and months a
+            # rebuild no longer has (dropped by dedup, a date filter or a different input) going to zero
+            keys = old.index.union(new.index)
+            delta = new.reindex(keys, fill_value=0.0).sub(old.reindex(keys, fill_value=0.0))
+            delta = delta[(delta != 0).any(axis=1)]
+            if len(delta):
+                world = delta.groupby(level="period").sum()
+                world.index = pd.MultiIndex.from_product([[GLOBAL], world.index], names=KEYS)
+                delta = pd.concat([delta, world])
+                cells = self.cells.add(delta, fill_value=0.0)
+                self.cells = cells[cells["count"] != 0].sort_index()
+                by_month = delta.groupby([delta.index.get_level_values(COUNTRY_COL).rename(COUNTRY_COL),
+                                          delta.index.get_level_values("period").month.rename("month")]).sum()
+                clim = self.climatology.add(by_month, fill_value=0.0)
+                self.climatology = clim[clim["count"] != 0].sort_index()
+                self._series = None
+            self.version = version
+            return len(delta)
+
+    def series(self):
+        """Per-country monthly frame: mean, climatology, anomaly, rolling mean and trend (per year)."""
+        with self._lock:
+            if self._series is None:
+                self._series = self._derive()
+            return self._series
+
+    def seasonal_cycle(self):
+        """Climatology per country and calendar month."""
+        with self._lock:
+            clim = self.climatology[self.climatology["count"] > 0]
+            return (clim["sum"] / clim["count"]).rename(self.metric).reset_index()
+
+    def _derive(self):
+        cells = self.cells[self.cells["count"] > 0]
+        if cells.empty:
+            return pd.DataFrame(columns=KEYS + ["mean", "climatology", "anomaly", "rolling", "trend"])
+        country = cells.index.get_level_values(COUNTRY_COL)
+        period = cells.index.get_level_values("period")
+        clim = self.climatology.reindex(pd.MultiIndex.from_arrays([country, period.month]))
+        out = pd.DataFrame({COUNTRY_COL: country, "period": period,
+                            "mean": (cells["sum"] / cells["count"]).to_numpy(),
+                            "climatology": (clim["sum"] / clim["count"]).to_numpy()})
+        out["anomaly"] = out["mean"] - out["climatology"]
+        # Rolling least squares of the anomaly on time in years (months may be missing), from
+        # differences of cumulative sums within each country's run of months
+        x = (period.year + (period.month - 1) / 12).to_numpy(dtype="float64")
+        x = x - x.min()
+        y = out["anomaly"].to_numpy()
+        codes = pd.factorize(country)[0]
+        first = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        start = np.repeat(first, np.diff(np.r_[first, len(codes)]))
+        lo = np.maximum(np.arange(len(codes)) - self.window + 1, start)
+        terms = np.column_stack([np.ones_like(x), x, y, x * y, x * x])
+        cum = np.vstack([np.zeros(5), np.cumsum(terms, axis=0)])
+        n, sx, sy, sxy, sxx = (cum[1:] - cum[lo]).T
+        spread = n * sxx - sx ** 2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out["rolling"] = np.where(n >= 3, sy / n, np.nan)
+            out["trend"] = np.where((n >= 3) & (spread > 0), (n * sxy - sx * sy) / spread, np.nan)
+        return out
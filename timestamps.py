@@ -0,0 +1,63 @@
+"""Timestamp handling shared by the prep stage, the store and the dashboard.
+
+``last_updated`` is parsed once, when the prep stage writes the store, into a
+native ``datetime64`` column (a Parquet timestamp); the dashboard sorts,
+filters and plots that column as is. Parsing uses an explicit format (the
+feed's ISO 8601 text by default) instead of per-value inference, and rows
+whose text is missing or unparseable fall back to ``last_updated_epoch``
+(UTC seconds, where the text is local time). Text is only produced again for
+the rows that are shown or exported, by ``format_times``.
+"""
+import numpy as np
+import pandas as pd
+
+TIME_COL = "last_updated"
+EPOCH_COL = "last_updated_epoch"
+# The feed writes "YYYY-MM-DD HH:MM"; ISO8601 also takes the seconds pandas adds on CSV round trips
+FEED_FORMAT = "ISO8601"
+
+
+def from_epoch(epoch):
+    return pd.to_datetime(epoch, unit="s", errors="coerce")
+
+
+def parse(values, fmt=FEED_FORMAT, epoch=None):
+    """Native timestamps from ``values`` parsed with ``fmt``; unparsed rows are filled from ``epoch``."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    out = pd.to_datetime(values, format=fmt, errors="coerce")
+    if epoch is not None:
+        gap = out.isna() & epoch.notna()
+        if gap.any():
+            out = out.mask(gap, from_epoch(epoch.where(gap)))
+    return out
+
+
+def resolve(df):
+    """The timestamp column of ``df`` (``last_updated``, its epoch or a ``date`` column), or None."""
+    if TIME_COL in df.columns:
+        return parse(df[TIME_COL], epoch=df[EPOCH_COL] if EPOCH_COL in df.columns else None)
+    if EPOCH_COL in df.columns:
+        return from_epoch(df[EPOCH_COL])
+    if "date" in df.columns:
+        return parse(df["date"], fmt=None)
+    return None
+
+
+def format_times(values, unit="s"):
+    """"YYYY-MM-DD HH:MM:SS" text (None for NaT) for a datetime column, without per-value strftime."""
+    times = values.to_numpy(dtype="datetime64[ns]")
+    text = np.datetime_as_string(times, unit=unit)
+    if len(text):
+        # ISO "T" separator -> space, in place on the fixed-width characters
+        text.view(np.uint32).reshape(len(text), -1)[:, 10] = ord(" ")
+    out = text.astype(object)
+    out[np.isnat(times)] = None
+    return pd.Series(out, index=values.index, name=values.name)
+
+
+def as_text(df):
+    """``df`` with its (timezone-naive) datetime columns rendered by ``format_times``."""
+    cols = {c: format_times(df[c]) for c in df.columns
+            if pd.api.types.is_datetime64_dtype(df[c].dtype)}
+    return df.assign(**cols) if cols else df
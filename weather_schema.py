@@ -0,0 +1,33 @@
+"""Column detection shared by the prep stage and the dashboard."""
+
+# Dashboard role -> keywords, matched in order against the column names
+COLUMN_KEYWORDS = {
+    "temp": ["temperature", "temp"],
+    "hum": ["humidity"],
+    "wind": ["wind"],
+    "precip": ["precip"],
+    "pressure": ["pressure"],
+    "country": ["country"],
+    "condition": ["condition"],
+    "aqi": ["air_quality", "aqi", "pm2.5", "us-epa"],
+    "uv": ["uv", "uv_index"],
+    "cloud": ["cloud", "cloudcover"],
+}
+METRIC_ROLES = ["temp", "hum", "wind", "precip", "pressure", "aqi", "uv", "cloud"]
+
+
+def find_col(columns, keywords):
+    for key in keywords:
+        for c in columns:
+            if key.lower() in c.lower():
+                return c
+    return None
+
+
+def detect_columns(columns):
+    return {role: find_col(columns, keywords) for role, keywords in COLUMN_KEYWORDS.items()}
+
+
+def metric_columns(columns):
+    cols = detect_columns(columns)
+    return list(dict.fromkeys(cols[r] for r in METRIC_ROLES if cols[r]))